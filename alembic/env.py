@@ -9,18 +9,14 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 # Импортируем наши модели
-from bot.database import Base
+from bot.database import Base, get_database_url
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
 
-# Переопределяем sqlalchemy.url из переменных окружения
-database_url = os.getenv('DATABASE_URL')
-if database_url and database_url.startswith('postgres://'):
-    database_url = database_url.replace('postgres://', 'postgresql://', 1)
-if database_url:
-    config.set_main_option('sqlalchemy.url', database_url)
+# Переопределяем sqlalchemy.url той же базой, что открывает бот
+config.set_main_option('sqlalchemy.url', get_database_url())
 
 # Interpret the config file for Python logging.
 if config.config_file_name is not None:
@@ -44,6 +40,14 @@ def run_migrations_offline() -> None:
 
 def run_migrations_online() -> None:
     """Run migrations in 'online' mode."""
+    # Бот при старте передает свое соединение (database.upgrade_schema)
+    connection = config.attributes.get('connection')
+    if connection is not None:
+        context.configure(connection=connection, target_metadata=target_metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
     connectable = engine_from_config(
         config.get_section(config.config_ini_section, {}),
         prefix="sqlalchemy.",
@@ -0,0 +1,62 @@
+"""movies: payload, has_details, updated_at и уникальный kp_id
+
+Таблица movies стала хранилищем фильмов (bot/film_store.py). Базы,
+созданные до этого, получают новые колонки, а дубликаты kp_id
+удаляются (остается последняя запись) перед уникальным индексом.
+На новой базе create_all уже создал все это - шаги пропускаются.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _columns(table: str) -> set:
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def _indexes(table: str) -> dict:
+    return {index['name']: index for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade() -> None:
+    columns = _columns('movies')
+    if 'payload' not in columns:
+        op.add_column('movies', sa.Column('payload', sa.Text()))
+    if 'has_details' not in columns:
+        op.add_column('movies', sa.Column('has_details', sa.Boolean(), server_default=sa.false()))
+    if 'updated_at' not in columns:
+        op.add_column('movies', sa.Column('updated_at', sa.DateTime()))
+
+    index = _indexes('movies').get('ix_movies_kp_id')
+    if index is not None and index['unique']:
+        return
+
+    op.execute(
+        "DELETE FROM movies WHERE kp_id IS NOT NULL AND id NOT IN "
+        "(SELECT MAX(id) FROM movies WHERE kp_id IS NOT NULL GROUP BY kp_id)"
+    )
+    if index is not None:
+        op.drop_index('ix_movies_kp_id', table_name='movies')
+    op.create_index('ix_movies_kp_id', 'movies', ['kp_id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_movies_kp_id', table_name='movies')
+    op.create_index('ix_movies_kp_id', 'movies', ['kp_id'])
+    with op.batch_alter_table('movies') as batch:
+        batch.drop_column('updated_at')
+        batch.drop_column('has_details')
+        batch.drop_column('payload')
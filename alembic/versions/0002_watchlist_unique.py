@@ -0,0 +1,50 @@
+"""watchlist: уникальная пара (user_id, movie_id) и индекс по дате добавления
+
+DatabaseManager.add_to_watchlist отсекает дубликаты по уникальному
+ограничению uq_watchlist_user_movie. Перед его созданием из старых
+баз удаляются повторы (остается первое добавление).
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    constraints = {constraint['name'] for constraint in inspector.get_unique_constraints('watchlist')}
+    indexes = {index['name'] for index in inspector.get_indexes('watchlist')}
+
+    if 'uq_watchlist_user_movie' not in constraints:
+        op.execute(
+            "DELETE FROM watchlist WHERE id NOT IN "
+            "(SELECT MIN(id) FROM watchlist GROUP BY user_id, movie_id)"
+        )
+        # В SQLite ограничение добавляется только пересозданием таблицы - это делает batch
+        with op.batch_alter_table('watchlist') as batch:
+            batch.create_unique_constraint('uq_watchlist_user_movie', ['user_id', 'movie_id'])
+
+    if 'ix_watchlist_user_added' not in indexes:
+        op.create_index('ix_watchlist_user_added', 'watchlist', ['user_id', 'added_at'])
+    # Выборку по user_id теперь обслуживают два индекса выше
+    if 'ix_watchlist_user_id' in indexes:
+        op.drop_index('ix_watchlist_user_id', table_name='watchlist')
+
+
+def downgrade() -> None:
+    op.create_index('ix_watchlist_user_id', 'watchlist', ['user_id'])
+    op.drop_index('ix_watchlist_user_added', table_name='watchlist')
+    with op.batch_alter_table('watchlist') as batch:
+        batch.drop_constraint('uq_watchlist_user_movie', type_='unique')
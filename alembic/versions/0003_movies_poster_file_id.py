@@ -0,0 +1,32 @@
+"""movies: file_id постера в Telegram
+
+Колонка входит в каждый select(Movie), поэтому без нее на старых базах
+перестают работать и хранилище фильмов, и Watchlist.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('movies')}
+    if 'poster_file_id' not in columns:
+        op.add_column('movies', sa.Column('poster_file_id', sa.String(200)))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('movies') as batch:
+        batch.drop_column('poster_file_id')
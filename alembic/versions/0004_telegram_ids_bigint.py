@@ -0,0 +1,43 @@
+"""users.telegram_id и watchlist.user_id: BigInteger
+
+ID пользователей Telegram бывают больше 2^31 (до 52 бит) и не помещаются
+в integer PostgreSQL. В SQLite INTEGER и так 64-битный - менять нечего.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = (('users', 'telegram_id'), ('watchlist', 'user_id'))
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        return
+
+    inspector = sa.inspect(bind)
+    for table, column in COLUMNS:
+        current = {item['name']: item['type'] for item in inspector.get_columns(table)}[column]
+        if not isinstance(current, sa.BigInteger):
+            op.alter_column(table, column, type_=sa.BigInteger(), existing_type=sa.Integer())
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        return
+
+    for table, column in COLUMNS:
+        op.alter_column(table, column, type_=sa.Integer(), existing_type=sa.BigInteger())
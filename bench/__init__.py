@@ -0,0 +1 @@
+# bench - нагрузочные замеры бота без сети (локальные стенды КиноПоиска и Bot API)
@@ -0,0 +1,173 @@
+# bench/fake_kinopoisk.py - локальный стенд API kinopoiskapiunofficial.tech для нагрузочных замеров
+
+import re
+import json
+import random
+import asyncio
+import logging
+from collections import Counter
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+GENRES = {1: "драма", 2: "комедия", 3: "боевик", 4: "триллер", 6: "фантастика",
+          7: "ужасы", 9: "детектив", 12: "приключения", 17: "мелодрама"}
+
+WORDS = ["ночь", "город", "тайна", "любовь", "война", "дорога", "море", "звезда",
+         "время", "тень", "огонь", "сердце", "мир", "песня", "игра", "остров"]
+
+def make_film(film_id: int) -> Dict:
+    """Синтетический фильм: одинаковый для одного ID при любом запуске"""
+    rnd = random.Random(film_id)
+    genre_ids = rnd.sample(sorted(GENRES), 2)
+    name = ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 3))).capitalize()
+    return {
+        "kinopoiskId": film_id,
+        "filmId": film_id,
+        "nameRu": f"{name} {film_id}",
+        "nameEn": f"Film {film_id}",
+        "year": 1960 + film_id % 64,
+        "ratingKinopoisk": round(max(10 - film_id * 0.0015, 5.0), 1),
+        "rating": str(round(max(10 - film_id * 0.0015, 5.0), 1)),
+        "description": f"Описание фильма {film_id}. " * 5,
+        "posterUrlPreview": f"https://posters.example/{film_id}.jpg",
+        "genres": [{"genre": GENRES[genre_id]} for genre_id in genre_ids],
+        "_genre_ids": genre_ids,
+    }
+
+class FakeKinopoisk:
+    """HTTP/1.1 сервер с keep-alive на asyncio.start_server.
+
+    latency - задержка ответа (секунды, с джиттером ±jitter), error_rate и
+    rate_429 - доли ответов 500 и 429. Все запросы считаются по эндпоинтам.
+    """
+
+    def __init__(self, films_count: int = 5000, latency: float = 0.05, jitter: float = 0.5,
+                 error_rate: float = 0.0, rate_429: float = 0.0, seed: int = 1):
+        self.films = {film_id: make_film(film_id) for film_id in range(1, films_count + 1)}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.server: Optional[asyncio.base_events.Server] = None
+        self.port = 0
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        self.server = await asyncio.start_server(self._serve, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return f"http://{host}:{self.port}/api"
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                # Заголовки не нужны, тело у GET-запросов отсутствует
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+
+                _, target, _ = request_line.decode('latin-1').split(' ', 2)
+                status, payload = await self._handle(target)
+
+                body = json.dumps(payload, ensure_ascii=False).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                    f"Connection: keep-alive\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, target: str) -> Tuple[int, Dict]:
+        url = urlsplit(target)
+        path = url.path[4:] if url.path.startswith('/api') else url.path
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+        endpoint = self._endpoint(path)
+        self.calls[endpoint] += 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency * self.random.uniform(1 - self.jitter, 1 + self.jitter))
+
+        roll = self.random.random()
+        if roll < self.rate_429:
+            return 429, {"message": "Too many requests"}
+        if roll < self.rate_429 + self.error_rate:
+            return 500, {"message": "Internal error"}
+
+        return self._respond(endpoint, path, params)
+
+    @staticmethod
+    def _endpoint(path: str) -> str:
+        if path.startswith('/v2.1/films/search-by-keyword'):
+            return 'search'
+        if path == '/v2.2/films/top':
+            return 'top'
+        if path == '/v2.2/films':
+            return 'filters'
+        if path.endswith('/similars'):
+            return 'similars'
+        if re.fullmatch(r'/v2\.2/films/\d+', path):
+            return 'details'
+        if path.startswith('/v1/api_keys/'):
+            return 'api_keys'
+        return 'unknown'
+
+    def _brief(self, film: Dict) -> Dict:
+        return {key: value for key, value in film.items()
+                if key not in ('description', 'kinopoiskId', '_genre_ids')}
+
+    def _respond(self, endpoint: str, path: str, params: Dict) -> Tuple[int, Dict]:
+        page = int(params.get('page', 1))
+
+        if endpoint == 'details':
+            film = self.films.get(int(path.rsplit('/', 1)[1]))
+            if not film:
+                return 404, {"message": "Not found"}
+            return 200, {key: value for key, value in film.items() if key not in ('filmId', '_genre_ids')}
+
+        if endpoint == 'search':
+            keyword = params.get('keyword', '').lower()
+            found = [film for film in self.films.values() if keyword[:4] in film['nameRu'].lower()]
+            chunk = found[(page - 1) * 20:page * 20]
+            return 200, {"keyword": keyword, "pagesCount": max((len(found) + 19) // 20, 1),
+                         "searchFilmsCountResult": len(found), "films": [self._brief(f) for f in chunk]}
+
+        if endpoint == 'top':
+            chunk = [self.films[i] for i in range((page - 1) * 20 + 1, page * 20 + 1) if i in self.films and i <= 250]
+            return 200, {"pagesCount": 13, "films": [self._brief(f) for f in chunk]}
+
+        if endpoint == 'filters':
+            films = list(self.films.values())
+            if 'genres' in params:
+                films = [film for film in films if int(params['genres']) in film['_genre_ids']]
+            if 'ratingFrom' in params:
+                films = [film for film in films if film['ratingKinopoisk'] >= float(params['ratingFrom'])]
+            chunk = films[(page - 1) * 20:page * 20]
+            return 200, {"total": len(films), "totalPages": (len(films) + 19) // 20,
+                         "items": [self._brief(f) for f in chunk]}
+
+        if endpoint == 'similars':
+            film_id = int(path.split('/')[3])
+            items = [self._brief(self.films[i]) for i in range(film_id + 1, film_id + 6) if i in self.films]
+            return 200, {"total": len(items), "items": items}
+
+        if endpoint == 'api_keys':
+            return 200, {"dailyQuota": {"value": 1000000, "used": 0}}
+
+        return 404, {"message": "Not found"}
@@ -0,0 +1,81 @@
+# bench/fake_telegram.py - Bot API без сети: отвечает на вызовы бота локально
+
+import json
+import time
+import asyncio
+import itertools
+from collections import Counter
+from typing import Optional, Tuple
+
+from telegram.request import BaseRequest, RequestData
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "MovieMate", "username": "moviemate_bench_bot"}
+
+class FakeTelegramRequest(BaseRequest):
+    """Подставляется в Application.builder().request(...): каждый метод Bot API
+    отвечает правдоподобным результатом через latency секунд и считается.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _message(self, params: dict, **extra) -> dict:
+        chat_id = params.get("chat_id", 0)
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id) if str(chat_id).lstrip('-').isdigit() else 0, "type": "private"},
+            "from": BOT_USER,
+        }
+        message.update(extra)
+        return message
+
+    def _photo(self) -> list:
+        file_id = f"photo{next(self._file_ids)}"
+        return [{"file_id": file_id, "file_unique_id": file_id, "width": 300, "height": 450}]
+
+    def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return BOT_USER
+        if method == "sendMessage":
+            return self._message(params, text=params.get("text", ""))
+        if method == "sendPhoto":
+            return self._message(params, photo=self._photo(), caption=params.get("caption"))
+        if method == "sendMediaGroup":
+            media = params.get("media") or []
+            if isinstance(media, str):
+                media = json.loads(media)
+            return [self._message(params, photo=self._photo(), media_group_id="1") for _ in media]
+        if method in ("editMessageText", "editMessageReplyMarkup"):
+            return self._message(params, text=params.get("text", ""))
+        # answerCallbackQuery, answerInlineQuery, setMyCommands, deleteWebhook, ...
+        return True
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        from bot.tracing import tracer
+
+        bot_method = url.rsplit('/', 1)[-1]
+        self.calls[bot_method] += 1
+        # Как TracingRequest в боте: вызов Bot API - спан в трассировке обновления
+        with tracer.span(f"telegram.{bot_method}"):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+
+        params = request_data.parameters if request_data else {}
+        body = {"ok": True, "result": self._result(bot_method, params)}
+        return 200, json.dumps(body).encode()
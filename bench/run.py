@@ -0,0 +1,206 @@
+# bench/run.py - нагрузочный прогон обработчиков бота без сети
+#
+# Запуск из корня проекта:
+#   python -m bench.run --updates 2000 --users 100 --latency 0.05
+#
+# Поднимает локальный стенд API КиноПоиска, подменяет Bot API и прогоняет
+# синтетический поток обновлений через настоящие handlers (как в main.py).
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон MovieMate Bot без сети")
+    parser.add_argument('--updates', type=int, default=1000, help="сколько обновлений отправить")
+    parser.add_argument('--users', type=int, default=50, help="сколько разных пользователей")
+    parser.add_argument('--rate', type=float, default=0, help="обновлений в секунду (0 - все сразу: задержка включает ожидание в очереди)")
+    parser.add_argument('--concurrency', type=int, default=16, help="UPDATE_CONCURRENCY")
+    parser.add_argument('--latency', type=float, default=0.05, help="задержка ответа API КиноПоиска, с")
+    parser.add_argument('--telegram-latency', type=float, default=0.01, help="задержка ответа Bot API, с")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument('--warm-catalogue', action='store_true', help="собрать каталог до прогона")
+    parser.add_argument('--trace', default='', help="записать трассировку (Chrome Trace JSON) в файл")
+    parser.add_argument('--block-threshold', type=float, default=0.1, help="порог сторожа event loop, с")
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args(argv)
+
+# Сценарии и их доли в потоке обновлений
+SCENARIOS = [
+    ("search", 30),
+    ("top", 15),
+    ("random", 15),
+    ("genre", 15),
+    ("watch", 10),
+    ("inline", 10),
+    ("start", 5),
+]
+
+SEARCH_QUERIES = ["ночь", "город", "тайна", "любовь", "война", "дорога", "море", "звезда", "время", "тень"]
+GENRE_BUTTONS = ["🎭 Драма", "😂 Комедия", "🔫 Боевик", "👻 Ужасы", "🚀 Фантастика", "🔍 Детектив"]
+
+def make_update_dict(update_id: int, user_id: int, scenario: str, rnd: random.Random) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+    chat = {"id": user_id, "type": "private"}
+
+    def message(text: str) -> dict:
+        data = {"message_id": update_id, "date": int(time.time()), "chat": chat, "from": user, "text": text}
+        if text.startswith('/'):
+            data["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": update_id, "message": data}
+
+    if scenario == "search":
+        return message(rnd.choice(SEARCH_QUERIES))
+    if scenario == "top":
+        return message("/top")
+    if scenario == "random":
+        return message("/random")
+    if scenario == "genre":
+        return message(rnd.choice(GENRE_BUTTONS))
+    if scenario == "start":
+        return message("/start")
+    if scenario == "watch":
+        bot_message = {"message_id": 1, "date": int(time.time()), "chat": chat,
+                       "from": {"id": 1, "is_bot": True, "first_name": "MovieMate"}, "text": "👇"}
+        return {"update_id": update_id, "callback_query": {
+            "id": str(update_id), "from": user, "chat_instance": str(user_id),
+            "data": f"watch_{rnd.randint(1, 250)}", "message": bot_message,
+        }}
+    # inline
+    query = rnd.choice(SEARCH_QUERIES)[:rnd.randint(2, 4)]
+    return {"update_id": update_id, "inline_query": {
+        "id": str(update_id), "from": user, "query": query, "offset": "",
+    }}
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)] if ordered else 0.0
+
+async def run(args) -> dict:
+    from bench.fake_kinopoisk import FakeKinopoisk
+    from bench.fake_telegram import FakeTelegramRequest
+
+    fake_api = FakeKinopoisk(latency=args.latency, error_rate=args.error_rate,
+                             rate_429=args.rate_429, seed=args.seed)
+    base_url = await fake_api.start()
+
+    # Настройки бота - до импорта модулей bot (они читают окружение при импорте)
+    db_dir = tempfile.mkdtemp(prefix='moviemate-bench-')
+    os.environ.update({
+        'KINOPOISK_API_KEY': 'bench',
+        'KINOPOISK_BASE_URL': base_url,
+        'KINOPOISK_RPS': '1000',
+        'KINOPOISK_DAILY_QUOTA': '10000000',
+        'DATABASE_URL': f"sqlite:///{os.path.join(db_dir, 'bench.db')}",
+    })
+
+    from telegram import Update
+    from telegram.ext import Application
+    from bot import database
+    from bot.catalogue import refresh_job
+    from bot.kinopoisk_client import kinopoisk_client
+    from bot.tracing import tracer, watchdog
+    from bot.update_processor import PerChatUpdateProcessor
+    from main import register_handlers
+
+    telegram = FakeTelegramRequest(latency=args.telegram_latency)
+    application = (
+        Application.builder()
+        .token('1:bench')
+        .request(telegram)
+        .get_updates_request(FakeTelegramRequest())
+        .concurrent_updates(PerChatUpdateProcessor(args.concurrency))
+        .build()
+    )
+    register_handlers(application)
+
+    await database.init_async_db()
+    await application.initialize()
+
+    if args.warm_catalogue:
+        await refresh_job(None)
+    warm_api_calls, warm_telegram_calls = fake_api.total_calls, telegram.total_calls
+
+    tracer.clear()
+    watchdog.threshold = args.block_threshold
+    watchdog.start()
+
+    rnd = random.Random(args.seed)
+    names = [name for name, _ in SCENARIOS]
+    weights = [weight for _, weight in SCENARIOS]
+    latencies = {name: [] for name in names}
+    processor = application.update_processor
+
+    async def handle(update, scenario: str, arrived: float):
+        await processor.process_update(update, application.process_update(update))
+        latencies[scenario].append(time.perf_counter() - arrived)
+
+    started = time.perf_counter()
+    tasks = []
+    for update_id in range(1, args.updates + 1):
+        scenario = rnd.choices(names, weights)[0]
+        user_id = 1000 + rnd.randrange(args.users)
+        update = Update.de_json(make_update_dict(update_id, user_id, scenario, rnd), application.bot)
+        tasks.append(asyncio.create_task(handle(update, scenario, time.perf_counter())))
+        if args.rate:
+            await asyncio.sleep(1 / args.rate)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    # Inline-ответы из API уходят отдельными задачами - даем им завершиться
+    await asyncio.sleep(1)
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    report = {
+        "updates": args.updates,
+        "elapsed_s": round(elapsed, 2),
+        "updates_per_s": round(args.updates / elapsed, 1),
+        "p50_ms": round(percentile(all_latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(all_latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(all_latencies, 0.99) * 1000, 1),
+        "upstream_calls_per_update": round((fake_api.total_calls - warm_api_calls) / args.updates, 3),
+        "telegram_calls_per_update": round((telegram.total_calls - warm_telegram_calls) / args.updates, 3),
+        "upstream_calls": dict(fake_api.calls),
+        "telegram_calls": dict(telegram.calls),
+        "by_scenario_p95_ms": {
+            name: round(percentile(values, 0.95) * 1000, 1) for name, values in latencies.items() if values
+        },
+        "cache": kinopoisk_client.cache_stats(),
+        "loop_blocks": watchdog.blocks,
+    }
+
+    watchdog.stop()
+    if args.trace:
+        report["trace_events"] = tracer.dump(args.trace)
+
+    await application.shutdown()
+    await kinopoisk_client.close()
+    await database.close_async_db()
+    await fake_api.stop()
+    return report
+
+def print_report(report: dict):
+    print("=" * 50)
+    for key in ("updates", "elapsed_s", "updates_per_s", "p50_ms", "p95_ms", "p99_ms",
+                "upstream_calls_per_update", "telegram_calls_per_update", "loop_blocks"):
+        print(f"{key:>28}: {report[key]}")
+    print(f"{'p95 по сценариям, мс':>28}: {report['by_scenario_p95_ms']}")
+    print(f"{'запросы к API':>28}: {report['upstream_calls']}")
+    print(f"{'вызовы Bot API':>28}: {report['telegram_calls']}")
+    if "trace_events" in report:
+        print(f"{'трассировка, событий':>28}: {report['trace_events']}")
+    print("=" * 50)
+
+def main(argv=None):
+    args = parse_args(argv)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from bot.logs import setup_logging
+    setup_logging(level='WARNING', fmt='text')
+    print_report(asyncio.run(run(args)))
+
+if __name__ == '__main__':
+    main()
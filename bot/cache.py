@@ -0,0 +1,130 @@
+# bot/cache.py - LRU-кэш с TTL и объединение одинаковых запросов к API
+
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    """Кэш с ограничением по числу записей (LRU) и временем жизни записей.
+
+    Записи разделены по пространствам имен (например, эндпоинтам API),
+    статистика попаданий/промахов ведется для каждого пространства отдельно.
+    """
+
+    def __init__(self, max_size: int = 2000):
+        self.max_size = max_size
+        self._data: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _counter(self, namespace: str) -> Dict[str, int]:
+        if namespace not in self._stats:
+            self._stats[namespace] = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "stale": 0}
+        return self._stats[namespace]
+
+    def get(self, namespace: str, key: Hashable) -> Optional[Any]:
+        """Получить значение или None, если его нет или оно устарело"""
+        counter = self._counter(namespace)
+        full_key = (namespace, key)
+        entry = self._data.get(full_key)
+
+        if entry is None:
+            counter["misses"] += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            # Устаревшая запись остается до вытеснения: она пригодится, если API недоступен
+            counter["expired"] += 1
+            counter["misses"] += 1
+            return None
+
+        # Свежая запись становится самой "молодой" для LRU
+        self._data.move_to_end(full_key)
+        counter["hits"] += 1
+        return value
+
+    def get_stale(self, namespace: str, key: Hashable) -> Optional[Any]:
+        """Получить значение даже с истекшим TTL (запасной ответ, когда API недоступен).
+        Отданный пользователю запасной ответ учитывается через count_stale()
+        """
+        entry = self._data.get((namespace, key))
+        if entry is None:
+            return None
+        return entry[1]
+
+    def count_stale(self, namespace: str):
+        """Учесть ответ устаревшим значением вместо запроса к API"""
+        self._counter(namespace)["stale"] += 1
+
+    def set(self, namespace: str, key: Hashable, value: Any, ttl: float):
+        """Сохранить значение на ttl секунд"""
+        full_key = (namespace, key)
+        self._data[full_key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(full_key)
+
+        while len(self._data) > self.max_size:
+            (evicted_namespace, _), _ = self._data.popitem(last=False)
+            self._counter(evicted_namespace)["evictions"] += 1
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика кэша: общая и по пространствам имен"""
+        total = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "stale": 0}
+        for counter in self._stats.values():
+            for name, value in counter.items():
+                total[name] += value
+
+        requests_count = total["hits"] + total["misses"]
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hit_ratio": round(total["hits"] / requests_count, 3) if requests_count else 0.0,
+            **total,
+            "by_namespace": {name: dict(counter) for name, counter in self._stats.items()},
+        }
+
+class SingleFlight:
+    """Объединение одинаковых одновременных вызовов (single-flight).
+
+    Пока вызов с ключом key выполняется, остальные вызовы с тем же ключом
+    не запускают свой, а ждут и получают его результат (или исключение).
+    Вызов выполняется отдельной задачей, поэтому отмена одного из
+    ожидающих не прерывает его для остальных.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.started = 0
+        self.shared = 0
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            self.started += 1
+
+            def forget(done_task, key=key):
+                if self._calls.get(key) is done_task:
+                    del self._calls[key]
+
+            task.add_done_callback(forget)
+        else:
+            self.shared += 1
+
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {"started": self.started, "shared": self.shared, "in_flight": len(self._calls)}
@@ -0,0 +1,311 @@
+# bot/catalogue.py - каталог фильмов в памяти (топ-250, случайный выбор, жанры) с фоновым обновлением
+
+import os
+import math
+import random
+import asyncio
+import logging
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from .films import Film, iter_with_details, to_films
+from .kinopoisk_client import kinopoisk_client
+from .rate_limit import background_priority
+
+logger = logging.getLogger(__name__)
+
+# В топе 250 фильмов, по 20 на странице
+TOP_PAGES = 13
+
+# Как часто обновлять снимок (часы)
+CATALOGUE_REFRESH_HOURS = float(os.getenv('CATALOGUE_REFRESH_HOURS', '24'))
+
+# Сколько страниц /v2.2/films (по рейтингу) добавлять в индекс случайного выбора
+RANDOM_HARVEST_PAGES = int(os.getenv('RANDOM_HARVEST_PAGES', '5'))
+
+# Сколько страниц каждой сортировки собирать в индекс жанра
+GENRE_HARVEST_PAGES = int(os.getenv('GENRE_HARVEST_PAGES', '2'))
+
+# Сортировки /v2.2/films, которые собираются в индекс жанра
+GENRE_ORDERS = ("RATING", "NUM_VOTE", "YEAR")
+
+# Карта жанров для поиска - АКТУАЛЬНЫЕ ID
+GENRE_MAP = {
+    "драма": 1,
+    "комедия": 2,
+    "боевик": 3,
+    "триллер": 4,
+    "фантастика": 6,
+    "ужасы": 7,
+    "детектив": 9,
+    "мелодрама": 17,
+    "приключения": 12,
+}
+
+class TopCatalogue:
+    """Снимок топ-250: все страницы топа вместе с деталями фильмов.
+
+    Обработчики берут фильмы отсюда без обращений к API; снимок
+    целиком подменяется после успешного обновления.
+    """
+
+    def __init__(self, client, concurrency: int = 5):
+        self.client = client
+        self.concurrency = concurrency
+        self.films: List[Film] = []
+        self.updated_at: Optional[datetime] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_ready(self) -> bool:
+        return bool(self.films)
+
+    async def refresh(self) -> int:
+        """Загрузить все страницы топа и детали фильмов"""
+        if not self.client or not self.client.is_active:
+            return 0
+
+        # Параллельные вызовы задачи не должны обновлять снимок дважды
+        if self._lock.locked():
+            return len(self.films)
+
+        async with self._lock:
+            results = await asyncio.gather(
+                *(self.client.get_top_films(page=page) for page in range(1, TOP_PAGES + 1))
+            )
+
+            films = []
+            seen_ids = set()
+            for result in results:
+                for film in to_films(result.get('films', [])):
+                    if film.id not in seen_ids:
+                        seen_ids.add(film.id)
+                        films.append(film)
+
+            if not films:
+                logger.warning("⚠️ Не удалось обновить снимок топ-250, оставляю прежний")
+                return len(self.films)
+
+            # Детали тянутся в основном из кэша и таблицы movies
+            detailed = [film async for film in iter_with_details(self.client, films, self.concurrency)]
+            detailed.sort(key=lambda film: film.rating or 0, reverse=True)
+
+            self.films = detailed
+            self.updated_at = datetime.now()
+            logger.info(f"✅ Снимок топ-250 обновлен: {len(detailed)} фильмов")
+            return len(detailed)
+
+    def sample(self, count: int) -> List[Film]:
+        """Случайные фильмы из снимка"""
+        films = self.films
+        return random.sample(films, min(count, len(films)))
+
+    def random_film(self, min_rating: float = 0) -> Optional[Film]:
+        """Случайный фильм с рейтингом не ниже min_rating"""
+        films = self.films
+        if not films:
+            return None
+
+        high_rated = [film for film in films if (film.rating or 0) >= min_rating]
+        return random.choice(high_rated or films)
+
+class RandomIndex:
+    """Индекс для /random: фильмы, отсортированные по рейтингу, с порогами по 0.1.
+
+    Для любого min_rating число кандидатов берется из заранее посчитанной
+    таблицы, а сам выбор - взвешенная выборка с отбраковкой (ожидаемо O(1)):
+    фильмы с рейтингом выше выпадают чаще. Недавно
+    показанные пользователю фильмы по возможности не повторяются.
+    """
+
+    # Шаг порогов рейтинга: 10 корзин на единицу рейтинга (0.0 ... 10.0)
+    BUCKETS_PER_POINT = 10
+    # Сколько последних фильмов пользователя не повторять
+    RECENT_PER_USER = 20
+    # Для скольких пользователей помнить историю
+    MAX_USERS = 10000
+
+    def __init__(self, client, harvest_pages: int = RANDOM_HARVEST_PAGES):
+        self.client = client
+        self.harvest_pages = harvest_pages
+        self._films: List[Film] = []
+        self._ratings: List[float] = []
+        self._weights: List[float] = []
+        self._counts: List[int] = [0] * (10 * self.BUCKETS_PER_POINT + 1)
+        self._recent: "OrderedDict[int, deque]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._films)
+
+    @staticmethod
+    def _weight(rating: float) -> float:
+        # +1 к рейтингу - вес x2: 9.0 выпадает вдвое чаще 8.0
+        return 2 ** (rating - 10)
+
+    def rebuild(self, films: List[Film]):
+        """Пересобрать индекс из списка фильмов"""
+        rated = {}
+        for film in to_films(films):
+            rating = film.rating
+            if rating is not None and 0 < rating <= 10:
+                rated[film.id] = (rating, film)
+
+        ordered = sorted(rated.values(), key=lambda item: item[0], reverse=True)
+        ratings_asc = [rating for rating, _ in reversed(ordered)]
+
+        # counts[b] - сколько фильмов с рейтингом >= b / BUCKETS_PER_POINT
+        counts = [
+            len(ratings_asc) - bisect_left(ratings_asc, bucket / self.BUCKETS_PER_POINT - 1e-9)
+            for bucket in range(len(self._counts))
+        ]
+
+        self._films = [film for _, film in ordered]
+        self._ratings = [rating for rating, _ in ordered]
+        self._weights = [self._weight(rating) for rating, _ in ordered]
+        self._counts = counts
+        logger.info(f"✅ Индекс случайного выбора: {len(self._films)} фильмов")
+
+    async def refresh(self, base_films: Optional[List[Film]] = None):
+        """Собрать кандидатов: снимок топа + страницы фильтра по рейтингу"""
+        films = list(base_films or [])
+
+        if self.client and self.client.is_active and self.harvest_pages:
+            results = await asyncio.gather(
+                *(self.client.get_films_by_filters(rating_from=7, rating_to=10, page=page)
+                  for page in range(1, self.harvest_pages + 1))
+            )
+            for result in results:
+                films.extend(result.get('items', []))
+
+        if films:
+            self.rebuild(films)
+
+    def pick(self, min_rating: float = 0, user_id: Optional[int] = None) -> Optional[Film]:
+        """Случайный фильм с рейтингом не ниже min_rating без обращения к API"""
+        # Корзина с порогом не выше min_rating; фильмы ниже порога внутри нее отбраковываются
+        bucket = min(max(math.floor(min_rating * self.BUCKETS_PER_POINT + 1e-9), 0), len(self._counts) - 1)
+        count = self._counts[bucket]
+        if not count:
+            return None
+
+        films, ratings, weights = self._films, self._ratings, self._weights
+        max_weight = weights[0]
+        recent = self._recent.get(user_id) if user_id is not None else None
+
+        film = None
+        for _ in range(32):
+            index = random.randrange(count)
+            if ratings[index] < min_rating or random.random() * max_weight > weights[index]:
+                continue
+            film = films[index]
+            if recent is None or film.id not in recent:
+                break
+
+        if film is None:
+            # Редкий случай: выборка не попала ни разу - выбираем среди точно подходящих
+            suitable = [index for index in range(count) if ratings[index] >= min_rating]
+            if not suitable:
+                return None
+            film = films[random.choice(suitable)]
+
+        if user_id is not None:
+            self._remember(user_id, film.id)
+        return film
+
+    def _remember(self, user_id: int, film_id: int):
+        recent = self._recent.get(user_id)
+        if recent is None:
+            recent = self._recent[user_id] = deque(maxlen=self.RECENT_PER_USER)
+            if len(self._recent) > self.MAX_USERS:
+                self._recent.popitem(last=False)
+        else:
+            self._recent.move_to_end(user_id)
+        recent.append(film_id)
+
+class GenreIndex:
+    """Фильмы по жанрам в памяти: для каждого жанра - списки по сортировкам
+    RATING / NUM_VOTE / YEAR, без дубликатов.
+    """
+
+    def __init__(self, client, genre_ids, pages: int = GENRE_HARVEST_PAGES,
+                 orders=GENRE_ORDERS, concurrency: int = 5):
+        self.client = client
+        self.genre_ids = sorted(set(genre_ids))
+        self.pages = pages
+        self.orders = tuple(orders)
+        self.concurrency = concurrency
+        self._films: Dict[int, Dict[str, List[Film]]] = {}
+
+    def has(self, genre_id: int) -> bool:
+        return bool(self._films.get(genre_id))
+
+    async def refresh_genre(self, genre_id: int, semaphore: Optional[asyncio.Semaphore] = None) -> int:
+        """Собрать все сортировки одного жанра"""
+        if not self.client or not self.client.is_active:
+            return 0
+
+        semaphore = semaphore or asyncio.Semaphore(self.concurrency)
+
+        async def fetch(order: str, page: int) -> List[Film]:
+            async with semaphore:
+                result = await self.client.get_films_by_filters(genre_id=genre_id, page=page, order=order)
+            return to_films(result.get('items', []))
+
+        by_order = {}
+        for order in self.orders:
+            pages = await asyncio.gather(*(fetch(order, page) for page in range(1, self.pages + 1)))
+
+            films = []
+            seen_ids = set()
+            for items in pages:
+                for film in items:
+                    if film.id not in seen_ids:
+                        seen_ids.add(film.id)
+                        films.append(film)
+            if films:
+                by_order[order] = films
+
+        if by_order:
+            self._films[genre_id] = by_order
+        return sum(len(films) for films in by_order.values())
+
+    async def refresh(self):
+        """Обновить индекс по всем жанрам"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        counts = await asyncio.gather(*(self.refresh_genre(genre_id, semaphore) for genre_id in self.genre_ids))
+        logger.info(f"✅ Индекс жанров обновлен: {dict(zip(self.genre_ids, counts))}")
+
+    def films(self, genre_id: int, order: Optional[str] = None) -> List[Film]:
+        """Фильмы жанра в порядке сортировки order, без order - все сортировки вместе"""
+        by_order = self._films.get(genre_id, {})
+        if order:
+            return list(by_order.get(order, []))
+
+        films = []
+        seen_ids = set()
+        for order_films in by_order.values():
+            for film in order_films:
+                if film.id not in seen_ids:
+                    seen_ids.add(film.id)
+                    films.append(film)
+        return films
+
+    def sample(self, genre_id: int, count: int, order: Optional[str] = None) -> List[Film]:
+        """Случайные фильмы жанра"""
+        films = self.films(genre_id, order)
+        return random.sample(films, min(count, len(films)))
+
+# Глобальные экземпляры
+top_catalogue = TopCatalogue(kinopoisk_client)
+random_index = RandomIndex(kinopoisk_client)
+genre_index = GenreIndex(kinopoisk_client, GENRE_MAP.values())
+
+async def refresh_job(context):
+    """Задача JobQueue: обновление снимков каталога"""
+    # Фоновые запросы уступают пользовательским и не тратят резерв квоты
+    with background_priority():
+        await top_catalogue.refresh()
+        await random_index.refresh(top_catalogue.films)
+        await genre_index.refresh()
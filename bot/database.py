@@ -1,23 +1,38 @@
 # bot/database.py
 
 import os
+import asyncio
 import logging
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, Float
+from contextlib import asynccontextmanager
+from sqlalchemy import create_engine, event, Column, Integer, BigInteger, String, Text, DateTime, Boolean, Float, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 Base = declarative_base()
 
+# Миграции Alembic (alembic/versions) применяются при каждом запуске
+ALEMBIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'alembic')
+
 # Глобальные переменные для сессии БД
 engine = None
 SessionLocal = None
 
+# SQLite: сколько миллисекунд запись ждет блокировку другого соединения
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000'))
+
+# Асинхронный движок для обработчиков бота
+async_engine = None
+AsyncSessionLocal = None
+_async_init_lock = asyncio.Lock()
+
 class User(Base):
     __tablename__ = 'users'
     id = Column(Integer, primary_key=True)
-    telegram_id = Column(Integer, unique=True, index=True)
+    telegram_id = Column(BigInteger, unique=True, index=True)  # ID Telegram бывают больше 2^31
     username = Column(String(100))
     first_name = Column(String(100))
     last_name = Column(String(100))
@@ -27,38 +42,83 @@ class User(Base):
 class Movie(Base):
     __tablename__ = 'movies'
     id = Column(Integer, primary_key=True)
-    kp_id = Column(Integer, index=True)  # Переименовано из tmdb_id
+    kp_id = Column(Integer, unique=True, index=True)  # Переименовано из tmdb_id
     title = Column(String(500))
     original_title = Column(String(500))
     release_date = Column(String(20))
     overview = Column(Text)
     poster_url = Column(String(500))
+    poster_file_id = Column(String(200))  # file_id постера, уже загруженного в Telegram
     media_type = Column(String(20))  # 'movie' или 'tv'
     genres = Column(Text)
     vote_average = Column(Float)
+    payload = Column(Text)  # Исходный JSON ответа API
+    has_details = Column(Boolean, default=False)  # payload получен из /v2.2/films/{id}
     created_at = Column(DateTime, default=datetime.now)  # Исправлено
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
 class Watchlist(Base):
     __tablename__ = 'watchlist'
+    __table_args__ = (
+        # Один фильм у пользователя только один раз; индекс обслуживает и удаление
+        UniqueConstraint('user_id', 'movie_id', name='uq_watchlist_user_movie'),
+        # Выборка списка пользователя сразу в порядке добавления
+        Index('ix_watchlist_user_added', 'user_id', 'added_at'),
+    )
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, index=True)
-    movie_id = Column(Integer)
+    user_id = Column(BigInteger)  # Telegram ID пользователя
+    movie_id = Column(Integer)  # ID фильма КиноПоиска (movies.kp_id)
     added_at = Column(DateTime, default=datetime.now)  # Исправлено
     watched = Column(Boolean, default=False)
 
+class BotState(Base):
+    __tablename__ = 'bot_state'
+    kind = Column(String(10), primary_key=True)  # 'user', 'chat' или 'bot'
+    key = Column(BigInteger, primary_key=True, autoincrement=False)  # Telegram ID пользователя/чата, 0 для bot_data
+    data = Column(Text)  # context.user_data / chat_data / bot_data в JSON
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+def _set_sqlite_pragmas(engine):
+    """WAL: чтения не ждут записи; busy_timeout: запись ждет чужую
+    блокировку, а не падает сразу с "database is locked"
+    """
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}')
+        cursor.close()
+
+def upgrade_schema(connection):
+    """Создать недостающие таблицы и довести существующие до моделей.
+
+    create_all не меняет уже созданные таблицы: новые колонки и индексы
+    в базах с прошлых версий добавляют миграции Alembic в том же соединении.
+    """
+    from alembic import command
+    from alembic.config import Config
+
+    Base.metadata.create_all(connection)
+
+    config = Config()
+    config.set_main_option('script_location', ALEMBIC_DIR)
+    config.attributes['connection'] = connection
+    command.upgrade(config, 'head')
+
 def init_db():
-    """Инициализация базы данных"""
+    """Инициализация базы данных из скрипта init_db.py: таблицы и миграции.
+    Бот работает с БД только через async_session_scope()
+    """
     global engine, SessionLocal
 
-    database_url = os.getenv('DATABASE_URL', 'sqlite:///movies.db')
-
-    # Исправляем URL для PostgreSQL на Railway
-    if database_url.startswith('postgres://'):
-        database_url = database_url.replace('postgres://', 'postgresql://', 1)
+    database_url = get_database_url()
 
     try:
         engine = create_engine(database_url)
-        Base.metadata.create_all(engine)
+        if database_url.startswith('sqlite'):
+            _set_sqlite_pragmas(engine)
+        with engine.begin() as conn:
+            upgrade_schema(conn)
         SessionLocal = sessionmaker(bind=engine)
         logger.info(f"✅ База данных инициализирована: {database_url}")
         return SessionLocal
@@ -69,15 +129,104 @@ def init_db():
         if not database_url.startswith('sqlite://'):
             logger.info("Пробую SQLite как запасной вариант")
             engine = create_engine('sqlite:///movies.db')
-            Base.metadata.create_all(engine)
+            _set_sqlite_pragmas(engine)
+            with engine.begin() as conn:
+                upgrade_schema(conn)
             SessionLocal = sessionmaker(bind=engine)
             return SessionLocal
 
         raise
 
-def get_session():
-    """Получить сессию базы данных"""
-    global SessionLocal
-    if SessionLocal is None:
-        init_db()
-    return scoped_session(SessionLocal)  # Исправлено: возвращаем scoped_session
\ No newline at end of file
+def get_database_url() -> str:
+    """URL базы из окружения (с исправлением схемы для Railway)"""
+    database_url = os.getenv('DATABASE_URL', 'sqlite:///movies.db')
+    if database_url.startswith('postgres://'):
+        database_url = database_url.replace('postgres://', 'postgresql://', 1)
+    return database_url
+
+def get_async_database_url(database_url: str) -> str:
+    """Асинхронный драйвер: asyncpg для PostgreSQL, aiosqlite для SQLite"""
+    if database_url.startswith('postgresql://'):
+        return database_url.replace('postgresql://', 'postgresql+asyncpg://', 1)
+    if database_url.startswith('postgresql+psycopg2://'):
+        return database_url.replace('postgresql+psycopg2://', 'postgresql+asyncpg://', 1)
+    if database_url.startswith('sqlite://'):
+        return database_url.replace('sqlite://', 'sqlite+aiosqlite://', 1)
+    return database_url
+
+def _create_async_engine(database_url: str):
+    """Асинхронный движок с настраиваемым пулом соединений"""
+    options = {
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true',
+    }
+    if database_url.startswith('sqlite'):
+        # SQLite пишет только одним соединением за раз: с несколькими
+        # соединениями параллельные сессии падают с "database is locked".
+        # Одно соединение в пуле - сессии по очереди ждут его, не блокируя event loop
+        if ':memory:' not in database_url:
+            options['poolclass'] = AsyncAdaptedQueuePool
+            options['pool_size'] = 1
+            options['max_overflow'] = 0
+    else:
+        options['pool_size'] = int(os.getenv('DB_POOL_SIZE', '5'))
+        options['max_overflow'] = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+        options['pool_recycle'] = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+
+    engine = create_async_engine(get_async_database_url(database_url), **options)
+    if database_url.startswith('sqlite'):
+        _set_sqlite_pragmas(engine.sync_engine)
+    return engine
+
+async def init_async_db():
+    """Инициализация асинхронной базы данных (вызывается внутри event loop)"""
+    global async_engine, AsyncSessionLocal
+
+    database_url = get_database_url()
+
+    try:
+        async_engine = _create_async_engine(database_url)
+        async with async_engine.begin() as conn:
+            await conn.run_sync(upgrade_schema)
+        AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+        logger.info(f"✅ Асинхронная БД инициализирована: {async_engine.url.drivername}")
+        return AsyncSessionLocal
+    except Exception as e:
+        logger.error(f"❌ Ошибка инициализации асинхронной БД: {e}")
+
+        # Fallback на SQLite
+        if not database_url.startswith('sqlite://'):
+            logger.info("Пробую SQLite как запасной вариант")
+            async_engine = _create_async_engine('sqlite:///movies.db')
+            async with async_engine.begin() as conn:
+                await conn.run_sync(upgrade_schema)
+            AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+            return AsyncSessionLocal
+
+        raise
+
+async def close_async_db():
+    """Закрыть пул соединений асинхронной БД"""
+    global async_engine, AsyncSessionLocal, _async_init_lock
+    if async_engine is not None:
+        await async_engine.dispose()
+    async_engine = None
+    AsyncSessionLocal = None
+    _async_init_lock = asyncio.Lock()
+
+@asynccontextmanager
+async def async_session_scope():
+    """Короткая асинхронная сессия из пула с автоматическим commit/rollback"""
+    if AsyncSessionLocal is None:
+        # Первые сессии могут прийти одновременно - инициализируем БД один раз
+        async with _async_init_lock:
+            if AsyncSessionLocal is None:
+                await init_async_db()
+    session: AsyncSession = AsyncSessionLocal()
+    try:
+        yield session
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
@@ -1,66 +1,120 @@
-# bot/db_utils.py - УПРОЩЕННЫЙ для работы Watchlist
+# bot/db_utils.py - Watchlist в базе данных (модели User/Watchlist/Movie)
 
 import logging
 from datetime import datetime
-from typing import Optional, List, Dict
+from typing import List, Dict
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+from . import database, metrics
+from .logs import event
+from .database import Movie, User, Watchlist
 
 logger = logging.getLogger(__name__)
 
 class DatabaseManager:
-    """Упрощенный менеджер БД для Watchlist"""
+    """Менеджер Watchlist поверх SQLAlchemy.
 
-    def __init__(self):
-        self.watchlist = []  # Временное хранилище вместо БД
-        logger.info("✅ Инициализирован упрощенный менеджер БД")
+    Все операции - точечные запросы по уникальному индексу (user_id, movie_id)
+    через асинхронную сессию из пула, данные переживают перезапуск бота.
+    """
 
-    def add_to_watchlist(self, user_id: int, movie_data: dict) -> bool:
+    def __init__(self, limit: int = 20):
+        self.limit = limit
+        logger.info("✅ Инициализирован менеджер Watchlist (SQL)")
+
+    @metrics.db_operation('watchlist_add')
+    async def add_to_watchlist(self, user_id: int, movie_data: dict) -> bool:
         """Добавить фильм в Watchlist"""
-        try:
-            # Проверяем, нет ли уже такого фильма у пользователя
-            for item in self.watchlist:
-                if item.get('user_id') == user_id and item.get('movie_id') == movie_data.get('id'):
+        movie_id = movie_data.get('id')
+        if not movie_id:
+            return False
+
+        for attempt in range(2):
+            try:
+                async with database.async_session_scope() as session:
+                    # Пользователь и фильм должны быть в своих таблицах
+                    if await session.scalar(select(User.id).where(User.telegram_id == user_id)) is None:
+                        session.add(User(telegram_id=user_id))
+
+                    movie = await session.scalar(select(Movie).where(Movie.kp_id == int(movie_id)))
+                    if movie is None:
+                        session.add(Movie(
+                            kp_id=int(movie_id),
+                            title=movie_data.get('title', 'Без названия'),
+                            release_date=str(movie_data.get('year') or ''),
+                            poster_url=movie_data.get('poster_url', '')
+                        ))
+
+                    # Дубликат отсекает уникальный индекс, без сканирования списка
+                    session.add(Watchlist(user_id=user_id, movie_id=int(movie_id), added_at=datetime.now()))
+
+                logger.info("Добавлен фильм в Watchlist: %s", movie_data.get('title'),
+                            extra=event("watchlist_add", sample=True, user_id=user_id, movie_id=movie_id))
+                return True
+
+            except IntegrityError:
+                # Либо фильм уже в списке, либо параллельный запрос только что
+                # вставил того же пользователя/фильм - тогда пробуем еще раз
+                if attempt or await self._contains(user_id, int(movie_id)):
                     return False
+            except Exception as e:
+                logger.error(f"Ошибка добавления в Watchlist: {e}")
+                return False
 
-            # Добавляем новый фильм
-            watchlist_item = {
-                'id': len(self.watchlist) + 1,
-                'user_id': user_id,
-                'movie_id': movie_data.get('id'),
-                'title': movie_data.get('title', 'Без названия'),
-                'year': movie_data.get('year', ''),
-                'poster_url': movie_data.get('poster_url', ''),
-                'added_at': datetime.now()
-            }
-
-            self.watchlist.append(watchlist_item)
-            logger.info(f"Добавлен фильм в Watchlist: {movie_data.get('title')}")
-            return True
+        return False
 
-        except Exception as e:
-            logger.error(f"Ошибка добавления в Watchlist: {e}")
-            return False
+    async def _contains(self, user_id: int, movie_id: int) -> bool:
+        async with database.async_session_scope() as session:
+            return await session.scalar(
+                select(Watchlist.id).where(Watchlist.user_id == user_id, Watchlist.movie_id == movie_id)
+            ) is not None
 
-    def get_watchlist(self, user_id: int) -> List[Dict]:
+    @metrics.db_operation('watchlist_get')
+    async def get_watchlist(self, user_id: int) -> List[Dict]:
         """Получить Watchlist пользователя"""
         try:
-            user_watchlist = [item for item in self.watchlist if item.get('user_id') == user_id]
-            # Сортируем по дате добавления (новые сверху)
-            user_watchlist.sort(key=lambda x: x.get('added_at', datetime.min), reverse=True)
-            return user_watchlist[:20]  # Ограничиваем 20 фильмами
+            async with database.async_session_scope() as session:
+                rows = (await session.execute(
+                    select(Watchlist, Movie)
+                    .outerjoin(Movie, Movie.kp_id == Watchlist.movie_id)
+                    .where(Watchlist.user_id == user_id)
+                    # Новые сверху
+                    .order_by(Watchlist.added_at.desc())
+                    .limit(self.limit)
+                )).all()
+
+                return [
+                    {
+                        'id': item.id,
+                        'user_id': item.user_id,
+                        'movie_id': item.movie_id,
+                        'title': (movie.title if movie else None) or 'Без названия',
+                        'year': movie.release_date if movie else '',
+                        'poster_url': movie.poster_url if movie else '',
+                        'added_at': item.added_at
+                    }
+                    for item, movie in rows
+                ]
         except Exception as e:
             logger.error(f"Ошибка получения Watchlist: {e}")
             return []
 
-    def remove_from_watchlist(self, user_id: int, movie_id: int) -> bool:
+    @metrics.db_operation('watchlist_remove')
+    async def remove_from_watchlist(self, user_id: int, movie_id: int) -> bool:
         """Удалить фильм из Watchlist"""
         try:
-            initial_length = len(self.watchlist)
-            self.watchlist = [item for item in self.watchlist
-                              if not (item.get('user_id') == user_id and item.get('movie_id') == int(movie_id))]
+            async with database.async_session_scope() as session:
+                result = await session.execute(
+                    delete(Watchlist)
+                    .where(Watchlist.user_id == user_id, Watchlist.movie_id == int(movie_id))
+                )
+                removed = result.rowcount > 0
 
-            removed = len(self.watchlist) < initial_length
             if removed:
-                logger.info(f"Удален фильм из Watchlist: user_id={user_id}, movie_id={movie_id}")
+                logger.info("Удален фильм из Watchlist: user_id=%s, movie_id=%s", user_id, movie_id,
+                            extra=event("watchlist_remove", sample=True, user_id=user_id, movie_id=movie_id))
 
             return removed
         except Exception as e:
@@ -69,4 +123,4 @@ class DatabaseManager:
 
 # Фабрика для создания менеджера БД
 def get_db_manager() -> DatabaseManager:
-    return DatabaseManager()
\ No newline at end of file
+    return DatabaseManager()
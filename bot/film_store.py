@@ -0,0 +1,173 @@
+# bot/film_store.py - постоянное хранилище метаданных фильмов (таблица movies)
+
+import os
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from . import database
+from .database import Movie
+from .films import extract_film_id, get_film_title, parse_rating
+
+logger = logging.getLogger(__name__)
+
+def _genre_names(film: dict) -> str:
+    names = []
+    for g in film.get('genres') or []:
+        if isinstance(g, dict):
+            names.append(g.get('genre', ''))
+        elif isinstance(g, str):
+            names.append(g)
+    return ', '.join(name for name in names if name)
+
+class FilmStore:
+    """Write-through хранилище фильмов поверх модели Movie.
+
+    Все полученные из API фильмы сохраняются в таблицу movies, а детали
+    фильма при следующем запросе читаются отсюда, без обращения к API.
+    """
+
+    def __init__(self, details_ttl_days: Optional[float] = None):
+        if details_ttl_days is None:
+            details_ttl_days = float(os.getenv('FILM_STORE_TTL_DAYS', '30'))
+        self.details_ttl = timedelta(days=details_ttl_days)
+
+    async def _upsert(self, films: List[dict], has_details: bool) -> int:
+        films_by_id = {}
+        for film in films:
+            kp_id = extract_film_id(film)
+            if kp_id:
+                films_by_id[int(kp_id)] = film
+
+        if not films_by_id:
+            return 0
+
+        async with database.async_session_scope() as session:
+            existing = {
+                movie.kp_id: movie
+                for movie in await session.scalars(select(Movie).where(Movie.kp_id.in_(films_by_id.keys())))
+            }
+
+            for kp_id, film in films_by_id.items():
+                movie = existing.get(kp_id)
+                if movie is None:
+                    movie = Movie(kp_id=kp_id)
+                    session.add(movie)
+                elif movie.has_details and not has_details:
+                    # Краткие данные из поиска/топа не затирают полные детали
+                    continue
+
+                movie.title = get_film_title(film)
+                movie.original_title = film.get('nameOriginal') or film.get('nameEn')
+                movie.release_date = str(film.get('year') or '')
+                movie.overview = film.get('description')
+                movie.poster_url = film.get('posterUrlPreview') or film.get('posterUrl')
+                movie.media_type = 'tv' if film.get('serial') or film.get('type') == 'TV_SERIES' else 'movie'
+                movie.genres = _genre_names(film)
+                movie.vote_average = parse_rating(film)
+                movie.payload = json.dumps(film, ensure_ascii=False)
+                movie.has_details = has_details
+                movie.updated_at = datetime.now()
+
+        return len(films_by_id)
+
+    async def _load_details(self, kp_id: int) -> Optional[Dict]:
+        async with database.async_session_scope() as session:
+            movie = await session.scalar(select(Movie).where(Movie.kp_id == kp_id))
+            if movie is None or not movie.has_details or not movie.payload:
+                return None
+            if movie.updated_at and datetime.now() - movie.updated_at > self.details_ttl:
+                return None
+            return json.loads(movie.payload)
+
+    async def save_films(self, films: List[dict], has_details: bool = False) -> int:
+        """Сохранить (upsert) фильмы в таблицу movies"""
+        try:
+            try:
+                return await self._upsert(films, has_details)
+            except IntegrityError:
+                # Те же фильмы одновременно вставил параллельный запрос - теперь это обновление
+                return await self._upsert(films, has_details)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения фильмов в БД: {e}")
+            return 0
+
+    async def get_details(self, kp_id: int) -> Optional[Dict]:
+        """Детали фильма из БД или None, если их нет или они устарели"""
+        try:
+            return await self._load_details(int(kp_id))
+        except Exception as e:
+            logger.error(f"Ошибка чтения фильма {kp_id} из БД: {e}")
+            return None
+
+    async def get_poster_file_ids(self) -> Dict[int, str]:
+        """Все сохраненные file_id постеров: {kp_id: file_id}"""
+        try:
+            async with database.async_session_scope() as session:
+                rows = await session.execute(
+                    select(Movie.kp_id, Movie.poster_file_id).where(Movie.poster_file_id.is_not(None))
+                )
+                return {kp_id: file_id for kp_id, file_id in rows}
+        except Exception as e:
+            logger.error(f"Ошибка чтения file_id постеров из БД: {e}")
+            return {}
+
+    async def _store_poster_file_ids(self, file_ids: Dict[int, Optional[str]]):
+        async with database.async_session_scope() as session:
+            existing = {
+                movie.kp_id: movie
+                for movie in await session.scalars(select(Movie).where(Movie.kp_id.in_(file_ids.keys())))
+            }
+            for kp_id, file_id in file_ids.items():
+                movie = existing.get(kp_id)
+                if movie is not None:
+                    movie.poster_file_id = file_id
+                elif file_id:
+                    session.add(Movie(kp_id=kp_id, poster_file_id=file_id))
+
+    async def save_poster_file_ids(self, file_ids: Dict[int, Optional[str]]) -> bool:
+        """Запомнить (или сбросить, если file_id=None) file_id постеров одной транзакцией"""
+        file_ids = {int(kp_id): file_id for kp_id, file_id in file_ids.items()}
+        if not file_ids:
+            return True
+        try:
+            try:
+                await self._store_poster_file_ids(file_ids)
+            except IntegrityError:
+                # Фильм одновременно добавил параллельный запрос - теперь это обновление
+                await self._store_poster_file_ids(file_ids)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка сохранения file_id постеров {list(file_ids)}: {e}")
+            return False
+
+    async def save_poster_file_id(self, kp_id: int, file_id: Optional[str]) -> bool:
+        """Запомнить (или сбросить, если file_id=None) file_id постера фильма"""
+        return await self.save_poster_file_ids({kp_id: file_id})
+
+    async def get_brief_films(self) -> List[Dict]:
+        """Краткие данные всех сохраненных фильмов (для индекса названий)"""
+        try:
+            async with database.async_session_scope() as session:
+                rows = await session.execute(
+                    select(Movie.kp_id, Movie.title, Movie.original_title, Movie.release_date,
+                           Movie.vote_average, Movie.poster_url)
+                )
+                return [
+                    {
+                        'filmId': kp_id,
+                        'nameRu': title,
+                        'nameOriginal': original_title,
+                        'year': release_date,
+                        'rating': vote_average,
+                        'posterUrlPreview': poster_url,
+                    }
+                    for kp_id, title, original_title, release_date, vote_average, poster_url in rows
+                ]
+        except Exception as e:
+            logger.error(f"Ошибка чтения фильмов из БД: {e}")
+            return []
@@ -0,0 +1,170 @@
+# bot/films.py - общие функции для работы с данными фильмов
+
+import sys
+import asyncio
+import logging
+from dataclasses import dataclass, fields
+from typing import Any, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True, slots=True)
+class Film:
+    """Фильм в едином виде: собирается один раз из ответа API (или строки БД)
+    и дальше хранится в каталогах, индексах и результатах поиска.
+
+    В ответах API одни и те же данные лежат под разными ключами
+    (filmId / kinopoiskId / id, rating / ratingKinopoisk, posterUrlPreview /
+    posterUrl); здесь они разобраны заранее, а рендер карточек их не ищет.
+    Записи неизменяемы, поэтому одну запись безопасно держать в нескольких кэшах.
+    """
+
+    id: int
+    name_ru: str = ''
+    name_en: str = ''
+    name_original: str = ''
+    year: str = ''
+    rating: Optional[float] = None
+    # Рейтинг как его показывает API: '8.7', а в топе бывает '99%'
+    rating_label: str = ''
+    genres: Tuple[str, ...] = ()
+    description: str = ''
+    poster_url: str = ''
+    has_details: bool = False
+
+    @classmethod
+    def from_api(cls, data: Union['Film', dict]) -> 'Film':
+        """Запись из ответа API, строки Watchlist/movies или тестовых данных"""
+        if isinstance(data, Film):
+            return data
+
+        rating_value = data.get('rating') or data.get('ratingKinopoisk')
+        year = data.get('year') or str(data.get('release_date') or '')[:4]
+        description = data.get('description') or data.get('overview') or ''
+        return cls(
+            id=extract_film_id(data),
+            name_ru=data.get('nameRu') or data.get('title') or '',
+            name_en=data.get('nameEn') or '',
+            name_original=data.get('nameOriginal') or '',
+            year=str(year) if year else '',
+            rating=parse_rating(data),
+            rating_label=str(rating_value) if rating_value not in (None, '') else '',
+            genres=_parse_genres(data.get('genres') or data.get('genre')),
+            description=description,
+            poster_url=data.get('posterUrlPreview') or data.get('poster_url') or data.get('posterUrl') or '',
+            has_details=bool(description),
+        )
+
+    @property
+    def title(self) -> str:
+        return self.name_ru or self.name_en or self.name_original or 'Без названия'
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        """Все известные названия (для поиска)"""
+        return tuple(name for name in (self.name_ru, self.name_en, self.name_original) if name)
+
+    def merge(self, other: 'Film') -> 'Film':
+        """Новая запись: непустые поля other поверх полей этой записи"""
+        return Film(**{
+            name: getattr(other, name) or getattr(self, name) for name in _FIELD_NAMES
+        })
+
+    def with_details(self, details: Union['Film', dict]) -> 'Film':
+        return self.merge(Film.from_api(details))
+
+    def brief(self) -> 'Film':
+        """Без описания и жанров - для больших индексов (названия, год, рейтинг, постер)"""
+        if not self.description and not self.genres:
+            return self
+        return Film(self.id, self.name_ru, self.name_en, self.name_original, self.year,
+                    self.rating, self.rating_label, poster_url=self.poster_url)
+
+_FIELD_NAMES = tuple(field.name for field in fields(Film))
+
+def _parse_genres(value: Any) -> Tuple[str, ...]:
+    """[{'genre': 'драма'}, ...] или 'драма, комедия' -> ('драма', 'комедия').
+    Названия жанров повторяются в тысячах фильмов - храним одну копию строки.
+    """
+    if not value:
+        return ()
+    if isinstance(value, str):
+        value = value.split(',')
+    genres = []
+    for genre in value:
+        if isinstance(genre, dict):
+            genre = genre.get('genre')
+        if isinstance(genre, str) and genre.strip():
+            genres.append(sys.intern(genre.strip()))
+    return tuple(genres)
+
+def to_films(items) -> list:
+    """Список Film из ответа API (записи Film проходят как есть), без записей без ID"""
+    films = []
+    for item in items:
+        film = Film.from_api(item)
+        if film.id:
+            films.append(film)
+    return films
+
+def extract_film_id(film_data: dict) -> int:
+    """Извлечь ID фильма из данных"""
+    if isinstance(film_data, Film):
+        return film_data.id
+
+    film_id = film_data.get('filmId') or film_data.get('kinopoiskId') or film_data.get('id')
+
+    if isinstance(film_id, str):
+        try:
+            return int(film_id)
+        except (ValueError, TypeError):
+            pass
+
+    if not film_id:
+        return 0
+
+    return film_id
+
+def get_film_title(film_data: dict) -> str:
+    """Получить название фильма"""
+    if isinstance(film_data, Film):
+        return film_data.title
+    return film_data.get('nameRu') or film_data.get('nameEn') or film_data.get('title') or 'Без названия'
+
+def parse_rating(film_data: dict) -> Optional[float]:
+    """Рейтинг из любого поля ответа API (в топе бывает '99%' вместо оценки)"""
+    if isinstance(film_data, Film):
+        return film_data.rating
+    value = film_data.get('ratingKinopoisk') or film_data.get('rating')
+    try:
+        return float(value) if value not in (None, '') else None
+    except (ValueError, TypeError):
+        return None
+
+async def iter_with_details(client, films: list, concurrency: int = 5):
+    """Параллельно дополняет фильмы деталями и отдает каждый (Film) по готовности"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def enrich(film: Film) -> Film:
+        # Записи из каталогов уже с деталями - повторно не запрашиваем
+        if film.id and not film.has_details:
+            try:
+                async with semaphore:
+                    details = await client.get_film_details(film.id)
+                if details:
+                    # Новая запись: закэшированные ответы API не меняются
+                    film = film.with_details(details)
+            except Exception as e:
+                logger.error(f"Ошибка получения деталей фильма {film.id}: {e}")
+        return film
+
+    films = [Film.from_api(film) for film in films]
+
+    tasks = [asyncio.create_task(enrich(film)) for film in films]
+    try:
+        for next_film in asyncio.as_completed(tasks):
+            yield await next_film
+    finally:
+        # Если карточки перестали читать раньше времени, не оставляем висящих запросов
+        for task in tasks:
+            task.cancel()
@@ -1,10 +1,20 @@
 # bot/handlers.py - ОБНОВЛЕННЫЙ БЕЗ КНОПОК "ПОДРОБНЕЕ" И "ПОХОЖИЕ"
 
+import os
+import asyncio
 import logging
 import random
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup
+from telegram import (
+    Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, InputMediaPhoto,
+    InlineQueryResultArticle, InputTextMessageContent,
+)
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 
+from . import metrics
+from .logs import event
+from .films import Film, iter_with_details, to_films
+
 logger = logging.getLogger(__name__)
 
 # Импортируем только КиноПоиск клиент
@@ -16,6 +26,18 @@ except ImportError as e:
     logger.error(f"❌ Не удалось импортировать КиноПоиск клиент: {e}")
     api_client = None
 
+# Снимок топ-250, индексы случайного выбора и жанров в памяти (обновляются фоновой задачей)
+from .catalogue import GENRE_MAP, top_catalogue, random_index, genre_index
+
+# file_id постеров, уже загруженных в Telegram
+from .posters import poster_cache
+
+# Результаты поиска для листания кнопками
+from .search_pages import search_pager
+
+# Названия уже встречавшихся фильмов: подсказки inline-режима и поиск с опечатками
+from .title_index import title_index, normalize_title, allowed_typos
+
 # Импортируем утилиты БД
 try:
     from .db_utils import get_db_manager
@@ -25,18 +47,14 @@ except ImportError as e:
     logger.warning(f"⚠️ Модуль db_utils не найден: {e}")
     db_manager = None
 
-# Карта жанров для поиска - АКТУАЛЬНЫЕ ID
-GENRE_MAP = {
-    "драма": 1,
-    "комедия": 2,
-    "боевик": 3,
-    "триллер": 4,
-    "фантастика": 6,
-    "ужасы": 7,
-    "детектив": 9,
-    "мелодрама": 17,
-    "приключения": 12,
-}
+# Сколько запросов деталей фильмов выполняется одновременно
+DETAILS_CONCURRENCY = int(os.getenv('DETAILS_CONCURRENCY', '5'))
+
+# Inline-режим: сколько секунд Telegram кэширует ответ на одинаковый запрос
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', '300'))
+# Пауза перед запросом к API: пока пользователь печатает, запросы не отправляются
+INLINE_DEBOUNCE = float(os.getenv('INLINE_DEBOUNCE', '0.7'))
+INLINE_RESULTS = 10
 
 # Альтернативная карта жанров (на случай если основные не работают)
 GENRE_MAP_ALTERNATIVE = {
@@ -98,6 +116,8 @@ POPULAR_MOVIES = [
         "posterUrlPreview": "https://avatars.mds.yandex.net/get-kinopoisk-image/1599028/3560b757-9b95-45ec-af8c-623972370f9d/300x450"
     }
 ]
+# Запасные фильмы - в том же виде, что и фильмы из каталогов
+POPULAR_MOVIES = to_films(POPULAR_MOVIES)
 
 def get_main_keyboard():
     """Основная клавиатура"""
@@ -120,59 +140,48 @@ def get_genre_keyboard():
 
 # ==================== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ====================
 
-def extract_film_id(film_data: dict) -> int:
-    """Извлечь ID фильма из данных"""
-    film_id = film_data.get('filmId') or film_data.get('kinopoiskId') or film_data.get('id')
+async def enrich_films(films: list):
+    """Параллельно дополняет фильмы деталями и отдает каждый по готовности"""
+    async for film in iter_with_details(api_client, films, DETAILS_CONCURRENCY):
+        yield film
 
-    if isinstance(film_id, str):
-        try:
-            return int(film_id)
-        except (ValueError, TypeError):
-            pass
+def build_film_text(film: Film) -> str:
+    """Текст карточки фильма (Markdown)"""
+    film = Film.from_api(film)
+
+    # Формируем полное описание
+    text = f"🎬 *{film.title}*"
+    if film.year:
+        text += f" ({film.year})"
 
-    if not film_id:
-        return 0
+    if film.rating_label:
+        text += f"\n⭐ Рейтинг: {film.rating_label}"
 
-    return film_id
+    # Жанры
+    if film.genres:
+        text += f"\n🎭 Жанр: {', '.join(film.genres[:3])}"
+
+    # Полное описание
+    if film.description:
+        text += f"\n\n📝 *Описание:*\n{film.description}"
+
+    return text
+
+def _is_bad_file_id(error: Exception) -> bool:
+    """Telegram отклонил file_id (файл удален или идентификатор неверен)"""
+    if not isinstance(error, BadRequest):
+        return False
+    message = str(error).lower()
+    return 'file identifier' in message or 'file_id' in message or 'file reference' in message
 
-def get_film_title(film_data: dict) -> str:
-    """Получить название фильма"""
-    return film_data.get('nameRu') or film_data.get('nameEn') or film_data.get('title') or 'Без названия'
 
 async def send_film_card(update, film, from_watchlist: bool = False) -> bool:
     """Отправляет карточку фильма с кнопками"""
     try:
-        title = get_film_title(film)
-        year = film.get('year', '') or film.get('release_date', '')[:4]
-        rating = film.get('rating', '') or film.get('ratingKinopoisk', '')
-        film_id = extract_film_id(film)
-        description = film.get('description', '') or film.get('overview', '')
-        poster_url = film.get('posterUrlPreview') or film.get('poster_url') or film.get('posterUrl')
-
-        # Формируем полное описание
-        text = f"🎬 *{title}*"
-        if year:
-            text += f" ({year})"
-
-        if rating:
-            text += f"\n⭐ Рейтинг: {rating}"
-
-        # Жанры
-        genres = film.get('genres', [])
-        if isinstance(genres, list) and genres:
-            genre_names = []
-            for g in genres[:3]:
-                if isinstance(g, dict):
-                    genre_names.append(g.get('genre', ''))
-                elif isinstance(g, str):
-                    genre_names.append(g)
-
-            if genre_names:
-                text += f"\n🎭 Жанр: {', '.join(genre_names)}"
-
-        # Полное описание
-        if description:
-            text += f"\n\n📝 *Описание:*\n{description}"
+        film = Film.from_api(film)
+        film_id = film.id
+        poster_url = film.poster_url
+        text = build_film_text(film)
 
         # Кнопки действий
         keyboard = []
@@ -188,27 +197,49 @@ async def send_film_card(update, film, from_watchlist: bool = False) -> bool:
                 InlineKeyboardButton("💾 В Watchlist", callback_data=f"watch_{film_id}")
             ])
 
+        reply_markup = InlineKeyboardMarkup(keyboard)
+
+        # Постер, который Telegram уже загружал, отправляем по file_id
+        file_id = poster_cache.get(film_id) if film_id else None
+        if file_id:
+            try:
+                await update.effective_message.reply_photo(
+                    photo=file_id,
+                    caption=text,
+                    parse_mode='Markdown',
+                    reply_markup=reply_markup
+                )
+                return True
+            except Exception as e:
+                logger.warning(f"file_id постера {film_id} не принят, отправляю по URL: {e}")
+                # Забываем file_id, только если Telegram отверг сам идентификатор,
+                # а не из-за таймаута или ошибки в подписи
+                if _is_bad_file_id(e):
+                    await poster_cache.forget(film_id)
+
         try:
             if poster_url and poster_url.startswith('http'):
-                await update.message.reply_photo(
+                message = await update.effective_message.reply_photo(
                     photo=poster_url,
                     caption=text,
                     parse_mode='Markdown',
-                    reply_markup=InlineKeyboardMarkup(keyboard)
+                    reply_markup=reply_markup
                 )
+                if film_id and message.photo:
+                    await poster_cache.remember(film_id, message.photo[-1].file_id)
             else:
-                await update.message.reply_text(
+                await update.effective_message.reply_text(
                     text,
                     parse_mode='Markdown',
-                    reply_markup=InlineKeyboardMarkup(keyboard)
+                    reply_markup=reply_markup
                 )
             return True
         except Exception as e:
             logger.error(f"Ошибка отправки карточки: {e}")
-            await update.message.reply_text(
+            await update.effective_message.reply_text(
                 text,
                 parse_mode='Markdown',
-                reply_markup=InlineKeyboardMarkup(keyboard)
+                reply_markup=reply_markup
             )
             return True
 
@@ -216,28 +247,210 @@ async def send_film_card(update, film, from_watchlist: bool = False) -> bool:
         logger.error(f"Ошибка формирования карточки: {e}")
         return False
 
-async def execute_search(update, query: str):
-    """Выполнение поиска фильмов"""
+# Больше фильмов Telegram в один альбом не принимает
+MEDIA_GROUP_SIZE = 10
+
+def format_film_line(number: int, film: Film) -> str:
+    """Строка компактного списка: номер, название, год, рейтинг"""
+    line = f"{number}. {film.title}"
+    if film.year:
+        line += f" ({film.year})"
+    if film.rating_label:
+        line += f" ⭐ {film.rating_label}"
+    return line
+
+def get_film_actions_keyboard(films: list, from_watchlist: bool = False, start: int = 1) -> InlineKeyboardMarkup:
+    """Одно сообщение с кнопками для всех фильмов списка"""
+    keyboard = []
+    for number, film in enumerate(films, start):
+        if not film.id:
+            continue
+        if from_watchlist:
+            keyboard.append([InlineKeyboardButton(f"🗑️ {number}. {film.title}", callback_data=f"remove_{film.id}")])
+        else:
+            keyboard.append([InlineKeyboardButton(f"💾 {number}. {film.title}", callback_data=f"watch_{film.id}")])
+    return InlineKeyboardMarkup(keyboard)
+
+async def send_film_cards(update, films: list, from_watchlist: bool = False) -> int:
+    """Отправляет список фильмов альбомами по 10 постеров: подпись первого
+    фото - нумерованный список, следом одно сообщение с кнопками.
+    Возвращает число показанных фильмов.
+    """
+    films = [Film.from_api(film) for film in films if film]
+    if len(films) == 1:
+        return int(await send_film_card(update, films[0], from_watchlist))
+
+    shown = 0
+    for start in range(0, len(films), MEDIA_GROUP_SIZE):
+        chunk = films[start:start + MEDIA_GROUP_SIZE]
+
+        # Постер: file_id, если Telegram его уже загружал, иначе URL
+        posters = []
+        without_poster = []
+        for film in chunk:
+            file_id = poster_cache.get(film.id) if film.id else None
+            if file_id or film.poster_url.startswith('http'):
+                posters.append((film, file_id, file_id or film.poster_url))
+            else:
+                without_poster.append(film)
+
+        # Номера в подписи и на кнопках идут в порядке фото альбома,
+        # фильмы без постера - в конце списка
+        if len(posters) >= 2:
+            chunk = [film for film, _, _ in posters] + without_poster
+        index = "\n".join(format_film_line(number, film) for number, film in enumerate(chunk, start + 1))
+
+        actions_text = index
+        new_file_ids = {}
+        if len(posters) >= 2:
+            media = [InputMediaPhoto(photo) for _, _, photo in posters]
+            media[0] = InputMediaPhoto(posters[0][2], caption=index[:1024])
+            try:
+                messages = await update.effective_message.reply_media_group(media=media)
+            except Exception as e:
+                # Альбом отклоняется целиком (например, из-за одного постера) - шлем карточки по одной
+                logger.warning(f"Не удалось отправить альбом, отправляю карточки по одной: {e}")
+                for film in chunk:
+                    if await send_film_card(update, film, from_watchlist):
+                        shown += 1
+                continue
+
+            for (film, file_id, _), message in zip(posters, messages):
+                if film.id and not file_id and message.photo:
+                    new_file_ids[film.id] = message.photo[-1].file_id
+            actions_text = "👇 Действия с фильмами:"
+
+        await update.effective_message.reply_text(
+            actions_text,
+            reply_markup=get_film_actions_keyboard(chunk, from_watchlist, start + 1)
+        )
+        shown += len(chunk)
+
+        # Новые file_id - одной записью в БД, уже после ответа пользователю
+        if new_file_ids:
+            await poster_cache.remember_many(new_file_ids)
+
+    return shown
+
+async def render_search_page(token: str, index: int):
+    """Текст и кнопки страницы результатов поиска: (None, None), если поиск устарел"""
+    page = await search_pager.page(token, index)
+    if page is None or not page[1]:
+        return None, None
+
+    results, films, index = page
+    pages_count = search_pager.pages_count(results)
+    start = index * search_pager.page_size + 1
+
+    text = f"🔍 «{results.query}» — найдено фильмов: {results.total}\n\n"
+    text += "\n".join(format_film_line(number, film) for number, film in enumerate(films, start))
+    text += f"\n\nСтраница {index + 1} из {pages_count}"
+
+    keyboard = []
+    for number, film in enumerate(films, start):
+        if film.id:
+            keyboard.append([InlineKeyboardButton(f"ℹ️ {number}. {film.title}", callback_data=f"info_{film.id}")])
+
+    navigation = []
+    if index > 0:
+        navigation.append(InlineKeyboardButton("◀️ Назад", callback_data=f"sp_{token}_{index - 1}"))
+    if index + 1 < pages_count:
+        navigation.append(InlineKeyboardButton("Дальше ▶️", callback_data=f"sp_{token}_{index + 1}"))
+    if navigation:
+        keyboard.append(navigation)
+
+    # Найдено локально - по кнопке можно спросить и КиноПоиск
+    if results.local:
+        keyboard.append([InlineKeyboardButton("🌐 Искать в КиноПоиске", callback_data=f"sa_{token}")])
+
+    return text, InlineKeyboardMarkup(keyboard)
+
+async def show_search_results(update, query: str, result: dict):
+    """Первая страница результатов; дальше они листаются в том же сообщении"""
+    token = search_pager.start(query, result)
+    text, reply_markup = await render_search_page(token, 0)
+
+    if not text:
+        await update.effective_message.reply_text("😔 Не удалось показать результаты. Попробуйте другой запрос.")
+        return
+
+    await update.effective_message.reply_text(text, reply_markup=reply_markup)
+
+async def show_suggestions(update, query: str, header: str) -> bool:
+    """«Возможно, вы искали»: знакомые названия, похожие на запрос с опечатками.
+    Возвращает False, если похожих нет
+    """
+    suggestions = title_index.fuzzy(query, max_typos=allowed_typos(normalize_title(query)) + 1)
+    if not suggestions:
+        return False
+
+    await update.effective_message.reply_text(f"{header} Возможно, вы искали:")
+    await show_search_results(update, query, {
+        "films": suggestions,
+        "searchFilmsCountResult": len(suggestions),
+        "local": True,
+    })
+    return True
+
+@metrics.handler('execute_search')
+async def execute_search(update, query: str, use_index: bool = True):
+    """Выполнение поиска фильмов.
+
+    Точное название из локального индекса находится без запроса к API;
+    остальное ищет КиноПоиск. Названия с опечатками из индекса
+    предлагаются, только если КиноПоиск ничего не нашел или недоступен.
+    """
+    message = update.effective_message
+
+    # Локальный индекс названий: ответ без API только на точное название
+    local_films = title_index.match(query) if use_index else []
+    if local_films:
+        logger.info("🔍 Поиск %r в индексе названий: %d", query, len(local_films),
+                    extra=event("search_local", sample=True, found=len(local_films)))
+        await show_search_results(update, query, {
+            "films": local_films,
+            "searchFilmsCountResult": len(local_films),
+            "local": True,
+        })
+        return
+
     if not api_client or not api_client.is_active:
-        await show_test_results(update, query)
+        if not await show_suggestions(update, query, "⚠️ КиноПоиск недоступен."):
+            await show_test_results(update, query)
         return
 
     try:
-        logger.info(f"🔍 Поиск в КиноПоиске: '{query}'")
-        result = api_client.search_films(query)
+        logger.info("🔍 Поиск в КиноПоиске: %r", query, extra=event("search_api", sample=True))
+        result = await api_client.search_films(query)
+
+        if result.get('degraded'):
+            # Квота API исчерпана - похожие знакомые названия или популярные фильмы вместо ошибки
+            if await show_suggestions(update, query, "⚠️ КиноПоиск временно недоступен."):
+                return
+            await message.reply_text(
+                "⚠️ КиноПоиск временно недоступен, показываю популярные фильмы."
+            )
+            await show_test_results(update, query)
+            return
 
         if not result or 'error' in result:
+            if await show_suggestions(update, query, "⚠️ КиноПоиск недоступен."):
+                return
             error_msg = result.get('error', 'Неизвестная ошибка')
-            await update.message.reply_text(f"❌ Ошибка API: {error_msg}")
+            await message.reply_text(f"❌ Ошибка API: {error_msg}")
             return
 
         films = result.get('films', [])
         total_found = result.get('searchFilmsCountResult', 0)
 
-        logger.info(f"Найдено фильмов: {total_found}")
+        logger.info("Найдено фильмов: %d", total_found, extra=event("search_api_found", sample=True, found=total_found))
 
         if not films or total_found == 0:
-            await update.message.reply_text(
+            # Опечатка, которую не понял КиноПоиск: ищем похожие знакомые названия
+            if await show_suggestions(update, query, f"🤔 По запросу «{query}» ничего не найдено."):
+                return
+
+            await message.reply_text(
                 f"😔 По запросу «{query}» ничего не найдено.\n\n"
                 "Попробуйте:\n"
                 "• Уточнить название\n"
@@ -246,32 +459,19 @@ async def execute_search(update, query: str):
             )
             return
 
-        # Показываем первые 3 результата
-        shown_count = 0
-        for film in films[:3]:
-            if await send_film_card(update, film):
-                shown_count += 1
-
-        if shown_count == 0:
-            await update.message.reply_text("😔 Не удалось показать результаты. Попробуйте другой запрос.")
-
-        # Если есть больше результатов
-        if total_found > 3:
-            await update.message.reply_text(
-                f"📊 Найдено фильмов: {total_found}\n"
-                f"Показаны первые {min(3, len(films))} результата.",
-                reply_markup=get_main_keyboard()
-            )
+        # Результаты листаются в одном сообщении; страницы API подгружаются впрок
+        await show_search_results(update, query, result)
 
     except Exception as e:
         logger.error(f"Ошибка поиска: {str(e)}", exc_info=True)
-        await update.message.reply_text(
+        await message.reply_text(
             "❌ Ошибка при поиске.\n"
             "Попробуйте позже или другой запрос."
         )
 
 # ==================== ОСНОВНЫЕ ОБРАБОТЧИКИ КОМАНД ====================
 
+@metrics.handler('start')
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
     user = update.effective_user
@@ -338,28 +538,33 @@ async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def show_test_results(update, query):
     """Показать тестовые результаты (когда API не работает)"""
-    logger.info(f"🔍 Тестовый поиск: '{query}'")
+    logger.info("🔍 Тестовый поиск: %r", query, extra=event("search_test"))
 
-    for film in POPULAR_MOVIES[:2]:
-        await send_film_card(update, film)
+    await send_film_cards(update, POPULAR_MOVIES[:2])
 
+@metrics.handler('show_top250')
 async def show_top250(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /top - показывает случайные фильмы из топ-250"""
     await update.message.reply_text("⭐ Загружаю случайные фильмы из топ-250...")
 
+    # Снимок уже содержит детали фильмов - обходимся без запросов к API
+    if top_catalogue.is_ready:
+        await send_film_cards(update, top_catalogue.sample(10))
+        return
+
     if not api_client or not api_client.is_active:
         # Тестовые данные
-        for film in POPULAR_MOVIES:
-            await send_film_card(update, film)
+        await send_film_cards(update, POPULAR_MOVIES)
         return
 
     try:
         # Получаем 3 случайные страницы из топа и выбираем 10 случайных фильмов
         all_films = []
 
-        for _ in range(3):
-            page = random.randint(1, 13)  # В топе 250 фильмов, по 20 на странице
-            result = api_client.get_top_films(page=page)
+        pages = [random.randint(1, 13) for _ in range(3)]  # В топе 250 фильмов, по 20 на странице
+        results = await asyncio.gather(*(api_client.get_top_films(page=page) for page in pages))
+
+        for result in results:
             films = result.get('films', [])
 
             if films:
@@ -370,20 +575,11 @@ async def show_top250(update: Update, context: ContextTypes.DEFAULT_TYPE):
             random.shuffle(all_films)
             selected_films = all_films[:10]
 
-            # Получаем полную информацию для каждого фильма
-            for film in selected_films:
-                film_id = extract_film_id(film)
-                if film_id:
-                    details = api_client.get_film_details(film_id)
-                    if details:
-                        # Объединяем основную информацию с деталями
-                        film.update(details)
-
-                await send_film_card(update, film)
-
-                # Небольшая пауза между отправками, чтобы не перегружать API
-                import asyncio
-                await asyncio.sleep(0.5)
+            # Детали запрашиваются параллельно, фильмы уходят одним альбомом
+            await send_film_cards(update, [film async for film in enrich_films(selected_films)])
+        elif api_client.is_degraded:
+            # Квота API исчерпана - показываем локальные фильмы вместо ошибки
+            await send_film_cards(update, POPULAR_MOVIES)
         else:
             await update.message.reply_text(
                 "❌ Не удалось загрузить фильмы из топа. Попробуйте позже.",
@@ -393,15 +589,15 @@ async def show_top250(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         logger.error(f"Ошибка загрузки топа: {e}")
         # Показываем локальные фильмы как запасной вариант
-        for film in POPULAR_MOVIES:
-            await send_film_card(update, film)
+        await send_film_cards(update, POPULAR_MOVIES)
 
+@metrics.handler('random_real_movie')
 async def random_real_movie(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /random - случайный фильм из КиноПоиска с рейтингом ≥8.5"""
     await update.message.reply_text("🎲 Ищу случайный фильм с рейтингом от 8.5...")
 
     try:
-        movie = await get_random_movie_from_api()
+        movie = await get_random_movie_from_api(update.effective_user.id)
 
         if movie:
             await send_film_card(update, movie)
@@ -417,14 +613,22 @@ async def random_real_movie(update: Update, context: ContextTypes.DEFAULT_TYPE):
         movie = random.choice(POPULAR_MOVIES)
         await send_film_card(update, movie)
 
-async def get_random_movie_from_api() -> dict:
+async def get_random_movie_from_api(user_id: int = None) -> dict:
     """Получить случайный фильм из КиноПоиска с рейтингом не ниже 8.5"""
+    # Локальный индекс отвечает без сетевых запросов и не повторяет недавние фильмы
+    movie = random_index.pick(min_rating=8.5, user_id=user_id)
+    if movie:
+        return movie
+
+    if top_catalogue.is_ready:
+        return top_catalogue.random_film(min_rating=8.5)
+
     if not api_client or not api_client.is_active:
         return random.choice(POPULAR_MOVIES)
 
     try:
         # Используем метод из kinopoisk_client
-        movie = api_client.get_random_high_rated_movie(min_rating=8.5)
+        movie = await api_client.get_random_high_rated_movie(min_rating=8.5)
         if movie:
             return movie
 
@@ -435,6 +639,7 @@ async def get_random_movie_from_api() -> dict:
         logger.error(f"Ошибка получения случайного фильма: {e}")
         return random.choice(POPULAR_MOVIES)
 
+@metrics.handler('show_watchlist')
 async def show_watchlist(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /watchlist - показывает Watchlist"""
     if not db_manager:
@@ -452,7 +657,7 @@ async def show_watchlist(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
 
     try:
-        watchlist = db_manager.get_watchlist(user_id)
+        watchlist = await db_manager.get_watchlist(user_id)
 
         if not watchlist:
             await update.message.reply_text(
@@ -466,18 +671,9 @@ async def show_watchlist(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
 
-        text = "📋 *Твой Watchlist:*\n\n"
-        for i, item in enumerate(watchlist[:5], 1):
-            text += f"{i}. *{item['title']}*"
-            if item.get('year'):
-                text += f" ({item['year']})"
-            if 'added_at' in item and item['added_at']:
-                if hasattr(item['added_at'], 'strftime'):
-                    text += f"\n   📅 Добавлено: {item['added_at'].strftime('%d.%m.%Y')}"
-            text += "\n\n"
-
-        if len(watchlist) > 5:
-            text += f"... и еще {len(watchlist) - 5} фильмов"
+        text = f"📋 *Твой Watchlist:* {len(watchlist)} фильмов"
+        if len(watchlist) > MEDIA_GROUP_SIZE:
+            text += f"\nПоказаны последние {MEDIA_GROUP_SIZE}."
 
         await update.message.reply_text(
             text,
@@ -485,16 +681,13 @@ async def show_watchlist(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=get_main_keyboard()
         )
 
-        # Показываем карточки фильмов из watchlist с кнопкой удаления
-        for item in watchlist[:3]:  # Показываем первые 3
-            film_data = {
-                'id': item['movie_id'],
-                'filmId': item['movie_id'],
-                'nameRu': item['title'],
-                'year': item.get('year', ''),
-                'posterUrlPreview': item.get('poster_url', '')
-            }
-            await send_film_card(update, film_data, from_watchlist=True)
+        # Фильмы из watchlist одним альбомом с кнопками удаления
+        films = [
+            Film(id=item['movie_id'], name_ru=item['title'], year=str(item.get('year') or ''),
+                 poster_url=item.get('poster_url') or '')
+            for item in watchlist[:MEDIA_GROUP_SIZE]
+        ]
+        await send_film_cards(update, films, from_watchlist=True)
 
     except Exception as e:
         logger.error(f"Ошибка получения watchlist: {e}")
@@ -516,7 +709,8 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Приводим к нижнему регистру для сравнения
     text_lower = text.lower()
 
-    logger.info(f"Получено сообщение: '{original_text}'")
+    logger.info("Получено сообщение: %r", original_text,
+                extra=event("message", sample=True, user_id=update.effective_user.id if update.effective_user else None))
 
     # Обработка кнопок быстрого действия
     if text == "🔍 Поиск фильма":
@@ -583,7 +777,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Если сообщение содержит только цифры (например, "250"), игнорируем
     if text.strip().isdigit() and len(text.strip()) <= 3:
-        logger.info(f"Игнорируем числовой запрос: '{text}'")
+        logger.info("Игнорируем числовой запрос: %r", text, extra=event("message_ignored", sample=True))
         await update.message.reply_text(
             "Используйте кнопки ниже для навигации 👇",
             reply_markup=get_main_keyboard()
@@ -601,6 +795,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=get_main_keyboard()
     )
 
+@metrics.handler('search_by_genre')
 async def search_by_genre(update: Update, context: ContextTypes.DEFAULT_TYPE, genre: str):
     """Поиск фильмов по жанру - УЛУЧШЕННАЯ ВЕРСИЯ"""
     await update.message.reply_text(f"🎭 Ищу фильмы в жанре *{genre}*...", parse_mode='Markdown')
@@ -613,8 +808,7 @@ async def search_by_genre(update: Update, context: ContextTypes.DEFAULT_TYPE, ge
             parse_mode='Markdown',
             reply_markup=get_main_keyboard()
         )
-        for film in POPULAR_MOVIES[:3]:
-            await send_film_card(update, film)
+        await send_film_cards(update, POPULAR_MOVIES[:3])
         return
 
     try:
@@ -625,103 +819,17 @@ async def search_by_genre(update: Update, context: ContextTypes.DEFAULT_TYPE, ge
             await update.message.reply_text(f"Жанр «{genre}» не найден в базе.")
             return
 
-        # Пробуем несколько способов поиска
-        all_films = []
+        logger.info("Поиск фильмов в жанре %s (ID: %s)", genre, genre_id,
+                    extra=event("genre", sample=True, genre_id=genre_id))
 
-        logger.info(f"Поиск фильмов в жанре {genre} (ID: {genre_id})")
+        # Фильмы жанра по всем сортировкам берутся из индекса в памяти;
+        # если индекс еще не собран, собираем этот жанр сейчас
+        if not genre_index.has(genre_id):
+            await genre_index.refresh_genre(genre_id)
 
-        # СПОСОБ 1: Прямой поиск по жанру через API
-        try:
-            # Используем разные параметры поиска
-            for order in ["RATING", "YEAR", "NUM_VOTE"]:  # Разные сортировки
-                for _ in range(2):  # 2 страницы каждой сортировки
-                    page = random.randint(1, 5)
-                    try:
-                        result = api_client.get_films_by_filters(
-                            genre_id=genre_id,
-                            page=page,
-                            order=order
-                        )
-
-                        films = result.get('items', [])
-                        if films:
-                            all_films.extend(films)
-                            logger.info(f"Найдено {len(films)} фильмов в жанре {genre} (страница {page}, сортировка {order})")
-
-                        if len(all_films) >= 30:  # Собираем достаточно фильмов
-                            break
-                    except Exception as page_error:
-                        logger.error(f"Ошибка на странице {page}: {page_error}")
-                        continue
-
-                if len(all_films) >= 30:
-                    break
-        except Exception as method1_error:
-            logger.error(f"Ошибка способа 1 для жанра {genre}: {method1_error}")
-
-        # СПОСОБ 2: Если не нашли фильмов, ищем через поиск по названию жанра
-        if len(all_films) < 5:
-            logger.info(f"Способ 1 нашел мало фильмов ({len(all_films)}), пробую способ 2")
-            try:
-                # Ключевые слова для поиска по жанрам
-                genre_keywords = {
-                    "драма": ["драма", "трагедия", "эмоции", "чувства"],
-                    "комедия": ["комедия", "юмор", "смех", "веселье"],
-                    "боевик": ["боевик", "экшн", "сражения", "битва"],
-                    "ужасы": ["ужасы", "хоррор", "страх", "ужас"],
-                    "фантастика": ["фантастика", "футуризм", "космос", "будущее"],
-                    "детектив": ["детектив", "расследование", "тайна", "загадка"],
-                    "мелодрама": ["мелодрама", "любовь", "романтика", "чувства"],
-                    "триллер": ["триллер", "саспенс", "напряжение", "триллер"],
-                    "приключения": ["приключения", "путешествия", "экспедиция", "исследование"]
-                }
-
-                keywords = genre_keywords.get(genre.lower(), [genre])
-
-                for keyword in keywords[:2]:  # Пробуем первые 2 ключевых слова
-                    try:
-                        search_result = api_client.search_films(keyword)
-                        search_films = search_result.get('films', [])
-
-                        if search_films:
-                            logger.info(f"Поиск по ключевому слову '{keyword}' нашел {len(search_films)} фильмов")
-
-                            # Более тщательная фильтрация по жанрам
-                            for film in search_films:
-                                film_genres = film.get('genres', [])
-                                if film_genres:
-                                    # Проверяем названия жанров
-                                    for g in film_genres:
-                                        if isinstance(g, dict):
-                                            genre_name = g.get('genre', '').lower()
-                                            if genre.lower() in genre_name or any(kw in genre_name for kw in keywords):
-                                                all_films.append(film)
-                                                break
-                                        elif isinstance(g, str) and (genre.lower() in g.lower() or any(kw in g.lower() for kw in keywords)):
-                                            all_films.append(film)
-                                            break
-
-                        if len(all_films) >= 20:
-                            break
-
-                    except Exception as keyword_error:
-                        logger.error(f"Ошибка поиска по ключевому слову {keyword}: {keyword_error}")
-                        continue
-            except Exception as method2_error:
-                logger.error(f"Ошибка способа 2 для жанра {genre}: {method2_error}")
-
-        # Удаляем дубликаты
-        unique_films = []
-        seen_ids = set()
-        for film in all_films:
-            film_id = extract_film_id(film)
-            if film_id and film_id not in seen_ids:
-                seen_ids.add(film_id)
-                unique_films.append(film)
-
-        all_films = unique_films
-
-        logger.info(f"Всего найдено уникальных фильмов в жанре {genre}: {len(all_films)}")
+        all_films = genre_index.films(genre_id)
+
+        logger.debug("Всего найдено уникальных фильмов в жанре %s: %d", genre, len(all_films))
 
         if not all_films:
             await update.message.reply_text(
@@ -744,32 +852,8 @@ async def search_by_genre(update: Update, context: ContextTypes.DEFAULT_TYPE, ge
             parse_mode='Markdown'
         )
 
-        # Получаем полную информацию и показываем каждый фильм
-        films_shown = 0
-        for film in selected_films:
-            try:
-                film_id = extract_film_id(film)
-                if film_id:
-                    try:
-                        # Получаем полную информацию о фильме
-                        details = api_client.get_film_details(film_id)
-                        if details:
-                            # Объединяем основную информацию с деталями
-                            film.update(details)
-                            logger.info(f"Получены детали для фильма {film_id}")
-                    except Exception as e:
-                        logger.error(f"Ошибка получения деталей фильма {film_id}: {e}")
-
-                await send_film_card(update, film)
-                films_shown += 1
-
-                # Небольшая пауза между отправками, чтобы не перегружать API
-                import asyncio
-                await asyncio.sleep(0.5)
-
-            except Exception as film_error:
-                logger.error(f"Ошибка показа фильма: {film_error}")
-                continue
+        # Получаем полную информацию параллельно и показываем фильмы одним альбомом
+        films_shown = await send_film_cards(update, [film async for film in enrich_films(selected_films)])
 
         if films_shown == 0:
             await update.message.reply_text(
@@ -778,7 +862,7 @@ async def search_by_genre(update: Update, context: ContextTypes.DEFAULT_TYPE, ge
                 reply_markup=get_genre_keyboard()
             )
         else:
-            logger.info(f"Успешно показано {films_shown} фильмов в жанре {genre}")
+            logger.debug("Успешно показано %d фильмов в жанре %s", films_shown, genre)
 
     except Exception as e:
         logger.error(f"Критическая ошибка поиска по жанру: {e}", exc_info=True)
@@ -789,21 +873,38 @@ async def search_by_genre(update: Update, context: ContextTypes.DEFAULT_TYPE, ge
             reply_markup=get_main_keyboard()
         )
         # Показываем тестовые данные
-        for film in POPULAR_MOVIES[:3]:
-            try:
-                await send_film_card(update, film)
-            except:
-                pass
+        try:
+            await send_film_cards(update, POPULAR_MOVIES[:3])
+        except:
+            pass
 
 # ==================== ОБРАБОТЧИК INLINE-КНОПОК ====================
 
+def without_button(markup, callback_data: str):
+    """Клавиатура без кнопки callback_data (None, если кнопок не осталось)"""
+    if not markup:
+        return None
+    rows = [
+        [button for button in row if button.callback_data != callback_data]
+        for row in markup.inline_keyboard
+    ]
+    rows = [row for row in rows if row]
+    return InlineKeyboardMarkup(rows) if rows else None
+
+@metrics.handler('button_handler')
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработчик inline-кнопок"""
+    """Обработчик inline-кнопок.
+
+    Кнопки Watchlist стоят и под карточками с фото, и под общим сообщением
+    списка, поэтому сообщение не переписывается: результат показывается
+    всплывающим уведомлением, а использованная кнопка убирается.
+    Листание поиска (sp_) редактирует сообщение со списком на месте.
+    """
     query = update.callback_query
-    await query.answer()
 
     data = query.data
-    logger.info(f"Нажата inline-кнопка: {data}")
+    logger.info("Нажата inline-кнопка: %s", data,
+                extra=event("callback", sample=True, user_id=query.from_user.id if query.from_user else None))
 
     if data.startswith('watch_'):
         # Добавить в Watchlist
@@ -814,43 +915,165 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             film_info = {}
             if api_client:
                 try:
-                    film_info = api_client.get_film_details(int(film_id))
+                    film_info = await api_client.get_film_details(int(film_id))
                 except:
                     # Если не удалось получить детали, создаем базовую информацию
                     film_info = {'nameRu': f'Фильм ID {film_id}'}
 
             # Создаем данные фильма
+            film = Film.from_api(film_info or {})
             movie_data = {
                 'id': int(film_id),
-                'title': film_info.get('nameRu') or f'Фильм ID {film_id}',
-                'year': film_info.get('year', ''),
-                'poster_url': film_info.get('posterUrl') or film_info.get('posterUrlPreview', '')
+                'title': film.name_ru or f'Фильм ID {film_id}',
+                'year': film.year,
+                'poster_url': film.poster_url
             }
 
             # Добавляем в watchlist
-            if db_manager and db_manager.add_to_watchlist(query.from_user.id, movie_data):
-                await query.edit_message_text(f"✅ Фильм «{movie_data['title']}» добавлен в Watchlist!")
+            if db_manager and await db_manager.add_to_watchlist(query.from_user.id, movie_data):
+                await query.answer(f"✅ Фильм «{movie_data['title']}» добавлен в Watchlist!")
             else:
-                await query.edit_message_text(f"✅ Фильм «{movie_data['title']}» уже был в Watchlist или произошла ошибка!")
+                await query.answer(f"✅ Фильм «{movie_data['title']}» уже был в Watchlist или произошла ошибка!")
 
         except Exception as e:
             logger.error(f"Ошибка в watch_: {e}")
-            await query.edit_message_text("❌ Ошибка при добавлении в Watchlist.")
+            await query.answer("❌ Ошибка при добавлении в Watchlist.", show_alert=True)
 
     elif data.startswith('remove_'):
         # Удалить из Watchlist
         try:
             film_id = data.split('_')[1]
 
-            if db_manager and db_manager.remove_from_watchlist(query.from_user.id, int(film_id)):
-                await query.edit_message_text("✅ Фильм удален из Watchlist!")
-            else:
-                await query.edit_message_text("❌ Фильм не найден в Watchlist.")
+            removed = bool(db_manager and await db_manager.remove_from_watchlist(query.from_user.id, int(film_id)))
 
         except Exception as e:
             logger.error(f"Ошибка в remove_: {e}")
-            await query.edit_message_text("❌ Ошибка при удалении из Watchlist.")
+            await query.answer("❌ Ошибка при удалении из Watchlist.", show_alert=True)
+            return
+
+        if removed:
+            await query.answer("✅ Фильм удален из Watchlist!")
+        else:
+            await query.answer("❌ Фильм не найден в Watchlist.")
+
+        # Кнопка удаления больше не нужна
+        try:
+            await query.edit_message_reply_markup(reply_markup=without_button(query.message.reply_markup, data))
+        except Exception as e:
+            logger.warning(f"Не удалось обновить кнопки: {e}")
+
+    elif data.startswith('sp_'):
+        # Листание результатов поиска: sp_<токен>_<страница>
+        try:
+            _, token, index = data.split('_')
+            text, reply_markup = await render_search_page(token, int(index))
+        except Exception as e:
+            logger.error(f"Ошибка в sp_: {e}")
+            text, reply_markup = None, None
+
+        if not text:
+            await query.answer("⌛ Результаты поиска устарели, повторите поиск.", show_alert=True)
+            return
+
+        await query.answer()
+        try:
+            await query.edit_message_text(text, reply_markup=reply_markup)
+        except Exception as e:
+            # Например, повторное нажатие той же кнопки: сообщение не изменилось
+            logger.warning(f"Не удалось обновить страницу поиска: {e}")
+
+    elif data.startswith('sa_'):
+        # Поиск в API по запросу, на который ответил локальный индекс
+        results = search_pager.get(data.split('_')[1])
+        if results is None:
+            await query.answer("⌛ Результаты поиска устарели, повторите поиск.", show_alert=True)
+            return
+
+        await query.answer()
+        await execute_search(update, results.query, use_index=False)
+
+    elif data.startswith('info_'):
+        # Карточка фильма из списка результатов
+        await query.answer()
+        film_id = data.split('_')[1]
+
+        film = {}
+        if api_client and api_client.is_active:
+            film = await api_client.get_film_details(int(film_id))
+        if not film:
+            film = {'id': int(film_id), 'filmId': int(film_id), 'nameRu': f'Фильм ID {film_id}'}
+
+        await send_film_card(update, film)
 
     else:
         # Неизвестная кнопка
-        await query.edit_message_text(f"Действие: {data}")
\ No newline at end of file
+        await query.answer(f"Действие: {data}")
+
+# ==================== INLINE-РЕЖИМ (@bot запрос) ====================
+
+# Последний inline-запрос пользователя, ожидающий ответа API
+_inline_pending = {}
+
+def build_inline_results(films: list) -> list:
+    """Подсказки inline-режима: статья с карточкой фильма и кнопкой Watchlist"""
+    results = []
+    for film in to_films(films):
+        details = []
+        if film.year:
+            details.append(film.year)
+        if film.rating_label:
+            details.append(f"⭐ {film.rating_label}")
+
+        results.append(InlineQueryResultArticle(
+            id=str(film.id),
+            title=film.title,
+            description=' · '.join(details) or None,
+            thumbnail_url=film.poster_url if film.poster_url.startswith('http') else None,
+            input_message_content=InputTextMessageContent(build_film_text(film), parse_mode='Markdown'),
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("💾 В Watchlist", callback_data=f"watch_{film.id}")]
+            ]),
+        ))
+    return results
+
+@metrics.handler('inline_query_handler')
+async def inline_query_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Подсказки фильмов по мере ввода: из индекса названий, API - только при промахе"""
+    query = update.inline_query
+    text = query.query.strip()
+    user_id = query.from_user.id
+
+    # Новый запрос отменяет ожидающий запрос к API
+    _inline_pending.pop(user_id, None)
+
+    if len(text) < 2:
+        films = top_catalogue.sample(INLINE_RESULTS) if top_catalogue.is_ready else POPULAR_MOVIES
+        await query.answer(build_inline_results(films), cache_time=INLINE_CACHE_TIME)
+        return
+
+    films = title_index.search(text, INLINE_RESULTS)
+    if films or not api_client or not api_client.is_active:
+        await query.answer(build_inline_results(films), cache_time=INLINE_CACHE_TIME)
+        return
+
+    # Промах индекса: идем в API отдельной задачей, чтобы не держать очередь обновлений
+    _inline_pending[user_id] = query.id
+    context.application.create_task(answer_inline_from_api(query, text), update=update)
+
+async def answer_inline_from_api(query, text: str):
+    """Ответ на inline-запрос из API, если за INLINE_DEBOUNCE пользователь не напечатал дальше"""
+    user_id = query.from_user.id
+    await asyncio.sleep(INLINE_DEBOUNCE)
+    if _inline_pending.get(user_id) != query.id:
+        return
+
+    try:
+        result = await api_client.search_films(text)
+        films = result.get('films', [])[:INLINE_RESULTS]
+        if _inline_pending.get(user_id) == query.id:
+            await query.answer(build_inline_results(films), cache_time=INLINE_CACHE_TIME)
+    except Exception as e:
+        logger.warning(f"Не удалось ответить на inline-запрос «{text}»: {e}")
+    finally:
+        if _inline_pending.get(user_id) == query.id:
+            del _inline_pending[user_id]
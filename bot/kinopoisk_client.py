@@ -1,16 +1,37 @@
-# bot/kinopoisk_client.py - полная рабочая версия
+# bot/kinopoisk_client.py - асинхронная версия на httpx
 
 import os
+import time
+import asyncio
 import logging
-import requests
 import random
-from typing import List, Dict, Optional
-import time
+from typing import Any, Callable, List, Dict, Optional, Tuple
+
+import httpx
+
+from . import metrics
+from .cache import TTLCache, SingleFlight
+from .film_store import FilmStore
+from .rate_limit import BACKGROUND, INTERACTIVE, DailyQuota, TokenBucket, current_priority
+from .tracing import tracer
+from .resilience import RETRY_STATUSES, CircuitBreaker, LatencyTracker, backoff_delay, hedged
 
 logger = logging.getLogger(__name__)
 
+# Время жизни ответов в кэше по эндпоинтам (секунды). 0 - не кэшировать
+CACHE_TTL = {
+    "search": 10 * 60,           # поиск: результаты быстро меняются
+    "details": 24 * 60 * 60,     # детали фильма почти не меняются
+    "similars": 24 * 60 * 60,
+    "top": 12 * 60 * 60,         # топ-250 обновляется редко
+    "filters": 60 * 60,
+}
+
+# Сколько воркеров (процессов) делят один API-ключ: лимиты ключа делятся между ними поровну
+BOT_WORKERS = max(int(os.getenv('BOT_WORKERS', '1')), 1)
+
 class KinopoiskClient:
-    def __init__(self):
+    def __init__(self, cache: Optional[TTLCache] = None, store: Optional[FilmStore] = None):
         self.api_key = os.getenv('KINOPOISK_API_KEY')
 
         # Проверяем наличие ключа
@@ -19,7 +40,8 @@ class KinopoiskClient:
             logger.error("Получите ключ на https://kinopoiskapiunofficial.tech")
             self.api_key = None
 
-        self.base_url = "https://kinopoiskapiunofficial.tech/api"
+        # Адрес API можно подменить (например, локальным стендом из bench/)
+        self.base_url = os.getenv('KINOPOISK_BASE_URL', "https://kinopoiskapiunofficial.tech/api").rstrip('/')
         self.headers = {
             "Content-Type": "application/json",
             "User-Agent": "MovieMateBot/1.0"
@@ -29,116 +51,383 @@ class KinopoiskClient:
             self.headers["X-API-KEY"] = self.api_key
 
         self.is_active = bool(self.api_key)
-        self.session = requests.Session()
-        self.session.headers.update(self.headers)
+
+        # Пул соединений создается лениво, внутри работающего event loop
+        self.max_connections = int(os.getenv('KINOPOISK_MAX_CONNECTIONS', '20'))
+        self.session: Optional[httpx.AsyncClient] = None
+
+        # Кэш ответов: можно передать свой экземпляр с тем же интерфейсом
+        if cache is None:
+            cache = TTLCache(max_size=int(os.getenv('KINOPOISK_CACHE_SIZE', '2000')))
+        self.cache = cache
+
+        # Постоянное хранилище фильмов в БД (переживает перезапуски)
+        self.store = store
+
+        # Одинаковые одновременные запросы выполняются один раз
+        self.single_flight = SingleFlight()
+
+        # Лимиты API-ключа: запросов в секунду (общий на всех пользователей) и в сутки.
+        # Счетчики живут в памяти процесса, поэтому каждый воркер получает свою долю
+        rps = float(os.getenv('KINOPOISK_RPS', '5')) / BOT_WORKERS
+        self.rate_limiter = TokenBucket(rate=rps, capacity=max(rps, 1), background_reserve=rps / 2)
+        self.quota = DailyQuota(max(int(os.getenv('KINOPOISK_DAILY_QUOTA', '500')) // BOT_WORKERS, 1))
+
+        # Устойчивость к сбоям API: повторы, размыкатель, hedged-запросы по p95
+        self.max_retries = int(os.getenv('KINOPOISK_MAX_RETRIES', '2'))
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv('KINOPOISK_BREAKER_FAILURES', '5')),
+            reset_timeout=float(os.getenv('KINOPOISK_BREAKER_RESET', '30'))
+        )
+        self.latency = LatencyTracker()
+        self.hedging = os.getenv('KINOPOISK_HEDGING', 'false').lower() == 'true'
+
+        # Подписчики на фильмы из ответов API (например, индекс названий)
+        self._listeners: List[Callable[[List[Dict]], None]] = []
 
         if self.is_active:
             logger.info("✅ КиноПоиск клиент инициализирован")
         else:
             logger.warning("⚠️ КиноПоиск клиент НЕ активен")
 
-    def search_films(self, query: str, page: int = 1) -> Dict:
+    def _get_session(self) -> httpx.AsyncClient:
+        """Общий пул HTTP-соединений (keep-alive) для всех запросов"""
+        if self.session is None or self.session.is_closed:
+            self.session = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+            )
+        return self.session
+
+    async def close(self):
+        """Закрыть пул соединений (вызывается при остановке бота)"""
+        if self.session is not None and not self.session.is_closed:
+            await self.session.aclose()
+        self.session = None
+
+    def add_listener(self, callback: Callable[[List[Dict]], None]):
+        """Вызывать callback(films) для фильмов из каждого свежего ответа API"""
+        self._listeners.append(callback)
+
+    def _notify(self, endpoint: str, data: Any):
+        if not self._listeners or not isinstance(data, dict):
+            return
+        if endpoint == "details":
+            films = [data]
+        else:
+            films = data.get("films") or data.get("items") or []
+        if not films:
+            return
+        for callback in self._listeners:
+            try:
+                callback(films)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика фильмов: {e}")
+
+    @property
+    def is_degraded(self) -> bool:
+        """Дневная квота исчерпана - ответы только из кэша и запасных данных"""
+        return self.quota.is_exhausted
+
+    def cache_stats(self) -> Dict:
+        """Статистика кэша ответов (для оценки расхода квоты API)"""
+        stats = self.cache.stats()
+        stats["single_flight"] = self.single_flight.stats()
+        stats["quota"] = self.quota.stats()
+        stats["rate_limit_wait"] = round(self.rate_limiter.waited, 2)
+        stats["breaker"] = {"state": self.breaker.state, "rejected": self.breaker.rejected}
+        p95 = self.latency.percentile(0.95)
+        stats["latency_p95"] = round(p95, 3) if p95 is not None else None
+        return stats
+
+    async def sync_quota(self):
+        """Подтянуть фактический расход дневной квоты ключа (после перезапуска)"""
+        if not self.is_active:
+            return
+
+        try:
+            response = await self._get_session().get(f"/v1/api_keys/{self.api_key}", timeout=10)
+            if response.status_code == 200:
+                daily = response.json().get("dailyQuota") or {}
+                self.quota.sync(used=int(daily.get("used") or 0), limit=daily.get("value"))
+                logger.info(f"📊 Квота КиноПоиска: {self.quota.stats()}")
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось получить квоту КиноПоиска: {e}")
+
+    async def _get(self, endpoint: str, path: str, params: Optional[Dict] = None,
+                   timeout: float = 5, store_id: Optional[int] = None) -> Tuple[int, Optional[Any]]:
+        """GET-запрос к API через кэш и хранилище. Возвращает (статус, JSON или None)
+
+        store_id - ID фильма, детали которого можно взять из постоянного хранилища.
+        """
+        ttl = CACHE_TTL.get(endpoint, 0)
+        key = (path, tuple(sorted((params or {}).items())))
+
+        if ttl:
+            cached = self.cache.get(endpoint, key)
+            if cached is not None:
+                return 200, cached
+
+        async def fetch():
+            # Вызов идет с приоритетом того, кто его начал
+            return current_priority(), await self._fetch(endpoint, path, params, timeout, key, ttl, store_id)
+
+        # Одновременные одинаковые запросы разделяют один вызов API
+        priority, (status, data) = await self.single_flight.do((endpoint, key), fetch)
+
+        if status == 429 and data is None and priority == BACKGROUND and current_priority() == INTERACTIVE:
+            # Общий вызов начала фоновая задача, и ее не пустила квота; у пользовательских
+            # запросов свой резерв - повторяем с нашим приоритетом
+            return await self.single_flight.do(
+                (endpoint, key, INTERACTIVE),
+                lambda: self._fetch(endpoint, path, params, timeout, key, ttl, store_id)
+            )
+        return status, data
+
+    async def _fetch(self, endpoint: str, path: str, params: Optional[Dict], timeout: float,
+                     key: tuple, ttl: int, store_id: Optional[int]) -> Tuple[int, Optional[Any]]:
+        """Промах кэша: хранилище, затем запрос к API"""
+        if store_id and self.store:
+            stored = await self.store.get_details(store_id)
+            if stored:
+                if ttl:
+                    self.cache.set(endpoint, key, stored, ttl)
+                return 200, stored
+
+        # Бюджет API: при малом остатке отвечаем устаревшим кэшем, если он есть
+        stale = self.cache.get_stale(endpoint, key) if ttl else None
+        if stale is not None and self.quota.is_low:
+            return self._serve_stale(endpoint, stale)
+
+        # Пока API лежит, сразу отвечаем кэшем, не дожидаясь таймаутов
+        if not self.breaker.allow():
+            if stale is not None:
+                return self._serve_stale(endpoint, stale)
+            return 503, None
+
+        # Пробный запрос после паузы размыкателя: если он не даст ни успеха, ни ошибки,
+        # его нужно отпустить, иначе размыкатель так и будет ждать исхода
+        probe = self.breaker.state == CircuitBreaker.HALF_OPEN
+        started = time.perf_counter()
+        try:
+            with tracer.span(f"kinopoisk.{endpoint}", path=path):
+                response = await self._request(path, params, timeout)
+        except httpx.TransportError:
+            metrics.observe_upstream(endpoint, "error", time.perf_counter() - started)
+            if stale is not None:
+                return self._serve_stale(endpoint, stale)
+            raise
+        finally:
+            if probe:
+                self.breaker.release_probe()
+        metrics.observe_upstream(
+            endpoint, response.status_code if response is not None else "quota", time.perf_counter() - started
+        )
+
+        if response is None:
+            if stale is not None:
+                return self._serve_stale(endpoint, stale)
+            logger.debug(f"Квота КиноПоиска: запрос {endpoint} отклонен")
+            return 429, None
+
+        if response.status_code != 200:
+            if stale is not None and response.status_code in RETRY_STATUSES:
+                return self._serve_stale(endpoint, stale)
+            return response.status_code, None
+
+        data = response.json()
+        if ttl:
+            self.cache.set(endpoint, key, data, ttl)
+        self._notify(endpoint, data)
+        if self.store:
+            await self._persist(endpoint, data)
+        return response.status_code, data
+
+    def _serve_stale(self, endpoint: str, stale: Any) -> Tuple[int, Any]:
+        self.cache.count_stale(endpoint)
+        return 200, stale
+
+    async def _request(self, path: str, params: Optional[Dict], timeout: float) -> Optional[httpx.Response]:
+        """Запрос к API с повторами на 429/5xx и сетевых ошибках.
+
+        Возвращает None, если дневная квота не позволяет сделать запрос.
+        """
+        priority = current_priority()
+        response = None
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt and not self.breaker.allow():
+                break
+            if not self.quota.try_consume(priority):
+                break
+
+            await self.rate_limiter.acquire(priority)
+            try:
+                response = await hedged(
+                    lambda: self._send(path, params, timeout),
+                    self._hedge_delay(),
+                    # Второй запрос тоже расходует квоту и ждет токен лимита запросов в секунду
+                    can_hedge=lambda: self.quota.try_consume(priority),
+                    hedge=lambda: self._send_hedge(path, params, timeout, priority)
+                )
+                last_error = None
+            except httpx.TransportError as e:
+                self.breaker.record_failure()
+                last_error = e
+                response = None
+                if attempt < self.max_retries:
+                    logger.warning(f"Повтор запроса {path} после ошибки: {e!r}")
+                    await asyncio.sleep(backoff_delay(attempt))
+                continue
+
+            if response.status_code not in RETRY_STATUSES:
+                self.breaker.record_success()
+                return response
+
+            # 429 - это наш лимит, а не сбой API: размыкатель не трогаем
+            if response.status_code != 429:
+                self.breaker.record_failure()
+            if attempt < self.max_retries:
+                await asyncio.sleep(self._retry_delay(response, attempt))
+
+        if last_error is not None:
+            raise last_error
+        return response
+
+    async def _send(self, path: str, params: Optional[Dict], timeout: float) -> httpx.Response:
+        started = time.monotonic()
+        response = await self._get_session().get(path, params=params, timeout=timeout)
+        self.latency.record(time.monotonic() - started)
+        return response
+
+    async def _send_hedge(self, path: str, params: Optional[Dict], timeout: float, priority: int) -> httpx.Response:
+        await self.rate_limiter.acquire(priority)
+        return await self._send(path, params, timeout)
+
+    def _hedge_delay(self) -> Optional[float]:
+        """Через сколько секунд отправлять второй запрос (p95 задержки) или None"""
+        if not self.hedging:
+            return None
+        return self.latency.percentile(0.95)
+
+    @staticmethod
+    def _retry_delay(response: httpx.Response, attempt: int) -> float:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), 5.0)
+            except ValueError:
+                pass
+        return backoff_delay(attempt)
+
+    async def _persist(self, endpoint: str, data: Any):
+        """Write-through: сохраняем полученные фильмы в БД"""
+        if endpoint == "details":
+            await self.store.save_films([data], has_details=True)
+        elif endpoint in ("search", "top"):
+            await self.store.save_films(data.get("films", []))
+
+    async def search_films(self, query: str, page: int = 1) -> Dict:
         """Поиск фильмов и сериалов"""
         if not self.is_active:
             logger.error("КиноПоиск API не активен")
             return {"films": [], "searchFilmsCountResult": 0}
 
-        url = f"{self.base_url}/v2.1/films/search-by-keyword"
         params = {
             "keyword": query,
             "page": page
         }
 
         try:
-            logger.info(f"Ищу: '{query}'")
-            response = self.session.get(url, params=params, timeout=15)
+            logger.debug("Ищу: %r", query)
+            status, data = await self._get("search", "/v2.1/films/search-by-keyword", params=params, timeout=6)
 
-            if response.status_code == 200:
-                data = response.json()
+            if status == 200:
                 count = data.get("searchFilmsCountResult", 0)
-                films = data.get("films", [])
-                logger.info(f"Найдено результатов: {count}")
+                logger.debug("Найдено результатов: %d", count)
                 return data
-            elif response.status_code == 401:
+            elif status == 401:
                 logger.error("❌ Неверный API ключ КиноПоиска")
                 return {"films": [], "searchFilmsCountResult": 0, "error": "Invalid API key"}
+            elif status == 429:
+                logger.warning("⚠️ Лимит запросов к КиноПоиску исчерпан")
+                return {"films": [], "searchFilmsCountResult": 0, "degraded": True}
             else:
-                logger.error(f"❌ Ошибка API: {response.status_code}")
+                logger.error(f"❌ Ошибка API: {status}")
                 return {"films": [], "searchFilmsCountResult": 0}
 
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             logger.error("⏱️ Таймаут запроса к КиноПоиску")
             return {"films": [], "searchFilmsCountResult": 0}
         except Exception as e:
             logger.error(f"❌ Ошибка подключения к КиноПоиску: {e}")
             return {"films": [], "searchFilmsCountResult": 0}
 
-    def get_film_details(self, film_id: int) -> Dict:
+    async def get_film_details(self, film_id: int) -> Dict:
         """Получение деталей фильма"""
         if not self.is_active:
             return {}
 
-        url = f"{self.base_url}/v2.2/films/{film_id}"
-
         try:
-            response = self.session.get(url, timeout=10)
-            if response.status_code == 200:
-                return response.json()
+            status, data = await self._get("details", f"/v2.2/films/{film_id}", store_id=film_id)
+            if status == 200:
+                return data
             return {}
         except Exception as e:
             logger.error(f"Ошибка получения деталей фильма {film_id}: {e}")
             return {}
 
-    def get_similar_films(self, film_id: int) -> List[Dict]:
+    async def get_similar_films(self, film_id: int) -> List[Dict]:
         """Похожие фильмы"""
         if not self.is_active:
             return []
 
-        url = f"{self.base_url}/v2.2/films/{film_id}/similars"
-
         try:
-            response = self.session.get(url, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
+            status, data = await self._get("similars", f"/v2.2/films/{film_id}/similars")
+            if status == 200:
                 return data.get("items", [])
             return []
         except Exception as e:
             logger.error(f"Ошибка получения похожих фильмов {film_id}: {e}")
             return []
 
-    def get_top_films(self, page: int = 1, top_type: str = "TOP_250_BEST_FILMS") -> Dict:
+    async def get_top_films(self, page: int = 1, top_type: str = "TOP_250_BEST_FILMS") -> Dict:
         """Топ фильмов"""
         if not self.is_active:
             return {"films": []}
 
-        url = f"{self.base_url}/v2.2/films/top"
         params = {
             "type": top_type,
             "page": page
         }
 
         try:
-            response = self.session.get(url, params=params, timeout=10)
-            if response.status_code == 200:
-                return response.json()
+            status, data = await self._get("top", "/v2.2/films/top", params=params)
+            if status == 200:
+                return data
             return {"films": []}
         except Exception as e:
             logger.error(f"Ошибка получения топа: {e}")
             return {"films": []}
 
-    def get_films_by_filters(self, genre_id: Optional[int] = None,
-                             year_from: Optional[int] = None,
-                             year_to: Optional[int] = None,
-                             rating_from: Optional[int] = None,
-                             rating_to: Optional[int] = None,
-                             page: int = 1) -> Dict:
-        """Фильмы по фильтрам"""
+    async def get_films_by_filters(self, genre_id: Optional[int] = None,
+                                   year_from: Optional[int] = None,
+                                   year_to: Optional[int] = None,
+                                   rating_from: Optional[int] = None,
+                                   rating_to: Optional[int] = None,
+                                   page: int = 1,
+                                   order: str = "RATING") -> Dict:
+        """Фильмы по фильтрам (order: RATING, NUM_VOTE или YEAR)"""
         if not self.is_active:
             return {"items": []}
 
-        url = f"{self.base_url}/v2.2/films"
         params = {
-            "order": "RATING",
+            "order": order,
             "type": "FILM",  # Только фильмы, не сериалы
             "ratingFrom": rating_from or 0,
             "ratingTo": rating_to or 10,
@@ -151,15 +440,15 @@ class KinopoiskClient:
             params["genres"] = genre_id
 
         try:
-            response = self.session.get(url, params=params, timeout=10)
-            if response.status_code == 200:
-                return response.json()
+            status, data = await self._get("filters", "/v2.2/films", params=params)
+            if status == 200:
+                return data
             return {"items": []}
         except Exception as e:
             logger.error(f"Ошибка фильтрации: {e}")
             return {"items": []}
 
-    def get_random_high_rated_movie(self, min_rating: float = 8.5) -> Optional[Dict]:
+    async def get_random_high_rated_movie(self, min_rating: float = 8.5) -> Optional[Dict]:
         """Получить случайный фильм с высоким рейтингом"""
         if not self.is_active:
             return None
@@ -172,7 +461,7 @@ class KinopoiskClient:
             # Берем несколько страниц для выбора
             all_films = []
             for page in range(1, 6):  # Проверяем первые 5 страниц
-                result = self.get_films_by_filters(
+                result = await self.get_films_by_filters(
                     rating_from=rating_from_percent,
                     rating_to=100,
                     page=page
@@ -201,18 +490,18 @@ class KinopoiskClient:
                     return random.choice(high_rated)
 
             # Если не нашли по фильтрам, берем из топа
-            return self.get_random_from_top(min_rating)
+            return await self.get_random_from_top(min_rating)
 
         except Exception as e:
             logger.error(f"Ошибка получения случайного фильма: {e}")
             return None
 
-    def get_random_from_top(self, min_rating: float = 8.5) -> Optional[Dict]:
+    async def get_random_from_top(self, min_rating: float = 8.5) -> Optional[Dict]:
         """Получить случайный фильм из топа"""
         try:
             # Выбираем случайную страницу из топа
             page = random.randint(1, 13)  # В топе 250 фильмов, по 20 на странице
-            result = self.get_top_films(page=page)
+            result = await self.get_top_films(page=page)
 
             films = result.get('films', [])
             if films:
@@ -240,4 +529,5 @@ class KinopoiskClient:
             return None
 
 # Глобальный экземпляр
-kinopoisk_client = KinopoiskClient()
\ No newline at end of file
+kinopoisk_client = KinopoiskClient(store=FilmStore())
+metrics.cache_collector.register("kinopoisk", kinopoisk_client.cache.stats)
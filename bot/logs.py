@@ -0,0 +1,127 @@
+# bot/logs.py - структурированные логи (JSON) через очередь и фоновый поток, с выборкой частых событий
+
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+# Уровень, формат (json или text) и выборка частых событий: пишется каждое N-е
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()
+LOG_SAMPLE_EVERY = int(os.getenv('LOG_SAMPLE_EVERY', '20'))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Атрибуты, которые есть у любой LogRecord: все остальное пришло через extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+def event(name: str, sample: bool = False, **fields) -> Dict:
+    """extra= для записи лога: имя события, поля для JSON и признак выборки.
+
+    logger.info("Получено сообщение: %r", text, extra=event("message", sample=True, user_id=...))
+    """
+    return {"event": name, "sample": sample, **fields}
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON: время, уровень, логгер, сообщение и поля из extra"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for name, value in record.__dict__.items():
+            if name not in _RECORD_ATTRS and name != 'sample':
+                data[name] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Из записей с extra=event(..., sample=True) пропускается каждая
+    every-я по каждому событию; в пропущенную пишется sampled=every,
+    чтобы по логам можно было оценить настоящее количество.
+    """
+
+    def __init__(self, every: int = LOG_SAMPLE_EVERY):
+        super().__init__()
+        self.every = max(every, 1)
+        self._counts: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, 'sample', False) or self.every == 1:
+            return True
+
+        name = getattr(record, 'event', record.msg)
+        count = self._counts.get(name, 0)
+        self._counts[name] = count + 1
+        if count % self.every:
+            return False
+        record.sampled = self.every
+        return True
+
+class LazyQueueHandler(QueueHandler):
+    """QueueHandler, который не форматирует запись в потоке event loop:
+    сообщение собирается из msg % args уже в фоновом потоке.
+    Аргументы логов - строки и числа, менять их после вызова некому.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+_listener: Optional[QueueListener] = None
+_lock = threading.Lock()
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT,
+                  sample_every: int = LOG_SAMPLE_EVERY) -> QueueListener:
+    """Настроить корневой логгер: запись в очередь (дешево, в потоке бота),
+    форматирование и вывод в stdout - в фоновом потоке QueueListener
+    """
+    global _listener
+
+    with _lock:
+        if _listener is not None:
+            return _listener
+
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JsonFormatter() if fmt == 'json' else logging.Formatter(TEXT_FORMAT))
+
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        handler = LazyQueueHandler(records)
+        handler.addFilter(SamplingFilter(sample_every))
+
+        root = logging.getLogger()
+        for old in list(root.handlers):
+            root.removeHandler(old)
+        root.addHandler(handler)
+        root.setLevel(level)
+
+        # Поток и процесс в формате не используются - не собираем их для каждой
+        # записи (рекомендация из раздела Optimization документации logging)
+        logging.logThreads = False
+        logging.logProcesses = False
+        logging.logMultiprocessing = False
+
+        # httpx пишет INFO на каждый HTTP-запрос; задержки и статусы есть в метриках
+        logging.getLogger('httpx').setLevel(logging.WARNING)
+
+        _listener = QueueListener(records, output, respect_handler_level=True)
+        _listener.start()
+        # Дописать очередь при выходе из процесса
+        atexit.register(stop_logging)
+        return _listener
+
+def stop_logging():
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
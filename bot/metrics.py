@@ -0,0 +1,168 @@
+# bot/metrics.py - метрики Prometheus: обработчики, API КиноПоиска, кэши, БД и event loop
+
+import os
+import time
+import asyncio
+import functools
+import logging
+from typing import Callable, Dict, Optional
+
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from .tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Локальный адрес страницы /metrics. METRICS_PORT=0 - не поднимать
+METRICS_ADDR = os.getenv('METRICS_ADDR', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9090'))
+# Как часто замерять задержку event loop (секунды)
+LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', '0.5'))
+
+# Ответы бота: от десятков миллисекунд (кэш) до секунд (API с повторами)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+HANDLER_LATENCY = Histogram(
+    'moviemate_handler_seconds', "Время обработки в обработчиках бота",
+    ['handler'], buckets=LATENCY_BUCKETS
+)
+HANDLER_ERRORS = Counter(
+    'moviemate_handler_errors_total', "Исключения, вышедшие из обработчиков", ['handler']
+)
+
+UPSTREAM_LATENCY = Histogram(
+    'moviemate_upstream_seconds', "Время запроса к API КиноПоиска (с повторами)",
+    ['endpoint'], buckets=LATENCY_BUCKETS
+)
+UPSTREAM_RESPONSES = Counter(
+    'moviemate_upstream_responses_total', "Ответы API КиноПоиска по статусам",
+    ['endpoint', 'status']
+)
+
+DB_LATENCY = Histogram(
+    'moviemate_db_seconds', "Время операций с БД", ['operation'], buckets=DB_BUCKETS
+)
+
+LOOP_LAG = Gauge('moviemate_event_loop_lag_seconds', "Последняя задержка event loop")
+LOOP_LAG_HISTOGRAM = Histogram(
+    'moviemate_event_loop_lag_seconds_hist', "Задержка event loop",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+LOOP_BLOCKS = Counter(
+    'moviemate_event_loop_blocks_total', "Блокировки event loop дольше LOOP_BLOCK_THRESHOLD"
+)
+
+def timed(histogram: Histogram, name: str, errors: Optional[Counter] = None, span: Optional[str] = None):
+    """Декоратор асинхронной функции: время выполнения в histogram с меткой name
+    и спан span (по умолчанию name) в трассировке текущего обновления
+    """
+    def decorator(func):
+        child = histogram.labels(name)
+        error_child = errors.labels(name) if errors is not None else None
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                with tracer.span(span or name):
+                    return await func(*args, **kwargs)
+            except Exception:
+                if error_child is not None:
+                    error_child.inc()
+                raise
+            finally:
+                child.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+def handler(name: str):
+    """Декоратор обработчика бота: @metrics.handler('start')"""
+    return timed(HANDLER_LATENCY, name, HANDLER_ERRORS)
+
+def db_operation(name: str):
+    """Декоратор операции с БД: @metrics.db_operation('watchlist_get')"""
+    return timed(DB_LATENCY, name, span=f"db.{name}")
+
+def observe_upstream(endpoint: str, status, seconds: float):
+    UPSTREAM_LATENCY.labels(endpoint).observe(seconds)
+    UPSTREAM_RESPONSES.labels(endpoint, str(status)).inc()
+
+class CacheCollector:
+    """Счетчики кэшей считаются самими кэшами (TTLCache, PosterCache);
+    при каждом чтении /metrics коллектор берет их stats()
+    """
+
+    def __init__(self):
+        self._sources: Dict[str, Callable[[], Dict]] = {}
+
+    def register(self, name: str, stats: Callable[[], Dict]):
+        self._sources[name] = stats
+
+    def collect(self):
+        hits = CounterMetricFamily('moviemate_cache_hits', "Попадания в кэш", labels=['cache', 'namespace'])
+        misses = CounterMetricFamily('moviemate_cache_misses', "Промахи кэша", labels=['cache', 'namespace'])
+        ratio = GaugeMetricFamily('moviemate_cache_hit_ratio', "Доля попаданий в кэш", labels=['cache'])
+        size = GaugeMetricFamily('moviemate_cache_size', "Записей в кэше", labels=['cache'])
+
+        for name, source in list(self._sources.items()):
+            try:
+                stats = source()
+            except Exception as e:
+                logger.error(f"Ошибка чтения статистики кэша {name}: {e}")
+                continue
+
+            # Разбивка по пространствам имен (эндпоинтам), если кэш ее ведет
+            namespaces = stats.get("by_namespace") or {"": stats}
+            for namespace, counter in namespaces.items():
+                hits.add_metric([name, namespace], counter.get("hits", 0))
+                misses.add_metric([name, namespace], counter.get("misses", 0))
+
+            requests_count = stats.get("hits", 0) + stats.get("misses", 0)
+            ratio.add_metric([name], stats["hits"] / requests_count if requests_count else 0.0)
+            size.add_metric([name], stats.get("size", 0))
+
+        yield from (hits, misses, ratio, size)
+
+cache_collector = CacheCollector()
+REGISTRY.register(cache_collector)
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL):
+    """Фоновая задача: насколько позже заказанного просыпается sleep.
+    Большая задержка - кто-то блокирует event loop синхронной работой.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - started - interval, 0.0)
+        LOOP_LAG.set(lag)
+        LOOP_LAG_HISTOGRAM.observe(lag)
+
+_lag_task: Optional[asyncio.Task] = None
+
+def start(port: int = METRICS_PORT, addr: str = METRICS_ADDR) -> bool:
+    """Поднять страницу /metrics и замер задержки event loop (из работающего loop)"""
+    global _lag_task
+
+    if _lag_task is None or _lag_task.done():
+        _lag_task = asyncio.get_running_loop().create_task(monitor_loop_lag())
+
+    if not port:
+        return False
+    try:
+        start_http_server(port, addr=addr)
+    except OSError as e:
+        # Например, второй воркер на той же машине: метрики отдает первый
+        logger.warning(f"⚠️ Не удалось открыть порт метрик {addr}:{port}: {e}")
+        return False
+
+    logger.info(f"📈 Метрики Prometheus: http://{addr}:{port}/metrics")
+    return True
+
+def stop():
+    global _lag_task
+    if _lag_task is not None:
+        _lag_task.cancel()
+        _lag_task = None
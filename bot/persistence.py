@@ -0,0 +1,236 @@
+# bot/persistence.py - хранение user_data / chat_data / bot_data в БД (общее для всех воркеров бота)
+
+import os
+import json
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from telegram.ext import BasePersistence, PersistenceInput
+
+from . import database
+from .database import BotState
+
+logger = logging.getLogger(__name__)
+
+USER = 'user'
+CHAT = 'chat'
+BOT = 'bot'
+
+# Через сколько секунд после первого изменения накопленные данные пишутся в БД
+PERSISTENCE_FLUSH_DELAY = float(os.getenv('PERSISTENCE_FLUSH_DELAY', '2'))
+
+def _dump(data: Dict) -> str:
+    # Значения, которые не сериализуются в JSON, сохраняются строкой
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, default=str)
+
+class SQLPersistence(BasePersistence):
+    """Persistence для PTB поверх нашей БД: user_data (например,
+    context.user_data['waiting_for'] при поиске), chat_data и bot_data
+    переживают перезапуски.
+
+    Запись отложенная и пакетная: изменения копятся и не позже чем
+    через flush_delay секунд пишутся одной транзакцией; неизмененные
+    данные не пишутся вовсе. При остановке бота все сбрасывается в БД.
+
+    shared=True - режим нескольких воркеров за балансировщиком: перед
+    каждым обновлением данные пользователя и чата перечитываются из БД
+    (если у воркера нет своих еще не записанных изменений), а изменения
+    ставятся в очередь записи сразу после обработки (persist_user_data).
+    """
+
+    def __init__(self, shared: bool = False, update_interval: float = 60,
+                 flush_delay: float = PERSISTENCE_FLUSH_DELAY):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=True, chat_data=True, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.shared = shared
+        self.flush_delay = flush_delay
+        # Последнее сохраненное/прочитанное состояние: неизмененные данные не пишутся
+        self._snapshots: Dict[Tuple[str, int], str] = {}
+        # Изменения, ожидающие записи
+        self._dirty: Dict[Tuple[str, int], str] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.written = 0
+
+    # ---------- чтение ----------
+
+    async def _load(self, kind: str, key: Optional[int] = None) -> Dict[int, Dict]:
+        async with database.async_session_scope() as session:
+            statement = select(BotState).where(BotState.kind == kind)
+            if key is not None:
+                statement = statement.where(BotState.key == key)
+            rows = await session.scalars(statement)
+
+            result = {}
+            for row in rows:
+                try:
+                    result[row.key] = json.loads(row.data or '{}')
+                except ValueError:
+                    logger.warning(f"Поврежденные данные {kind} {row.key}, пропускаю")
+                    continue
+                self._snapshots[(kind, row.key)] = row.data
+            return result
+
+    async def _load_all(self, kind: str) -> Dict[int, Dict]:
+        try:
+            return await self._load(kind)
+        except Exception as e:
+            logger.error(f"Ошибка чтения {kind}_data из БД: {e}")
+            return {}
+
+    async def _refresh(self, kind: str, key: int, data: Dict):
+        # Свои незаписанные изменения новее того, что лежит в БД
+        if not self.shared or (kind, key) in self._dirty:
+            return
+
+        try:
+            stored = (await self._load(kind, key)).get(key)
+        except Exception as e:
+            logger.error(f"Ошибка чтения {kind}_data {key}: {e}")
+            return
+
+        if stored is not None:
+            data.clear()
+            data.update(stored)
+
+    # ---------- отложенная запись ----------
+
+    def _mark(self, kind: str, key: int, data: Dict):
+        dumped = _dump(data)
+        if self._snapshots.get((kind, key)) == dumped:
+            # Данные вернулись к сохраненному состоянию - писать нечего
+            self._dirty.pop((kind, key), None)
+            return
+
+        self._dirty[(kind, key)] = dumped
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_delay)
+        await self._write_dirty()
+        # Изменения, пришедшие во время записи или возвращенные после ошибки:
+        # _mark не запускал для них новую запись, пока шла эта
+        if self._dirty:
+            self._flush_task = asyncio.ensure_future(self._delayed_flush())
+
+    async def _write(self, batch: Dict[Tuple[str, int], str]):
+        async with database.async_session_scope() as session:
+            existing = {
+                (row.kind, row.key): row
+                for row in await session.scalars(
+                    select(BotState).where(tuple_(BotState.kind, BotState.key).in_(list(batch)))
+                )
+            }
+            for (kind, key), dumped in batch.items():
+                row = existing.get((kind, key))
+                if row is None:
+                    session.add(BotState(kind=kind, key=key, data=dumped))
+                else:
+                    row.data = dumped
+
+    async def _write_dirty(self):
+        if not self._dirty:
+            return
+
+        batch, self._dirty = self._dirty, {}
+        try:
+            try:
+                await self._write(batch)
+            except IntegrityError:
+                # Строки одновременно создал другой воркер - теперь это обновление
+                await self._write(batch)
+            self._snapshots.update(batch)
+            self.flushes += 1
+            self.written += len(batch)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения состояния бота ({len(batch)} записей): {e}")
+            # Вернем в очередь; более новые изменения, пришедшие за это время, важнее
+            for state_key, dumped in batch.items():
+                self._dirty.setdefault(state_key, dumped)
+
+    async def _drop(self, kind: str, key: int):
+        self._dirty.pop((kind, key), None)
+        self._snapshots.pop((kind, key), None)
+        try:
+            async with database.async_session_scope() as session:
+                await session.execute(delete(BotState).where(BotState.kind == kind, BotState.key == key))
+        except Exception as e:
+            logger.error(f"Ошибка удаления {kind}_data {key}: {e}")
+
+    # ---------- интерфейс BasePersistence ----------
+
+    async def get_user_data(self) -> Dict[int, Dict]:
+        return await self._load_all(USER)
+
+    async def update_user_data(self, user_id: int, data: Dict):
+        self._mark(USER, user_id, data)
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict):
+        """Перед обработкой обновления: подтянуть то, что записали другие воркеры"""
+        await self._refresh(USER, user_id, user_data)
+
+    async def drop_user_data(self, user_id: int):
+        await self._drop(USER, user_id)
+
+    async def get_chat_data(self) -> Dict[int, Dict]:
+        return await self._load_all(CHAT)
+
+    async def update_chat_data(self, chat_id: int, data: Dict):
+        self._mark(CHAT, chat_id, data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict):
+        await self._refresh(CHAT, chat_id, chat_data)
+
+    async def drop_chat_data(self, chat_id: int):
+        await self._drop(CHAT, chat_id)
+
+    async def get_bot_data(self) -> Dict:
+        return (await self._load_all(BOT)).get(0, {})
+
+    async def update_bot_data(self, data: Dict):
+        self._mark(BOT, 0, data)
+
+    async def refresh_bot_data(self, bot_data: Dict):
+        # bot_data общий для всех и меняется редко - не перечитываем на каждое обновление
+        pass
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def get_conversations(self, name: str) -> Dict:
+        return {}
+
+    async def update_conversation(self, name: str, key, new_state):
+        pass
+
+    async def flush(self):
+        """Остановка бота: записать все накопленные изменения"""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self._write_dirty()
+        logger.info(f"✅ Состояние бота сохранено: {self.written} записей за {self.flushes} сбросов")
+
+async def persist_user_data(update, context):
+    """Последняя группа обработчиков: в режиме нескольких воркеров сразу
+    ставит user_data и chat_data в очередь записи, не дожидаясь интервала PTB
+    """
+    persistence = context.application.persistence
+    if not isinstance(persistence, SQLPersistence) or not persistence.shared:
+        return
+
+    user = getattr(update, 'effective_user', None)
+    if user:
+        await persistence.update_user_data(user.id, context.user_data)
+
+    chat = getattr(update, 'effective_chat', None)
+    if chat and context.chat_data is not None:
+        await persistence.update_chat_data(chat.id, context.chat_data)
@@ -0,0 +1,108 @@
+# bot/posters.py - кэш file_id постеров, уже загруженных в Telegram
+
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from . import metrics
+from .kinopoisk_client import kinopoisk_client
+
+logger = logging.getLogger(__name__)
+
+class PosterCache:
+    """file_id постеров по ID фильма КиноПоиска.
+
+    После первой отправки постера по URL Telegram возвращает file_id
+    загруженного изображения; повторные карточки того же фильма
+    отправляются по file_id - Telegram не скачивает картинку заново.
+    Значения хранятся в памяти (LRU) и в колонке movies.poster_file_id.
+    """
+
+    def __init__(self, store=None, max_size: int = 10000):
+        self.store = store
+        self.max_size = max_size
+        self._file_ids: "OrderedDict[int, str]" = OrderedDict()
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._file_ids)
+
+    async def load(self) -> int:
+        """Подгрузить сохраненные file_id из БД (один раз после старта)"""
+        if self._loaded or not self.store:
+            return len(self._file_ids)
+
+        async with self._load_lock:
+            if not self._loaded:
+                stored = await self.store.get_poster_file_ids()
+                # Записанные уже в этом процессе значения свежее сохраненных
+                for film_id, file_id in stored.items():
+                    self._file_ids.setdefault(film_id, file_id)
+                self._trim()
+                self._loaded = True
+                logger.info(f"✅ Загружено file_id постеров: {len(stored)}")
+        return len(self._file_ids)
+
+    def get(self, film_id) -> Optional[str]:
+        """file_id постера или None, если фильм еще не отправлялся"""
+        try:
+            file_id = self._file_ids.get(int(film_id))
+        except (TypeError, ValueError):
+            return None
+
+        if file_id is None:
+            self.misses += 1
+            return None
+
+        self._file_ids.move_to_end(int(film_id))
+        self.hits += 1
+        return file_id
+
+    async def remember(self, film_id, file_id: str):
+        """Запомнить file_id после успешной отправки постера"""
+        await self.remember_many({film_id: file_id})
+
+    async def remember_many(self, file_ids: Dict):
+        """Запомнить file_id нескольких постеров (альбома) одной записью в БД"""
+        changed = {}
+        for film_id, file_id in file_ids.items():
+            try:
+                film_id = int(film_id)
+            except (TypeError, ValueError):
+                continue
+
+            if not file_id or self._file_ids.get(film_id) == file_id:
+                continue
+
+            self._file_ids[film_id] = file_id
+            self._file_ids.move_to_end(film_id)
+            changed[film_id] = file_id
+        self._trim()
+
+        if changed and self.store:
+            await self.store.save_poster_file_ids(changed)
+
+    async def forget(self, film_id):
+        """Сбросить file_id, который Telegram больше не принимает"""
+        try:
+            film_id = int(film_id)
+        except (TypeError, ValueError):
+            return
+
+        if self._file_ids.pop(film_id, None) and self.store:
+            await self.store.save_poster_file_id(film_id, None)
+
+    def _trim(self):
+        while len(self._file_ids) > self.max_size:
+            self._file_ids.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._file_ids), "hits": self.hits, "misses": self.misses}
+
+# Глобальный экземпляр (пишет в ту же таблицу movies, что и клиент КиноПоиска)
+poster_cache = PosterCache(kinopoisk_client.store)
+metrics.cache_collector.register("posters", poster_cache.stats)
@@ -0,0 +1,129 @@
+# bot/rate_limit.py - ограничение частоты запросов и дневной квоты API КиноПоиска
+
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты запросов: пользовательские важнее фоновой подгрузки каталога
+INTERACTIVE = 0
+BACKGROUND = 1
+
+_priority: ContextVar = ContextVar('kinopoisk_priority', default=INTERACTIVE)
+
+def current_priority() -> int:
+    return _priority.get()
+
+@contextmanager
+def background_priority():
+    """Все запросы к API внутри блока (и в созданных в нем задачах) - фоновые"""
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+class TokenBucket:
+    """Token bucket на весь процесс: не больше rate запросов в секунду
+    со всплесками до capacity.
+
+    Фоновые запросы не трогают последние background_reserve токенов и
+    пропускают вперед ожидающие пользовательские запросы.
+    """
+
+    def __init__(self, rate: float, capacity: float, background_reserve: float = 0):
+        self.rate = rate
+        self.capacity = capacity
+        self.background_reserve = min(background_reserve, max(capacity - 1, 0))
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._interactive_waiting = 0
+        self.waited = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, priority: int = INTERACTIVE):
+        """Дождаться токена"""
+        background = priority == BACKGROUND
+        needed = 1 + (self.background_reserve if background else 0)
+        started = time.monotonic()
+
+        if not background:
+            self._interactive_waiting += 1
+        try:
+            while True:
+                self._refill()
+                if self._tokens >= needed and not (background and self._interactive_waiting):
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep(max(needed - self._tokens, 1) / self.rate)
+        finally:
+            if not background:
+                self._interactive_waiting -= 1
+            self.waited += time.monotonic() - started
+
+class DailyQuota:
+    """Учет дневной квоты API-ключа.
+
+    Фоновые запросы останавливаются, когда остается background_reserve
+    квоты; при остатке ниже low_ratio клиент по возможности отвечает из
+    кэша, а при нулевом остатке - только из кэша и запасных данных.
+    """
+
+    def __init__(self, limit: int, background_reserve: float = 0.3, low_ratio: float = 0.1):
+        self.limit = limit
+        self.background_reserve = int(limit * background_reserve)
+        self.low_threshold = int(limit * low_ratio)
+        self.used = 0
+        self.rejected = 0
+        self._day = date.today()
+
+    def _roll_day(self):
+        today = date.today()
+        if today != self._day:
+            self._day = today
+            self.used = 0
+
+    @property
+    def remaining(self) -> int:
+        self._roll_day()
+        return max(self.limit - self.used, 0)
+
+    @property
+    def is_low(self) -> bool:
+        return self.remaining <= self.low_threshold
+
+    @property
+    def is_exhausted(self) -> bool:
+        return self.remaining <= 0
+
+    def try_consume(self, priority: int = INTERACTIVE) -> bool:
+        """Списать один запрос, если для этого приоритета еще есть бюджет"""
+        floor = self.background_reserve if priority == BACKGROUND else 0
+        if self.remaining <= floor:
+            self.rejected += 1
+            return False
+        self.used += 1
+        return True
+
+    def sync(self, used: int, limit: int = None):
+        """Подтянуть фактический расход с сервера (например, после перезапуска)"""
+        self._roll_day()
+        if limit:
+            ratio = self.background_reserve / self.limit if self.limit else 0
+            low_ratio = self.low_threshold / self.limit if self.limit else 0
+            self.limit = limit
+            self.background_reserve = int(limit * ratio)
+            self.low_threshold = int(limit * low_ratio)
+        self.used = max(self.used, used)
+
+    def stats(self) -> Dict[str, int]:
+        return {"limit": self.limit, "used": self.used, "remaining": self.remaining, "rejected": self.rejected}
@@ -0,0 +1,122 @@
+# bot/resilience.py - повторы, circuit breaker и hedged-запросы для API КиноПоиска
+
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Ответы, после которых запрос стоит повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def backoff_delay(attempt: int, base: float = 0.3, cap: float = 3.0) -> float:
+    """Экспоненциальная задержка с полным джиттером (attempt с нуля)"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class CircuitBreaker:
+    """Размыкатель: после failure_threshold ошибок подряд запросы к API
+    не выполняются reset_timeout секунд, затем пропускается один пробный.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """Можно ли сейчас обращаться к API"""
+        if self.state == self.CLOSED:
+            return True
+
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+
+        self.rejected += 1
+        return False
+
+    def release_probe(self):
+        """Пробный запрос завершился без исхода (429, отказ квоты, отмена):
+        следующий вызов снова может стать пробным
+        """
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info("✅ КиноПоиск снова отвечает, размыкатель закрыт")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"⚠️ КиноПоиск не отвечает ({self.failures} ошибок подряд), размыкатель открыт")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+class LatencyTracker:
+    """Скользящее окно задержек ответов API для оценки перцентилей"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """q-перцентиль (0..1) или None, пока данных мало"""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+async def hedged(call: Callable[[], Awaitable[T]], delay: Optional[float],
+                 can_hedge: Callable[[], bool] = lambda: True,
+                 hedge: Optional[Callable[[], Awaitable[T]]] = None) -> T:
+    """Выполнить call; если он не завершился за delay секунд, запустить
+    второй такой же (hedge, по умолчанию call) и вернуть первый успешный результат.
+    """
+    first = asyncio.ensure_future(call())
+    if delay is None:
+        return await first
+
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done or not can_hedge():
+        return await first
+
+    second = asyncio.ensure_future((hedge or call)())
+    pending = {first, second}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
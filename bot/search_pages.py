@@ -0,0 +1,164 @@
+# bot/search_pages.py - постраничный просмотр результатов поиска
+
+import os
+import math
+import time
+import asyncio
+import logging
+import secrets
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from .films import Film, to_films
+from .kinopoisk_client import kinopoisk_client
+from .rate_limit import background_priority
+
+logger = logging.getLogger(__name__)
+
+# Фильмов на одной странице сообщения
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', '5'))
+
+# Сколько минут кнопки листания работают после поиска
+SEARCH_SESSION_MINUTES = float(os.getenv('SEARCH_SESSION_MINUTES', '30'))
+
+class SearchResults:
+    """Результаты одного поиска: все загруженные страницы API подряд"""
+
+    def __init__(self, query: str, result: Dict):
+        self.query = query
+        self.total = result.get('searchFilmsCountResult', 0) or 0
+        self.api_pages = result.get('pagesCount', 1) or 1
+        # Результаты из локального индекса названий, без запроса к API
+        self.local = bool(result.get('local'))
+        self.loaded_pages = 1
+        self.films: List[Film] = []
+        self.created_at = time.monotonic()
+        self._seen_ids = set()
+        self._loading: Optional[asyncio.Task] = None
+        self._add(result.get('films', []))
+
+    def _add(self, films: List[Dict]):
+        for film in to_films(films):
+            if film.id not in self._seen_ids:
+                self._seen_ids.add(film.id)
+                self.films.append(film)
+
+    @property
+    def has_more(self) -> bool:
+        """Есть ли еще не загруженные страницы API"""
+        return self.loaded_pages < self.api_pages
+
+    def find(self, film_id) -> Optional[Film]:
+        film_id = str(film_id)
+        for film in self.films:
+            if str(film.id) == film_id:
+                return film
+        return None
+
+class SearchPager:
+    """Результаты поисков по коротким токенам для callback-кнопок.
+
+    Страница сообщения нарезается из уже загруженных фильмов; когда
+    пользователь подходит к концу загруженного, следующая страница
+    API подгружается в фоне, и листание не ждет запроса к КиноПоиску.
+
+    Сессии хранятся в памяти процесса: при нескольких воркерах балансировщик
+    должен направлять обновления одного чата в один и тот же воркер.
+    """
+
+    def __init__(self, client, page_size: int = SEARCH_PAGE_SIZE,
+                 ttl_minutes: float = SEARCH_SESSION_MINUTES, max_sessions: int = 1000):
+        self.client = client
+        self.page_size = page_size
+        self.ttl = ttl_minutes * 60
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, SearchResults]" = OrderedDict()
+
+    def start(self, query: str, result: Dict) -> str:
+        """Запомнить результаты первой страницы поиска, вернуть токен"""
+        token = secrets.token_hex(4)
+        self._sessions[token] = SearchResults(query, result)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return token
+
+    def get(self, token: str) -> Optional[SearchResults]:
+        results = self._sessions.get(token)
+        if results is None:
+            return None
+        if time.monotonic() - results.created_at > self.ttl:
+            del self._sessions[token]
+            return None
+        self._sessions.move_to_end(token)
+        return results
+
+    def pages_count(self, results: SearchResults) -> int:
+        """Сколько страниц можно пролистать (по числу найденных фильмов)"""
+        available = len(results.films) if not results.has_more else max(results.total, len(results.films))
+        return max(math.ceil(available / self.page_size), 1)
+
+    async def _load_next(self, results: SearchResults) -> bool:
+        """Загрузить следующую страницу API. False - API не ответил (квота, сбой)"""
+        page = results.loaded_pages + 1
+        result = await self.client.search_films(results.query, page=page)
+        # Ответ API всегда содержит pagesCount; без него это отказ квоты или сбой,
+        # а не конец результатов - страницу можно будет запросить снова
+        if result.get('degraded') or 'error' in result or 'pagesCount' not in result:
+            return False
+
+        films = result.get('films', [])
+        if films:
+            results._add(films)
+            results.loaded_pages = page
+        else:
+            # Страниц меньше, чем обещано - дальше не листаем
+            results.api_pages = results.loaded_pages
+        return True
+
+    def _schedule_load(self, results: SearchResults, background: bool = False) -> Optional[asyncio.Task]:
+        if results._loading is None or results._loading.done():
+            if not results.has_more:
+                return None
+            if background:
+                # Подгрузка впрок - фоновая: не занимает резерв пользовательских запросов
+                with background_priority():
+                    results._loading = asyncio.ensure_future(self._load_next(results))
+            else:
+                results._loading = asyncio.ensure_future(self._load_next(results))
+        return results._loading
+
+    async def page(self, token: str, index: int) -> Optional[Tuple[SearchResults, List[Film], int]]:
+        """Фильмы страницы index (с нуля): (результаты, фильмы, номер страницы)"""
+        results = self.get(token)
+        if results is None:
+            return None
+
+        index = max(index, 0)
+        end = (index + 1) * self.page_size
+
+        # Страница еще не загружена: ждем подгрузку впрок, если она идет,
+        # иначе загружаем с обычным приоритетом - эту страницу ждет пользователь
+        while end > len(results.films) and results.has_more:
+            prefetch = results._loading is not None and not results._loading.done()
+            task = self._schedule_load(results)
+            try:
+                loaded = await task
+            except Exception as e:
+                logger.error(f"Ошибка подгрузки страницы поиска: {e}")
+                break
+            if not loaded and not prefetch:
+                # API не ответил - показываем то, что уже загружено
+                break
+
+        index = min(index, self.pages_count(results) - 1)
+        start = index * self.page_size
+        films = results.films[start:start + self.page_size]
+
+        # Следующая страница сообщения выходит за загруженное - подгружаем API впрок
+        if (index + 2) * self.page_size > len(results.films):
+            self._schedule_load(results, background=True)
+
+        return results, films, index
+
+# Глобальный экземпляр
+search_pager = SearchPager(kinopoisk_client)
@@ -0,0 +1,275 @@
+# bot/title_index.py - индекс названий уже встречавшихся фильмов для подсказок без API
+
+import re
+import sys
+import logging
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from .films import Film
+from .kinopoisk_client import kinopoisk_client
+
+logger = logging.getLogger(__name__)
+
+_NON_WORD = re.compile(r'[^\w]+')
+
+def normalize_title(text: str) -> str:
+    """Название для сравнения: нижний регистр, ё -> е, без знаков препинания"""
+    text = (text or '').lower().replace('ё', 'е')
+    return ' '.join(_NON_WORD.sub(' ', text).split())
+
+def trigrams(text: str) -> Set[str]:
+    """Триграммы нормализованной строки (с границами слов)"""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Расстояние Левенштейна; если оно больше limit - возвращает limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if len(a) > len(b):
+        a, b = b, a
+
+    previous = list(range(len(a) + 1))
+    for j, char_b in enumerate(b, 1):
+        current = [j]
+        for i, char_a in enumerate(a, 1):
+            current.append(min(
+                previous[i] + 1,
+                current[i - 1] + 1,
+                previous[i - 1] + (char_a != char_b),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+def allowed_typos(query: str) -> int:
+    """Сколько опечаток допускается в запросе такой длины"""
+    length = len(query.replace(' ', ''))
+    if length < 4:
+        return 0
+    if length <= 6:
+        return 1
+    if length <= 12:
+        return 2
+    return 3
+
+class TitleIndex:
+    """Префиксный, триграммный и нечеткий (с опечатками) индекс названий
+    (nameRu / nameEn / nameOriginal).
+
+    Заполняется фильмами из ответов API (поиск, топ, жанры, детали) и из
+    таблицы movies при старте. Хранит краткие записи Film (без описания
+    и жанров) - их хватает для подсказки, полная карточка берется уже по ID.
+    """
+
+    def __init__(self, max_films: int = 100000):
+        self.max_films = max_films
+        self._films: Dict[int, Film] = {}
+        self._names: Dict[int, Set[str]] = {}
+        # (ключ, ID): ключи - название целиком и каждый его хвост с начала слова
+        self._keys: List[Tuple[str, int]] = []
+        self._sorted = True
+        # Триграмма -> ID фильмов; массивы uint32 занимают в разы меньше множеств
+        self._trigrams: Dict[str, array] = {}
+
+    def __len__(self) -> int:
+        return len(self._films)
+
+    def add_films(self, films: List[Union[Film, Dict]]):
+        """Добавить фильмы в индекс (повторные - только обновляют данные)"""
+        for film in films:
+            film = Film.from_api(film).brief()
+            if not film.id:
+                continue
+
+            known = self._films.get(film.id)
+            if known is None:
+                if len(self._films) >= self.max_films:
+                    continue
+                self._films[film.id] = film
+                self._names[film.id] = set()
+            elif known != film:
+                self._films[film.id] = known.merge(film)
+
+            for name in film.names:
+                self._add_name(film.id, name)
+
+    def _add_name(self, film_id: int, title: str):
+        name = normalize_title(title)
+        names = self._names[film_id]
+        if not name or name in names:
+            return
+
+        # Триграммы, которых еще нет у других названий фильма: ID в списке не повторяется
+        known_grams = set()
+        for other in names:
+            known_grams |= trigrams(other)
+        names.add(sys.intern(name))
+
+        words = name.split(' ')
+        for i in range(len(words)):
+            self._keys.append((sys.intern(' '.join(words[i:])), film_id))
+        self._sorted = False
+
+        for gram in trigrams(name) - known_grams:
+            postings = self._trigrams.get(gram)
+            if postings is None:
+                postings = self._trigrams[sys.intern(gram)] = array('I')
+            postings.append(film_id)
+
+    def _rank(self, film_ids) -> List[Film]:
+        films = [self._films[film_id] for film_id in film_ids]
+        films.sort(key=lambda film: film.rating or 0, reverse=True)
+        return films
+
+    def prefix(self, query: str, limit: int = 10) -> List[Film]:
+        """Фильмы, в названии которых есть слово, начинающееся с query"""
+        query = normalize_title(query)
+        if not query:
+            return []
+
+        if not self._sorted:
+            self._keys.sort()
+            self._sorted = True
+
+        found = {}
+        keys = self._keys
+        # Берем с запасом, чтобы потом отсортировать по рейтингу
+        for i in range(bisect_left(keys, (query, 0)), len(keys)):
+            key, film_id = keys[i]
+            if not key.startswith(query) or len(found) >= limit * 5:
+                break
+            found[film_id] = True
+        return self._rank(found)[:limit]
+
+    def similar(self, query: str, limit: int = 10, min_score: float = 0.5) -> List[Film]:
+        """Фильмы с похожим названием (доля общих триграмм не меньше min_score)"""
+        query = normalize_title(query)
+        if len(query) < 3:
+            return []
+
+        grams = trigrams(query)
+        counts = Counter()
+        for gram in grams:
+            postings = self._trigrams.get(gram)
+            if postings:
+                counts.update(postings)
+
+        needed = len(grams) * min_score
+        scored = [(count, film_id) for film_id, count in counts.items() if count >= needed]
+        scored.sort(key=lambda item: (item[0], self._films[item[1]].rating or 0), reverse=True)
+        return [self._films[film_id] for _, film_id in scored[:limit]]
+
+    def search(self, query: str, limit: int = 10) -> List[Film]:
+        """Подсказки: сначала совпадения по началу слов, затем похожие названия"""
+        films = self.prefix(query, limit)
+        if len(films) < limit:
+            seen = {film.id for film in films}
+            for film in self.similar(query, limit):
+                if film.id not in seen:
+                    seen.add(film.id)
+                    films.append(film)
+        return films[:limit]
+
+    def _distance(self, query: str, film_id: int, limit: int) -> int:
+        """Наименьшее расстояние от запроса до названия фильма или до части
+        названия из стольких же слов подряд ("зеленя" ~ "зеленая миля",
+        "green mile" ~ "the green mile")
+        """
+        words_count = query.count(' ') + 1
+        best = limit + 1
+        for name in self._names[film_id]:
+            best = min(best, edit_distance(query, name, limit))
+            words = name.split(' ')
+            for start in range(len(words) - words_count + 1):
+                if best == 0:
+                    return 0
+                part = ' '.join(words[start:start + words_count])
+                if part != name:
+                    best = min(best, edit_distance(query, part, limit))
+        return best
+
+    def exact(self, query: str) -> List[Film]:
+        """Фильмы, одно из названий которых совпадает с запросом"""
+        query = normalize_title(query)
+        if not query:
+            return []
+
+        if not self._sorted:
+            self._keys.sort()
+            self._sorted = True
+
+        found = {}
+        keys = self._keys
+        for i in range(bisect_left(keys, (query, 0)), len(keys)):
+            key, film_id = keys[i]
+            if key != query:
+                break
+            # Ключ может быть и хвостом другого названия - нужно полное совпадение
+            if query in self._names[film_id]:
+                found[film_id] = True
+        return self._rank(found)
+
+    def match(self, query: str, limit: int = 10) -> List[Film]:
+        """Ответ на поиск без API: точное совпадение названия (и фильмы,
+        названия которых с него начинаются). Без точного совпадения - пусто:
+        индекс знает не все фильмы, и похожее название может оказаться
+        другим фильмом. Опечатки - в fuzzy(), для подсказок
+        """
+        films = self.exact(query)
+        if not films:
+            return []
+
+        seen = {film.id for film in films}
+        for film in self.prefix(query, limit):
+            if film.id not in seen and any(
+                name.startswith(normalize_title(query)) for name in self._names[film.id]
+            ):
+                seen.add(film.id)
+                films.append(film)
+        return films[:limit]
+
+    def fuzzy(self, query: str, limit: int = 10, max_typos: Optional[int] = None) -> List[Film]:
+        """Фильмы, название которых отличается от запроса не больше чем на
+        max_typos правок (по умолчанию - в зависимости от длины запроса)
+        """
+        query = normalize_title(query)
+        if max_typos is None:
+            max_typos = allowed_typos(query)
+        if not max_typos:
+            return self.exact(query)[:limit]
+
+        # Одна правка меняет не больше трех триграмм - остальные у кандидата обязаны быть
+        grams = trigrams(query)
+        counts = Counter()
+        for gram in grams:
+            postings = self._trigrams.get(gram)
+            if postings:
+                counts.update(postings)
+
+        needed = max(len(grams) - 3 * max_typos, 1)
+        scored = []
+        for film_id, count in counts.items():
+            if count < needed:
+                continue
+            distance = self._distance(query, film_id, max_typos)
+            if distance <= max_typos:
+                scored.append((distance, -(self._films[film_id].rating or 0), film_id))
+
+        scored.sort()
+        return [self._films[film_id] for _, _, film_id in scored[:limit]]
+
+    async def load(self, store) -> int:
+        """Заполнить индекс фильмами из таблицы movies"""
+        if store:
+            self.add_films(await store.get_brief_films())
+            logger.info(f"✅ Индекс названий: {len(self._films)} фильмов")
+        return len(self._films)
+
+# Глобальный экземпляр: пополняется каждым свежим ответом API
+title_index = TitleIndex()
+kinopoisk_client.add_listener(title_index.add_films)
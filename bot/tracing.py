@@ -0,0 +1,195 @@
+# bot/tracing.py - трассировка обновлений (спаны) и сторож блокировок event loop
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import threading
+import traceback
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, List, Optional
+
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних спанов держать в памяти для выгрузки
+TRACE_BUFFER = int(os.getenv('TRACE_BUFFER', '20000'))
+# Куда записать трассировку при остановке бота (пусто - не записывать)
+TRACE_FILE = os.getenv('TRACE_FILE', '')
+# Блокировка event loop дольше порога (секунды) записывается вместе со стеком
+LOOP_BLOCK_THRESHOLD = float(os.getenv('LOOP_BLOCK_THRESHOLD', '0.25'))
+
+# Обновление, к которому относится текущий код (наследуется задачами)
+_current_update: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar(
+    'current_update', default=None
+)
+
+class Tracer:
+    """Спаны в формате Chrome Trace Event: файл открывается в
+    https://ui.perfetto.dev или chrome://tracing.
+
+    Каждое обновление - отдельная дорожка (tid = update_id), на ней
+    вложенные спаны: обработчик → запрос к API → отправка в Telegram.
+    Блокировки event loop - на отдельной дорожке "event loop" со стеком.
+    """
+
+    LOOP_TRACK = 0
+
+    def __init__(self, max_events: int = TRACE_BUFFER):
+        self._events: Deque[Dict] = deque(maxlen=max_events)
+        self._origin = time.perf_counter()
+        # Обновления в обработке: сторож пишет их в лог при блокировке
+        self.active: Dict[int, Dict[str, Any]] = {}
+
+    def _ts(self, moment: float) -> int:
+        return int((moment - self._origin) * 1_000_000)
+
+    def add(self, name: str, started: float, finished: float, track: int, args: Dict):
+        self._events.append({
+            "name": name, "ph": "X", "pid": 1, "tid": track,
+            "ts": self._ts(started), "dur": max(self._ts(finished) - self._ts(started), 1),
+            "args": args,
+        })
+
+    @contextmanager
+    def update(self, update_id: int, user_id: Optional[int] = None):
+        """Корневой спан обновления: все спаны внутри попадают на его дорожку"""
+        info = {"update_id": update_id, "user_id": user_id}
+        token = _current_update.set(info)
+        self.active[update_id] = info
+        started = time.perf_counter()
+        try:
+            yield info
+        finally:
+            self.add("update", started, time.perf_counter(), update_id, dict(info))
+            self.active.pop(update_id, None)
+            _current_update.reset(token)
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """Вложенный спан текущего обновления; вне обновления - дорожка 0"""
+        info = _current_update.get()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            args = dict(attrs)
+            if info:
+                args.update(info)
+            self.add(name, started, time.perf_counter(), info["update_id"] if info else self.LOOP_TRACK, args)
+
+    def export(self) -> Dict:
+        metadata = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": self.LOOP_TRACK,
+                     "args": {"name": "event loop"}}]
+        return {"traceEvents": metadata + list(self._events), "displayTimeUnit": "ms"}
+
+    def dump(self, path: str) -> int:
+        """Записать накопленные спаны в JSON-файл. Возвращает число событий"""
+        data = self.export()
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False)
+        return len(data["traceEvents"])
+
+    def clear(self):
+        self._events.clear()
+
+class TracingRequest(HTTPXRequest):
+    """HTTPXRequest, у которого каждый вызов Bot API - спан telegram.<метод>"""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        with tracer.span(f"telegram.{url.rsplit('/', 1)[-1]}"):
+            return await super().do_request(url, method, *args, **kwargs)
+
+class LoopWatchdog:
+    """Сторож event loop в отдельном потоке.
+
+    Задача в loop каждые threshold/2 секунды отмечает, что loop жив.
+    Если отметки нет дольше threshold, поток снимает стек потока loop -
+    это и есть код, который блокирует (синхронный ввод-вывод, тяжелые
+    вычисления). Одна блокировка записывается один раз: в лог, в метрики
+    и в трассировку на дорожку "event loop".
+    """
+
+    def __init__(self, threshold: float = LOOP_BLOCK_THRESHOLD):
+        self.threshold = threshold
+        self.blocks = 0
+        self._heartbeat = time.perf_counter()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    async def _beat(self):
+        while True:
+            self._heartbeat = time.perf_counter()
+            await asyncio.sleep(self.threshold / 2)
+
+    def start(self):
+        """Запустить из работающего event loop"""
+        if self._thread is not None or self.threshold <= 0:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.perf_counter()
+        self._task = asyncio.get_running_loop().create_task(self._beat())
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+        logger.info(f"✅ Сторож event loop запущен (порог {self.threshold * 1000:.0f} мс)")
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def _stack(self) -> List[str]:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        return traceback.format_stack(frame) if frame is not None else []
+
+    def _watch(self):
+        blocked_since = None
+        stack: List[str] = []
+        updates: List[int] = []
+
+        while not self._stopped.wait(self.threshold / 4):
+            heartbeat = self._heartbeat
+            stalled = time.perf_counter() - heartbeat
+
+            if stalled > self.threshold:
+                if blocked_since != heartbeat:
+                    # Новая блокировка: стек снимаем, пока loop еще стоит
+                    blocked_since = heartbeat
+                    stack = self._stack()
+                    updates = list(tracer.active)
+                continue
+
+            if blocked_since is not None:
+                self._report(blocked_since, heartbeat, stack, updates)
+                blocked_since = None
+
+    def _report(self, started: float, resumed: float, stack: List[str], updates: List[int]):
+        # Длительность - от последней отметки до возобновления (с точностью до threshold/2)
+        duration = resumed - started
+        self.blocks += 1
+        logger.warning(
+            f"🐢 Event loop заблокирован на {duration * 1000:.0f} мс, обновления в обработке: {updates}\n"
+            + ''.join(stack)
+        )
+
+        from . import metrics
+        metrics.LOOP_BLOCKS.inc()
+
+        tracer.add("loop blocked", started, resumed, Tracer.LOOP_TRACK,
+                   {"duration_ms": round(duration * 1000), "updates": updates, "stack": ''.join(stack)})
+
+# Глобальные экземпляры
+tracer = Tracer()
+watchdog = LoopWatchdog()
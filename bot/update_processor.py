@@ -0,0 +1,82 @@
+# bot/update_processor.py - параллельная обработка обновлений с порядком внутри чата
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from .tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Обновления разных чатов обрабатываются параллельно, не больше
+    max_concurrent_updates одновременно; обновления одного чата (или
+    пользователя, если чата нет - inline-запросы) - строго по очереди.
+
+    Обновление сначала ждет очереди своего чата и только потом занимает
+    слот, поэтому длинная очередь одного чата не блокирует остальных.
+    Всего принятых в обработку обновлений - не больше max_pending.
+    """
+
+    def __init__(self, max_concurrent_updates: int, max_pending: int = 1000):
+        # Семафор базового класса ограничивает принятые обновления (ожидающие + выполняемые)
+        super().__init__(max(max_pending, max_concurrent_updates))
+        self.concurrency = max_concurrent_updates
+        self._running = asyncio.Semaphore(max_concurrent_updates)
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._queued: Dict[Hashable, int] = {}
+
+    @staticmethod
+    def _key(update: Any) -> Optional[Hashable]:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat:
+            return ('chat', update.effective_chat.id)
+        if update.effective_user:
+            return ('user', update.effective_user.id)
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        if not isinstance(update, Update):
+            await self._process(update, coroutine)
+            return
+
+        # Корневой спан трассировки: от приема обновления (включая ожидание очереди) до конца обработки
+        user = update.effective_user
+        with tracer.update(update.update_id, user.id if user else None):
+            await self._process(update, coroutine)
+
+    async def _process(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self._key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            return
+
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._queued[key] = self._queued.get(key, 0) + 1
+
+        try:
+            async with lock:
+                async with self._running:
+                    await coroutine
+        finally:
+            # Очередь чата опустела - блокировка больше не нужна
+            self._queued[key] -= 1
+            if not self._queued[key]:
+                del self._queued[key]
+                del self._locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, int]:
+        return {"chats": len(self._locks), "queued": sum(self._queued.values())}
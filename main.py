@@ -8,13 +8,50 @@ from datetime import datetime
 # Добавляем текущую директорию в путь Python
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Логирование настраивается при запуске (setup_logging), после загрузки .env
 logger = logging.getLogger(__name__)
 
+ALLOWED_UPDATES = ['message', 'callback_query', 'inline_query']
+
+def run_webhook(application):
+    """Запуск HTTP-сервера для webhook Telegram"""
+    webhook_url = os.getenv('WEBHOOK_URL')
+    if not webhook_url:
+        logger.error("❌ BOT_MODE=webhook, но WEBHOOK_URL не установлен!")
+        logger.error("Укажите публичный адрес бота, например https://moviemate.up.railway.app")
+        sys.exit(1)
+
+    url_path = os.getenv('WEBHOOK_PATH', 'telegram').strip('/')
+    port = int(os.getenv('PORT', '8080'))
+
+    logger.info(f"🔄 Запуск бота в режиме webhook на порту {port}...")
+    application.run_webhook(
+        listen='0.0.0.0',
+        port=port,
+        url_path=url_path,
+        webhook_url=f"{webhook_url.rstrip('/')}/{url_path}",
+        # Telegram присылает секрет в заголовке - чужие запросы отклоняются
+        secret_token=os.getenv('WEBHOOK_SECRET') or None,
+        allowed_updates=ALLOWED_UPDATES,
+        # Воркеры перезапускаются по одному - накопленные обновления не теряем
+        drop_pending_updates=False
+    )
+
+def routing_check(workers: int, index: int):
+    """Проверка липкой маршрутизации: обновления чата приходят в воркер chat_id % workers.
+
+    Сессии листания поиска и лимиты API живут в памяти воркера, поэтому
+    обновления одного чата должны всегда попадать в один и тот же воркер.
+    """
+    async def check(update, context):
+        chat = update.effective_chat
+        if chat and chat.id % workers != index:
+            logger.warning(
+                f"⚠️ Обновление чата {chat.id} пришло в воркер {index}, ожидался {chat.id % workers}: "
+                f"настройте балансировщик на маршрутизацию по chat_id"
+            )
+    return check
+
 def check_api_status():
     """Проверка статуса API"""
     try:
@@ -32,6 +69,52 @@ def check_api_status():
         logger.error(f"❌ Ошибка импорта КиноПоиск клиента: {e}")
         return False
 
+def register_handlers(application):
+    """Регистрация обработчиков бота (одинаково для polling и webhook)"""
+    from telegram.ext import CommandHandler, MessageHandler, filters, CallbackQueryHandler, InlineQueryHandler, TypeHandler
+    from telegram import Update
+    from bot import handlers
+    from bot.persistence import persist_user_data
+
+    # Регистрируем команды - ИСПРАВЛЕНО!
+    application.add_handler(CommandHandler("start", handlers.start))
+    application.add_handler(CommandHandler("help", handlers.help_command))
+    application.add_handler(CommandHandler("search", handlers.search_command))
+    application.add_handler(CommandHandler("top", handlers.show_top250))
+    application.add_handler(CommandHandler("random", handlers.random_real_movie))  # ✅ ИСПРАВЛЕНО
+    application.add_handler(CommandHandler("watchlist", handlers.show_watchlist))
+
+    logger.info("✅ Все команды зарегистрированы")
+
+    # Inline кнопки
+    application.add_handler(CallbackQueryHandler(handlers.button_handler))
+    logger.info("✅ Обработчик кнопок зарегистрирован")
+
+    # Inline-режим (@bot название): подсказки фильмов
+    application.add_handler(InlineQueryHandler(handlers.inline_query_handler))
+    logger.info("✅ Обработчик inline-запросов зарегистрирован")
+
+    # Текстовые сообщения
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handlers.handle_message))
+    logger.info("✅ Обработчик текстовых сообщений зарегистрирован")
+
+    # Обработчик ошибок
+    async def error_handler(update, context):
+        logger.error(f"Ошибка в боте: {context.error}", exc_info=True)
+
+    application.add_error_handler(error_handler)
+
+    # Последняя группа: в режиме нескольких воркеров user_data сразу пишется в БД
+    application.add_handler(TypeHandler(Update, persist_user_data), group=100)
+
+    # Несколько воркеров: проверяем, что чат всегда попадает в свой воркер
+    workers = int(os.getenv('BOT_WORKERS', '1'))
+    worker_index = os.getenv('BOT_WORKER_INDEX')
+    if workers > 1 and worker_index:
+        application.add_handler(TypeHandler(Update, routing_check(workers, int(worker_index))), group=-1)
+    elif workers > 1:
+        logger.warning("⚠️ BOT_WORKERS > 1 без BOT_WORKER_INDEX: маршрутизация по чатам не проверяется")
+
 def main():
     """Основная функция запуска"""
     logger.info("=" * 50)
@@ -78,47 +161,74 @@ def main():
         logger.error(f"❌ Ошибка импорта модулей: {e}")
         sys.exit(1)
 
-    # Инициализация базы данных
-    try:
-        database.init_db()
-        logger.info("✅ База данных инициализирована")
-    except Exception as e:
-        logger.warning(f"⚠️ Ошибка инициализации БД: {e}")
-
     # Создаем приложение Telegram
     try:
-        from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler
+        from telegram.ext import Application
+        from bot.persistence import SQLPersistence
+        from bot.update_processor import PerChatUpdateProcessor
+        from bot.tracing import TracingRequest
 
-        application = Application.builder().token(token).build()
-        logger.info("✅ Приложение Telegram создано")
+        # Режим получения обновлений: polling (один процесс) или webhook (несколько воркеров за балансировщиком)
+        bot_mode = os.getenv('BOT_MODE', 'polling').lower()
 
-        # Регистрируем команды - ИСПРАВЛЕНО!
-        application.add_handler(CommandHandler("start", handlers.start))
-        application.add_handler(CommandHandler("help", handlers.help_command))
-        application.add_handler(CommandHandler("search", handlers.search_command))
-        application.add_handler(CommandHandler("top", handlers.show_top250))
-        application.add_handler(CommandHandler("random", handlers.random_real_movie))  # ✅ ИСПРАВЛЕНО
-        application.add_handler(CommandHandler("watchlist", handlers.show_watchlist))
+        # Состояние диалогов (user_data, chat_data) хранится в БД и пишется пакетами;
+        # при нескольких воркерах оно перечитывается перед каждым обновлением
+        shared = os.getenv('PERSISTENCE_SHARED', 'true' if bot_mode == 'webhook' else 'false').lower() == 'true'
+        persistence = SQLPersistence(
+            shared=shared,
+            update_interval=float(os.getenv('PERSISTENCE_INTERVAL', '5')),
+            flush_delay=float(os.getenv('PERSISTENCE_FLUSH_DELAY', '0.3' if shared else '2'))
+        )
+
+        # Разные чаты обрабатываются параллельно, сообщения одного чата - по порядку
+        update_processor = PerChatUpdateProcessor(int(os.getenv('UPDATE_CONCURRENCY', '16')))
+
+        application = (
+            Application.builder()
+            .token(token)
+            # Вызовы Bot API попадают в трассировку обновлений
+            .request(TracingRequest(connection_pool_size=256))
+            .persistence(persistence)
+            .concurrent_updates(update_processor)
+            .build()
+        )
+        logger.info("✅ Приложение Telegram создано")
 
-        logger.info("✅ Все команды зарегистрированы")
+        register_handlers(application)
 
-        # Inline кнопки
-        application.add_handler(CallbackQueryHandler(handlers.button_handler))
-        logger.info("✅ Обработчик кнопок зарегистрирован")
+        # Периодически пишем статистику кэша, чтобы подбирать его размер под квоту API
+        async def log_cache_stats(context):
+            from bot.kinopoisk_client import kinopoisk_client
+            logger.info(f"📊 Кэш КиноПоиска: {kinopoisk_client.cache_stats()}")
 
-        # Текстовые сообщения
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handlers.handle_message))
-        logger.info("✅ Обработчик текстовых сообщений зарегистрирован")
+            from bot.posters import poster_cache
+            logger.info(f"📊 file_id постеров: {poster_cache.stats()}")
 
-        # Обработчик ошибок
-        async def error_handler(update, context):
-            logger.error(f"Ошибка в боте: {context.error}", exc_info=True)
+        if application.job_queue:
+            from bot.catalogue import refresh_job, CATALOGUE_REFRESH_HOURS
 
-        application.add_error_handler(error_handler)
+            application.job_queue.run_repeating(log_cache_stats, interval=60 * 60, first=60 * 60)
+            # Снимок топ-250: загружается сразу после старта и обновляется по расписанию
+            application.job_queue.run_repeating(
+                refresh_job, interval=CATALOGUE_REFRESH_HOURS * 60 * 60, first=5
+            )
+            logger.info("✅ Фоновое обновление каталога запланировано")
+        else:
+            logger.warning("⚠️ JobQueue недоступна: каталог будет загружаться из API по запросу")
 
         # Настраиваем меню команд
         async def post_init(application):
             from telegram import BotCommand
+
+            # Инициализация базы данных (асинхронный движок живет в event loop бота);
+            # persistence могла уже открыть ее при загрузке user_data
+            try:
+                if database.AsyncSessionLocal is None:
+                    await database.init_async_db()
+                logger.info("✅ База данных инициализирована")
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка инициализации БД: {e}")
+
             await application.bot.set_my_commands([
                 BotCommand("start", "Запустить бота"),
                 BotCommand("help", "Помощь по командам"),
@@ -129,14 +239,55 @@ def main():
             ])
             logger.info("✅ Меню команд настроено")
 
+            # Учитываем запросы, уже потраченные сегодня (например, до перезапуска)
+            from bot.kinopoisk_client import kinopoisk_client
+            await kinopoisk_client.sync_quota()
+
+            # Постеры, уже загруженные в Telegram, отправляются по file_id
+            from bot.posters import poster_cache
+            await poster_cache.load()
+
+            # Подсказки inline-режима сразу знают все фильмы из таблицы movies
+            from bot.title_index import title_index
+            await title_index.load(kinopoisk_client.store)
+
+            # Страница /metrics для Prometheus и замер задержки event loop
+            from bot import metrics
+            metrics.start()
+
+            # Сторож: блокировки event loop дольше LOOP_BLOCK_THRESHOLD - в лог со стеком
+            from bot.tracing import watchdog
+            watchdog.start()
+
         application.post_init = post_init
 
+        # Закрываем пулы соединений КиноПоиска и БД при остановке
+        async def post_shutdown(application):
+            from bot.kinopoisk_client import kinopoisk_client
+            logger.info(f"📊 Кэш КиноПоиска: {kinopoisk_client.cache_stats()}")
+            await kinopoisk_client.close()
+            logger.info("✅ Соединения с КиноПоиском закрыты")
+
+            from bot import metrics
+            metrics.stop()
+
+            from bot.tracing import TRACE_FILE, tracer, watchdog
+            watchdog.stop()
+            if TRACE_FILE:
+                logger.info(f"📈 Трассировка: {tracer.dump(TRACE_FILE)} событий записано в {TRACE_FILE}")
+            await database.close_async_db()
+
+        application.post_shutdown = post_shutdown
+
         # Запускаем бота
-        logger.info("🔄 Запуск бота в режиме polling...")
-        application.run_polling(
-            drop_pending_updates=True,
-            allowed_updates=['message', 'callback_query']
-        )
+        if bot_mode == 'webhook':
+            run_webhook(application)
+        else:
+            logger.info("🔄 Запуск бота в режиме polling...")
+            application.run_polling(
+                drop_pending_updates=True,
+                allowed_updates=ALLOWED_UPDATES
+            )
 
     except KeyboardInterrupt:
         logger.info("⏹️ Бот остановлен пользователем")
@@ -149,13 +300,18 @@ if __name__ == '__main__':
     try:
         from dotenv import load_dotenv
         load_dotenv()
-        logger.info("✅ .env файл загружен")
+        env_message = "✅ .env файл загружен"
     except ImportError:
-        logger.info("ℹ️ dotenv не установлен (нормально для Railway)")
+        env_message = "ℹ️ dotenv не установлен (нормально для Railway)"
+
+    # Настройка логирования: JSON-строки (LOG_FORMAT), запись через очередь в фоновом потоке
+    from bot.logs import setup_logging
+    setup_logging()
+    logger.info(env_message)
 
     # Проверяем версию Python
-    if sys.version_info < (3, 8):
-        logger.error("❌ Требуется Python 3.8 или выше")
+    if sys.version_info < (3, 10):
+        logger.error("❌ Требуется Python 3.10 или выше")
         sys.exit(1)
 
     # Запускаем бота
@@ -1,5 +1,6 @@
 import os
 import sys
+import asyncio
 import logging
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -31,7 +32,7 @@ def test_kinopoisk():
 
     if kinopoisk_client.api_key:
         logger.info("Тестируем поиск 'Матрица' через КиноПоиск...")
-        result = kinopoisk_client.search_films('Матрица')
+        result = asyncio.run(kinopoisk_client.search_films('Матрица'))
         results = result.get('films', [])
         logger.info(f"Результатов: {len(results)}")
         if results:
@@ -2,6 +2,7 @@
 
 import os
 import sys
+import asyncio
 import logging
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -55,7 +56,7 @@ def test_kinopoisk_search():
     if kinopoisk_client.is_active:
         # Тестовый запрос
         print("Ищу 'Матрица'...")
-        result = kinopoisk_client.search_films("Матрица")
+        result = asyncio.run(kinopoisk_client.search_films("Матрица"))
         films = result.get('films', [])
         print(f"Найдено результатов: {len(films)}")
 
@@ -0,0 +1,38 @@
+# tests/conftest.py - общие фикстуры
+
+import asyncio
+
+import httpx
+import pytest
+
+from bot import database
+from bot.kinopoisk_client import KinopoiskClient
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """Отдельная SQLite-база на тест; асинхронный движок закрывается после теста"""
+    path = tmp_path / 'test.db'
+    monkeypatch.setenv('DATABASE_URL', f'sqlite:///{path}')
+    yield path
+    asyncio.run(database.close_async_db())
+
+@pytest.fixture
+def make_client(monkeypatch):
+    """Клиент КиноПоиска без БД и повторов: make_client(responses) -> (клиент, пути запросов).
+    Ответы API берутся по очереди из responses
+    """
+    monkeypatch.setenv('KINOPOISK_API_KEY', 'test')
+    monkeypatch.setenv('KINOPOISK_MAX_RETRIES', '0')
+
+    def make(responses):
+        client = KinopoiskClient()
+        calls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request.url.path)
+            return responses.pop(0)
+
+        client.session = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(handler))
+        return client, calls
+
+    return make
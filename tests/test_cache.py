@@ -0,0 +1,111 @@
+# tests/test_cache.py - TTLCache и SingleFlight
+
+import asyncio
+
+import pytest
+
+from bot import cache as cache_module
+from bot.cache import SingleFlight, TTLCache
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, 'monotonic', clock)
+    return clock
+
+def test_value_expires_after_ttl(clock):
+    cache = TTLCache()
+    cache.set('details', 1, 'film', ttl=10)
+    assert cache.get('details', 1) == 'film'
+
+    clock.now += 10
+    assert cache.get('details', 1) is None
+    # Устаревшее значение остается запасным ответом; отданным оно считается отдельно
+    assert cache.get_stale('details', 1) == 'film'
+    assert cache.stats()["stale"] == 0
+    cache.count_stale('details')
+
+    stats = cache.stats()["by_namespace"]["details"]
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["expired"] == 1
+    assert stats["stale"] == 1
+
+def test_least_recently_used_is_evicted(clock):
+    cache = TTLCache(max_size=2)
+    cache.set('details', 1, 'a', ttl=60)
+    cache.set('details', 2, 'b', ttl=60)
+    cache.get('details', 1)
+    cache.set('details', 3, 'c', ttl=60)
+
+    assert cache.get('details', 2) is None
+    assert cache.get('details', 1) == 'a'
+    assert cache.get('details', 3) == 'c'
+    assert cache.stats()["evictions"] == 1
+
+def test_namespaces_do_not_collide(clock):
+    cache = TTLCache()
+    cache.set('details', 1, 'film', ttl=60)
+    cache.set('similars', 1, ['other'], ttl=60)
+
+    assert cache.get('details', 1) == 'film'
+    assert cache.get('similars', 1) == ['other']
+    assert set(cache.stats()["by_namespace"]) == {'details', 'similars'}
+
+def test_single_flight_shares_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'result'
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do('key', fetch) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ['result'] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {"started": 1, "shared": 4, "in_flight": 0}
+
+def test_single_flight_shares_exception_and_forgets_key():
+    flight = SingleFlight()
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError('boom')
+
+    async def scenario():
+        results = await asyncio.gather(flight.do('key', fail), flight.do('key', fail), return_exceptions=True)
+        # После завершения ключ свободен - следующий вызов выполняется заново
+        again = await asyncio.gather(flight.do('key', fail), return_exceptions=True)
+        return results + again
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert len(calls) == 2
+
+def test_cancelled_waiter_does_not_cancel_call():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return 'result'
+
+    async def scenario():
+        first = asyncio.ensure_future(flight.do('key', fetch))
+        second = asyncio.ensure_future(flight.do('key', fetch))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        return await second, first.cancelled()
+
+    assert asyncio.run(scenario()) == ('result', True)
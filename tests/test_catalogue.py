@@ -0,0 +1,48 @@
+# tests/test_catalogue.py - RandomIndex
+
+import random
+
+from bot.catalogue import RandomIndex
+
+FILMS = [
+    {'filmId': 1, 'nameRu': 'Девятка', 'rating': '9.1'},
+    {'filmId': 2, 'nameRu': 'Восьмерка', 'rating': '8.0'},
+    {'filmId': 3, 'nameRu': 'Семерка', 'rating': '7.5'},
+    {'filmId': 4, 'nameRu': 'Без рейтинга', 'rating': 'null'},
+    {'filmId': 5, 'nameRu': 'Ожидается', 'rating': '0'},
+]
+
+def test_rebuild_keeps_only_rated_films():
+    index = RandomIndex(client=None)
+    index.rebuild(FILMS + [FILMS[0]])
+    assert len(index) == 3
+
+def test_pick_respects_min_rating():
+    random.seed(1)
+    index = RandomIndex(client=None)
+    index.rebuild(FILMS)
+
+    for _ in range(200):
+        assert index.pick(min_rating=8).id in (1, 2)
+    assert index.pick(min_rating=9.05).id == 1
+    assert index.pick(min_rating=9.5) is None
+
+def test_pick_prefers_higher_rating():
+    random.seed(2)
+    index = RandomIndex(client=None)
+    index.rebuild(FILMS)
+
+    picks = [index.pick().id for _ in range(3000)]
+    assert picks.count(1) > picks.count(2) > picks.count(3)
+
+def test_pick_avoids_recent_films_of_user():
+    random.seed(3)
+    index = RandomIndex(client=None)
+    index.rebuild(FILMS)
+
+    first = index.pick(min_rating=8, user_id=42).id
+    second = index.pick(min_rating=8, user_id=42).id
+    assert {first, second} == {1, 2}
+
+def test_empty_index_returns_none():
+    assert RandomIndex(client=None).pick() is None
@@ -0,0 +1,114 @@
+# tests/test_database.py - схема БД: миграции старых баз при запуске
+
+import asyncio
+import sqlite3
+
+from sqlalchemy import BigInteger
+
+from bot import database
+from bot.db_utils import DatabaseManager
+from bot.film_store import FilmStore
+
+# Таблицы в том виде, в каком их создавали версии до хранилища фильмов
+BASELINE_SCHEMA = """
+CREATE TABLE users (id INTEGER PRIMARY KEY, telegram_id INTEGER, username VARCHAR(100),
+    first_name VARCHAR(100), last_name VARCHAR(100), language_code VARCHAR(10), created_at DATETIME);
+CREATE UNIQUE INDEX ix_users_telegram_id ON users (telegram_id);
+CREATE TABLE movies (id INTEGER PRIMARY KEY, kp_id INTEGER, title VARCHAR(500), original_title VARCHAR(500),
+    release_date VARCHAR(20), overview TEXT, poster_url VARCHAR(500), media_type VARCHAR(20),
+    genres TEXT, vote_average FLOAT, created_at DATETIME);
+CREATE INDEX ix_movies_kp_id ON movies (kp_id);
+CREATE TABLE watchlist (id INTEGER PRIMARY KEY, user_id INTEGER, movie_id INTEGER,
+    added_at DATETIME, watched BOOLEAN);
+CREATE INDEX ix_watchlist_user_id ON watchlist (user_id);
+INSERT INTO movies (kp_id, title) VALUES (301, 'Старая'), (301, 'Новая'), (302, 'Другая');
+INSERT INTO watchlist (user_id, movie_id, added_at, watched) VALUES
+    (1, 301, '2024-01-01', 0), (1, 301, '2024-01-02', 0), (1, 302, '2024-01-03', 0), (2, 301, '2024-01-04', 0);
+"""
+
+def create_baseline(path):
+    connection = sqlite3.connect(path)
+    connection.executescript(BASELINE_SCHEMA)
+    connection.close()
+
+def schema(path):
+    connection = sqlite3.connect(path)
+    columns = {row[1] for row in connection.execute("PRAGMA table_info(movies)")}
+    indexes = {row[1]: row[2] for row in connection.execute("PRAGMA index_list(movies)")}
+    watchlist_indexes = {row[1]: row[2] for row in connection.execute("PRAGMA index_list(watchlist)")}
+    movies = connection.execute("SELECT kp_id, title FROM movies ORDER BY kp_id").fetchall()
+    watchlist = connection.execute("SELECT user_id, movie_id FROM watchlist ORDER BY id").fetchall()
+    version = connection.execute("SELECT version_num FROM alembic_version").fetchall()
+    connection.close()
+    return columns, indexes, watchlist_indexes, movies, watchlist, version
+
+def test_baseline_database_is_migrated(sqlite_db):
+    create_baseline(sqlite_db)
+    asyncio.run(database.init_async_db())
+
+    columns, indexes, watchlist_indexes, movies, watchlist, version = schema(sqlite_db)
+    assert {'payload', 'has_details', 'updated_at', 'poster_file_id'} <= columns
+    assert indexes['ix_movies_kp_id'] == 1
+    # Дубликаты удалены: у фильма остается последняя запись, в списке - первое добавление
+    assert movies == [(301, 'Новая'), (302, 'Другая')]
+    assert watchlist == [(1, 301), (1, 302), (2, 301)]
+    assert 'ix_watchlist_user_added' in watchlist_indexes
+    assert 'ix_watchlist_user_id' not in watchlist_indexes
+    assert len(version) == 1
+
+def test_migrated_database_works_with_store_and_watchlist(sqlite_db):
+    create_baseline(sqlite_db)
+
+    async def scenario():
+        store, watchlist = FilmStore(), DatabaseManager()
+        saved = await store.save_films([{'kinopoiskId': 400, 'nameRu': 'Фильм'}], has_details=True)
+        details = await store.get_details(400)
+        await store.save_poster_file_ids({301: 'file-1', 400: 'file-2'})
+        added = await watchlist.add_to_watchlist(3, {'id': 400, 'title': 'Фильм'})
+        duplicate = await watchlist.add_to_watchlist(1, {'id': 301, 'title': 'Новая'})
+        return saved, details, await store.get_poster_file_ids(), added, duplicate, await watchlist.get_watchlist(1)
+
+    saved, details, file_ids, added, duplicate, items = asyncio.run(scenario())
+    assert saved == 1
+    assert details['nameRu'] == 'Фильм'
+    assert file_ids == {301: 'file-1', 400: 'file-2'}
+    assert added is True
+    assert duplicate is False
+    assert [item['movie_id'] for item in items] == [302, 301]
+
+def test_fresh_database_is_created_and_upgrade_is_repeatable(sqlite_db):
+    asyncio.run(database.init_async_db())
+    asyncio.run(database.close_async_db())
+    asyncio.run(database.init_async_db())
+
+    columns, indexes, watchlist_indexes, movies, watchlist, version = schema(sqlite_db)
+    assert 'poster_file_id' in columns
+    assert indexes['ix_movies_kp_id'] == 1
+    assert movies == [] and watchlist == []
+    assert len(version) == 1
+
+def test_sqlite_uses_wal_and_busy_timeout(sqlite_db):
+    async def scenario():
+        await database.init_async_db()
+        async with database.async_engine.connect() as connection:
+            journal = (await connection.exec_driver_sql("PRAGMA journal_mode")).scalar()
+            timeout = (await connection.exec_driver_sql("PRAGMA busy_timeout")).scalar()
+        return journal, timeout, database.async_engine.pool.size()
+
+    assert asyncio.run(scenario()) == ('wal', database.SQLITE_BUSY_TIMEOUT, 1)
+
+def test_telegram_ids_above_int32(sqlite_db):
+    # ID Telegram до 52 бит: в PostgreSQL колонки должны быть bigint
+    assert isinstance(database.User.__table__.c.telegram_id.type, BigInteger)
+    assert isinstance(database.Watchlist.__table__.c.user_id.type, BigInteger)
+
+    user_id = 2 ** 40 + 7
+
+    async def scenario():
+        watchlist = DatabaseManager()
+        added = await watchlist.add_to_watchlist(user_id, {'id': 301, 'title': 'Фильм'})
+        return added, await watchlist.get_watchlist(user_id)
+
+    added, items = asyncio.run(scenario())
+    assert added is True
+    assert [item['user_id'] for item in items] == [user_id]
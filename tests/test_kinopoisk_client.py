@@ -0,0 +1,76 @@
+# tests/test_kinopoisk_client.py - KinopoiskClient: кэш, квота и приоритеты
+
+import asyncio
+
+import httpx
+
+from bot.rate_limit import DailyQuota, background_priority
+
+FILM = {"kinopoiskId": 1, "nameRu": "Фильм"}
+
+def expire(client):
+    """Все записи кэша клиента устарели"""
+    for full_key, (_, value) in list(client.cache._data.items()):
+        client.cache._data[full_key] = (0, value)
+
+def test_stale_counted_only_when_served(make_client):
+    client, calls = make_client([
+        httpx.Response(200, json=FILM),
+        httpx.Response(200, json=FILM),
+        httpx.Response(500),
+    ])
+
+    async def scenario():
+        await client.get_film_details(1)
+        expire(client)
+        # Устаревшая запись есть, но API ответил - это не запасной ответ
+        await client.get_film_details(1)
+        refreshed = client.cache.stats()["stale"]
+        expire(client)
+        served = await client.get_film_details(1)
+        await client.close()
+        return refreshed, served
+
+    refreshed, served = asyncio.run(scenario())
+    assert refreshed == 0
+    assert served == FILM
+    assert client.cache.stats()["stale"] == 1
+    assert len(calls) == 3
+
+def test_interactive_caller_retries_background_quota_refusal(make_client):
+    client, calls = make_client([httpx.Response(200, json=FILM)])
+    # Квота осталась только на пользовательские запросы
+    client.quota = DailyQuota(10, background_reserve=0.3)
+    client.quota.used = 7
+
+    async def background_call():
+        with background_priority():
+            return await client.get_film_details(1)
+
+    async def scenario():
+        background = asyncio.ensure_future(background_call())
+        # Фоновый вызов начат - пользовательский присоединяется к нему
+        await asyncio.sleep(0)
+        interactive = await client.get_film_details(1)
+        result = interactive, await background
+        await client.close()
+        return result
+
+    interactive, background = asyncio.run(scenario())
+    assert interactive == FILM
+    assert background == {}
+    assert len(calls) == 1
+    assert client.quota.used == 8
+    assert client.quota.rejected == 1
+
+def test_background_caller_gets_background_refusal(make_client):
+    client, calls = make_client([])
+    client.quota = DailyQuota(10, background_reserve=0.3)
+    client.quota.used = 7
+
+    async def scenario():
+        with background_priority():
+            return await client.get_film_details(1)
+
+    assert asyncio.run(scenario()) == {}
+    assert calls == []
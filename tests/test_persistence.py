@@ -0,0 +1,121 @@
+# tests/test_persistence.py - SQLPersistence: отложенная пакетная запись
+
+import asyncio
+
+from bot.persistence import SQLPersistence
+
+def test_changes_are_flushed_in_one_batch(sqlite_db):
+    async def scenario():
+        persistence = SQLPersistence(flush_delay=0.05)
+        await persistence.update_user_data(1, {'waiting_for': 'search'})
+        await persistence.update_user_data(2, {'waiting_for': 'search'})
+        await persistence.update_chat_data(10, {'page': 1})
+        await persistence.update_user_data(1, {'waiting_for': None})
+        assert persistence.written == 0
+
+        await asyncio.sleep(0.1)
+        return persistence, await SQLPersistence().get_user_data()
+
+    persistence, stored = asyncio.run(scenario())
+    assert persistence.flushes == 1
+    assert persistence.written == 3
+    assert stored == {1: {'waiting_for': None}, 2: {'waiting_for': 'search'}}
+
+def test_unchanged_data_is_not_written(sqlite_db):
+    async def scenario():
+        persistence = SQLPersistence(flush_delay=10)
+        await persistence.update_user_data(1, {'a': 1})
+        await persistence.flush()
+
+        # То же состояние и изменение, вернувшееся к сохраненному, - писать нечего
+        await persistence.update_user_data(1, {'a': 1})
+        await persistence.update_user_data(1, {'a': 2})
+        await persistence.update_user_data(1, {'a': 1})
+        await persistence.flush()
+        return persistence
+
+    persistence = asyncio.run(scenario())
+    assert persistence.flushes == 1
+    assert persistence.written == 1
+
+def test_flush_writes_pending_changes(sqlite_db):
+    async def scenario():
+        persistence = SQLPersistence(flush_delay=10)
+        await persistence.update_bot_data({'catalogue': 'ready'})
+        await persistence.update_chat_data(10, {'page': 2})
+        await persistence.flush()
+
+        reloaded = SQLPersistence()
+        return await reloaded.get_bot_data(), await reloaded.get_chat_data()
+
+    bot_data, chat_data = asyncio.run(scenario())
+    assert bot_data == {'catalogue': 'ready'}
+    assert chat_data == {10: {'page': 2}}
+
+def test_drop_removes_stored_data(sqlite_db):
+    async def scenario():
+        persistence = SQLPersistence(flush_delay=10)
+        await persistence.update_user_data(1, {'a': 1})
+        await persistence.update_user_data(2, {'b': 2})
+        await persistence.flush()
+        await persistence.drop_user_data(1)
+        return await SQLPersistence().get_user_data()
+
+    assert asyncio.run(scenario()) == {2: {'b': 2}}
+
+def test_shared_mode_refreshes_from_database(sqlite_db):
+    async def scenario():
+        writer = SQLPersistence(flush_delay=10)
+        reader = SQLPersistence(shared=True, flush_delay=10)
+        await writer.update_user_data(1, {'waiting_for': 'search'})
+        await writer.flush()
+
+        user_data = {'waiting_for': None}
+        await reader.refresh_user_data(1, user_data)
+        return user_data
+
+    assert asyncio.run(scenario()) == {'waiting_for': 'search'}
+
+def test_change_during_flush_is_written(sqlite_db):
+    async def scenario():
+        persistence = SQLPersistence(flush_delay=0.05)
+        write = persistence._write
+
+        async def slow_write(batch):
+            await asyncio.sleep(0.05)
+            await write(batch)
+
+        persistence._write = slow_write
+        await persistence.update_user_data(1, {'a': 1})
+        await asyncio.sleep(0.07)
+        # Первая запись еще идет
+        await persistence.update_user_data(2, {'b': 2})
+
+        await asyncio.sleep(0.2)
+        return persistence, await SQLPersistence().get_user_data()
+
+    persistence, stored = asyncio.run(scenario())
+    assert persistence.flushes == 2
+    assert stored == {1: {'a': 1}, 2: {'b': 2}}
+
+def test_failed_flush_is_retried(sqlite_db):
+    async def scenario():
+        persistence = SQLPersistence(flush_delay=0.05)
+        write = persistence._write
+        failures = []
+
+        async def flaky_write(batch):
+            if not failures:
+                failures.append(batch)
+                raise RuntimeError("database is locked")
+            await write(batch)
+
+        persistence._write = flaky_write
+        await persistence.update_user_data(1, {'a': 1})
+
+        await asyncio.sleep(0.2)
+        return persistence, await SQLPersistence().get_user_data()
+
+    persistence, stored = asyncio.run(scenario())
+    assert persistence.flushes == 1
+    assert stored == {1: {'a': 1}}
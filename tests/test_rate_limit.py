@@ -0,0 +1,90 @@
+# tests/test_rate_limit.py - TokenBucket и DailyQuota
+
+import asyncio
+import time
+
+from bot.rate_limit import BACKGROUND, INTERACTIVE, DailyQuota, TokenBucket, background_priority, current_priority
+
+def test_background_requests_stop_at_reserve():
+    quota = DailyQuota(10, background_reserve=0.3)
+
+    consumed = 0
+    while quota.try_consume(BACKGROUND):
+        consumed += 1
+    assert consumed == 7
+    assert quota.remaining == 3
+
+    # Пользовательские запросы расходуют резерв до нуля
+    assert all(quota.try_consume(INTERACTIVE) for _ in range(3))
+    assert not quota.try_consume(INTERACTIVE)
+    assert quota.is_exhausted
+    assert quota.rejected == 2
+
+def test_quota_low_and_sync():
+    quota = DailyQuota(100, low_ratio=0.1)
+    assert not quota.is_low
+
+    quota.sync(used=95, limit=200)
+    assert quota.limit == 200
+    assert quota.remaining == 105
+    assert quota.low_threshold == 20
+
+    # Расход с сервера не уменьшает уже учтенный локально
+    quota.sync(used=10)
+    assert quota.used == 95
+
+def test_background_priority_is_inherited_by_tasks():
+    async def priority():
+        return current_priority()
+
+    async def scenario():
+        with background_priority():
+            task = asyncio.ensure_future(priority())
+        return await task, current_priority()
+
+    assert asyncio.run(scenario()) == (BACKGROUND, INTERACTIVE)
+
+def test_bucket_allows_burst_then_limits_rate():
+    bucket = TokenBucket(rate=50, capacity=5)
+
+    async def scenario():
+        started = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        burst = time.monotonic() - started
+        for _ in range(5):
+            await bucket.acquire()
+        return burst, time.monotonic() - started
+
+    burst, total = asyncio.run(scenario())
+    assert burst < 0.05
+    # Еще 5 токенов при 50 в секунду - около 0.1 с
+    assert total >= 0.08
+
+def test_background_leaves_reserve_for_interactive():
+    bucket = TokenBucket(rate=20, capacity=4, background_reserve=2)
+    order = []
+
+    async def request(name, priority):
+        await bucket.acquire(priority)
+        order.append(name)
+
+    async def scenario():
+        # Фоновые забирают токены только сверх резерва, пользовательский проходит сразу
+        await asyncio.gather(
+            request('bg1', BACKGROUND), request('bg2', BACKGROUND), request('bg3', BACKGROUND),
+            request('user', INTERACTIVE),
+        )
+
+    asyncio.run(scenario())
+    assert order == ['bg1', 'bg2', 'user', 'bg3']
+
+def test_api_limits_split_between_workers(monkeypatch):
+    from bot import kinopoisk_client
+
+    monkeypatch.setattr(kinopoisk_client, 'BOT_WORKERS', 4)
+    monkeypatch.setenv('KINOPOISK_RPS', '8')
+    monkeypatch.setenv('KINOPOISK_DAILY_QUOTA', '500')
+    client = kinopoisk_client.KinopoiskClient()
+    assert client.rate_limiter.rate == 2
+    assert client.quota.limit == 125
@@ -0,0 +1,156 @@
+# tests/test_resilience.py - размыкатель и пробный запрос KinopoiskClient
+
+import asyncio
+import time
+
+import httpx
+
+from bot.resilience import CircuitBreaker
+
+def open_breaker(breaker: CircuitBreaker):
+    """Размыкатель, у которого пауза уже прошла: следующий allow() - пробный"""
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    breaker.opened_at = time.monotonic() - breaker.reset_timeout
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.rejected == 1
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    open_breaker(breaker)
+
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    open_breaker(breaker)
+
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+def test_released_probe_allows_next_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    open_breaker(breaker)
+
+    assert breaker.allow()
+    breaker.release_probe()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+def test_release_probe_does_not_reopen_closed_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.release_probe()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_rate_limited_probe_does_not_stick_breaker(make_client):
+    client, calls = make_client([
+        httpx.Response(429),
+        httpx.Response(200, json={"kinopoiskId": 1, "nameRu": "Фильм"}),
+    ])
+    open_breaker(client.breaker)
+
+    async def scenario():
+        first = await client.get_film_details(1)
+        second = await client.get_film_details(1)
+        await client.close()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == {}
+    assert second["nameRu"] == "Фильм"
+    assert len(calls) == 2
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+def test_quota_refused_probe_does_not_stick_breaker(make_client, monkeypatch):
+    client, calls = make_client([
+        httpx.Response(200, json={"kinopoiskId": 1, "nameRu": "Фильм"}),
+    ])
+    open_breaker(client.breaker)
+    consume = client.quota.try_consume
+    refused = []
+
+    def try_consume(*args):
+        # Первый запрос квота отклоняет, дальше - как обычно
+        if not refused:
+            refused.append(True)
+            return False
+        return consume(*args)
+
+    monkeypatch.setattr(client.quota, 'try_consume', try_consume)
+
+    async def scenario():
+        first = await client.get_film_details(1)
+        second = await client.get_film_details(1)
+        await client.close()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == {}
+    assert second["nameRu"] == "Фильм"
+    assert calls == ["/api/v2.2/films/1"]
+
+def test_cancelled_probe_does_not_stick_breaker(make_client, monkeypatch):
+    client, calls = make_client([])
+    open_breaker(client.breaker)
+
+    async def hang(*args, **kwargs):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(client, '_request', hang)
+
+    async def scenario():
+        task = asyncio.ensure_future(client.get_film_details(1))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert client.breaker.allow()
+
+def test_hedge_takes_rate_limiter_token(make_client, monkeypatch):
+    client, calls = make_client([])
+    client.hedging = True
+    monkeypatch.setattr(client, '_hedge_delay', lambda: 0.01)
+    acquired = []
+    acquire = client.rate_limiter.acquire
+
+    async def counting_acquire(priority=0):
+        acquired.append(priority)
+        await acquire(priority)
+
+    async def slow_send(path, params, timeout):
+        calls.append(path)
+        await asyncio.sleep(0.05 if len(calls) == 1 else 0)
+        return httpx.Response(200, json={"kinopoiskId": 1})
+
+    monkeypatch.setattr(client.rate_limiter, 'acquire', counting_acquire)
+    monkeypatch.setattr(client, '_send', slow_send)
+
+    async def scenario():
+        result = await client.get_film_details(1)
+        await client.close()
+        return result
+
+    assert asyncio.run(scenario()) == {"kinopoiskId": 1}
+    # Основной запрос и hedged-запрос: два токена и две единицы квоты
+    assert len(calls) == 2
+    assert len(acquired) == 2
+    assert client.quota.used == 2
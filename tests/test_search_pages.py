@@ -0,0 +1,138 @@
+# tests/test_search_pages.py - SearchPager
+
+import asyncio
+
+from bot.rate_limit import BACKGROUND, current_priority
+from bot.search_pages import SearchPager
+
+def api_page(page: int, pages: int = 3, size: int = 20) -> dict:
+    return {
+        "pagesCount": pages,
+        "searchFilmsCountResult": pages * size,
+        "films": [{"filmId": page * 100 + i, "nameRu": f"Фильм {page}-{i}"} for i in range(size)],
+    }
+
+class FakeClient:
+    """search_films: страницы API по номеру; фоновые запросы можно отклонять как квота"""
+
+    def __init__(self, pages: int = 3, refuse_background: bool = False, empty_from: int = 0):
+        self.pages = pages
+        self.refuse_background = refuse_background
+        self.empty_from = empty_from
+        self.calls = []
+
+    async def search_films(self, query: str, page: int = 1) -> dict:
+        background = current_priority() == BACKGROUND
+        self.calls.append((page, background))
+        if background and self.refuse_background:
+            return {"films": [], "searchFilmsCountResult": 0, "degraded": True}
+        if self.empty_from and page >= self.empty_from:
+            return {"pagesCount": self.pages, "searchFilmsCountResult": 0, "films": []}
+        return api_page(page, self.pages)
+
+async def settle():
+    # Дать завершиться подгрузке впрок
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+def ids(films) -> list:
+    return [film.id for film in films]
+
+def test_pages_are_sliced_from_loaded_films():
+    client = FakeClient()
+    pager = SearchPager(client, page_size=5)
+
+    async def scenario():
+        token = pager.start('матрица', api_page(1))
+        results, films, index = await pager.page(token, 1)
+        return results, films, index
+
+    results, films, index = asyncio.run(scenario())
+    assert index == 1
+    assert ids(films) == [105, 106, 107, 108, 109]
+    assert pager.pages_count(results) == 12
+    assert client.calls == []
+
+def test_prefetch_runs_in_background_near_the_end():
+    client = FakeClient()
+    pager = SearchPager(client, page_size=5)
+
+    async def scenario():
+        token = pager.start('матрица', api_page(1))
+        await pager.page(token, 3)
+        await settle()
+        return pager.get(token)
+
+    results = asyncio.run(scenario())
+    assert client.calls == [(2, True)]
+    assert results.loaded_pages == 2
+    assert len(results.films) == 40
+
+def test_awaited_page_is_loaded_interactively():
+    client = FakeClient()
+    pager = SearchPager(client, page_size=5)
+
+    async def scenario():
+        token = pager.start('матрица', api_page(1))
+        return await pager.page(token, 4)
+
+    _, films, index = asyncio.run(scenario())
+    assert index == 4
+    assert ids(films) == [200, 201, 202, 203, 204]
+    assert client.calls[0] == (2, False)
+
+def test_refused_prefetch_does_not_truncate_results():
+    client = FakeClient(refuse_background=True)
+    pager = SearchPager(client, page_size=5)
+
+    async def scenario():
+        token = pager.start('матрица', api_page(1))
+        await pager.page(token, 3)
+        await settle()
+        results = pager.get(token)
+        pages_after_refusal = results.api_pages
+        page = await pager.page(token, 4)
+        return pages_after_refusal, page
+
+    pages_after_refusal, (results, films, index) = asyncio.run(scenario())
+    assert pages_after_refusal == 3
+    assert index == 4
+    assert ids(films) == [200, 201, 202, 203, 204]
+    assert (2, False) in client.calls
+
+def test_refused_awaited_page_shows_what_is_loaded():
+    client = FakeClient()
+    pager = SearchPager(client, page_size=5)
+
+    async def refuse(query, page=1):
+        client.calls.append((page, current_priority() == BACKGROUND))
+        return {"films": [], "searchFilmsCountResult": 0, "degraded": True}
+
+    async def scenario():
+        token = pager.start('матрица', api_page(1))
+        client.search_films = refuse
+        return await pager.page(token, 6)
+
+    results, films, index = asyncio.run(scenario())
+    assert index == 6
+    assert films == []
+    assert results.api_pages == 3
+    assert results.has_more
+
+def test_empty_api_page_ends_results():
+    client = FakeClient(empty_from=2)
+    pager = SearchPager(client, page_size=5)
+
+    async def scenario():
+        token = pager.start('матрица', api_page(1))
+        return await pager.page(token, 6)
+
+    results, films, index = asyncio.run(scenario())
+    assert results.api_pages == 1
+    assert not results.has_more
+    assert index == 3
+    assert ids(films) == [115, 116, 117, 118, 119]
+
+def test_unknown_token():
+    pager = SearchPager(FakeClient())
+    assert asyncio.run(pager.page('missing', 0)) is None
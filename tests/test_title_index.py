@@ -0,0 +1,61 @@
+# tests/test_title_index.py - TitleIndex
+
+from bot.title_index import TitleIndex, edit_distance, normalize_title
+
+def make_index() -> TitleIndex:
+    index = TitleIndex()
+    index.add_films([
+        {'filmId': 1, 'nameRu': 'Зеленая миля', 'nameEn': 'The Green Mile', 'rating': '9.1'},
+        {'filmId': 2, 'nameRu': 'Город грехов', 'nameOriginal': 'Sin City', 'rating': '8.0'},
+        {'filmId': 3, 'nameRu': 'Титаны', 'rating': '6.5'},
+        {'filmId': 4, 'nameRu': 'Матрица', 'rating': '8.5'},
+        {'filmId': 5, 'nameRu': 'Матрица: Перезагрузка', 'rating': '7.7'},
+    ])
+    return index
+
+def titles(films) -> list:
+    return [film.title for film in films]
+
+def test_normalize_and_distance():
+    assert normalize_title('  Зелёная   МИЛЯ! ') == 'зеленая миля'
+    assert edit_distance('титаник', 'титаны', 3) == 2
+    assert edit_distance('abc', 'abcdef', 1) == 2
+
+def test_match_answers_exact_title_and_its_continuations():
+    index = make_index()
+    assert titles(index.match('матрица')) == ['Матрица', 'Матрица: Перезагрузка']
+    assert titles(index.match('the green mile')) == ['Зеленая миля']
+
+def test_match_does_not_guess_unknown_titles():
+    index = make_index()
+    # Незнакомые индексу фильмы ищет API, а не похожее название из индекса
+    assert index.match('Титаник') == []
+    assert index.match('Город') == []
+    assert index.match('Зеленя миля') == []
+
+def test_fuzzy_suggests_titles_with_typos():
+    index = make_index()
+    assert titles(index.fuzzy('Зеленя миля')) == ['Зеленая миля']
+    # Ближе всего - название целиком, затем названия, где оно часть
+    assert titles(index.fuzzy('матрца')) == ['Матрица', 'Матрица: Перезагрузка']
+    # Короткие запросы опечаток не допускают
+    assert index.fuzzy('мтр') == []
+
+def test_prefix_finds_word_starts_ranked_by_rating():
+    index = make_index()
+    assert titles(index.prefix('мат')) == ['Матрица', 'Матрица: Перезагрузка']
+    assert titles(index.prefix('перез')) == ['Матрица: Перезагрузка']
+    assert titles(index.prefix('city')) == ['Город грехов']
+
+def test_repeated_film_updates_data():
+    index = make_index()
+    index.add_films([{'filmId': 3, 'nameRu': 'Титаны', 'rating': '7.0', 'year': 2018}])
+    assert len(index) == 5
+    film = index.exact('титаны')[0]
+    assert film.rating == 7.0
+    assert film.year == '2018'
+
+def test_max_films_limit():
+    index = TitleIndex(max_films=2)
+    index.add_films([{'filmId': i, 'nameRu': f'Фильм {i}'} for i in range(1, 5)])
+    assert len(index) == 2